@@ -0,0 +1,72 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.hashers import check_password
+from ninja import Router, Form
+
+from .jwt import AsyncAuthBearer
+from .refresh import aissue_tokens, arevoke_refresh_token, arotate_refresh_token
+from .schemas import TokenSchema, RefreshTokenSchema, Message
+from friends.metrics import AUTH_FAILURES
+from friends.shortcuts import aget_object_or_404
+from users.models import User
+from users.schemas import UserSchema, UserRegistrationSchema
+from users.search import add_to_index
+
+auth = Router(tags=["auth"])
+
+
+@auth.post('/register', response={200: UserSchema, 409: Message})
+async def register_new_user(request, data: UserRegistrationSchema = Form(...)):
+    """
+    Регистрация нового юзера по логину и паролю.
+    Логин должен быть до 24 символов и может содержать только латинские буквы и цифры.
+    """
+    username = data.username
+    if await User.objects.filter(username=username).aexists():
+        return 409, {"detail": "This username is already taken"}
+    new_user = await sync_to_async(User.objects.create_user)(**data.dict())
+    add_to_index(new_user)
+    return new_user
+
+
+@auth.post('/login', response={200: TokenSchema, 400: Message, 404: Message})
+async def login(request, data: UserRegistrationSchema = Form(...)):
+    """
+    Получить access и refresh токены
+    """
+    user = await aget_object_or_404(User, username=data.username)
+    # хэширование пароля нагружает процессор, выносим его из event loop
+    if await sync_to_async(check_password, thread_sensitive=False)(data.password, user.password):
+        return await aissue_tokens(user.id, user.username)
+    AUTH_FAILURES.labels('wrong_password').inc()
+    return 400, {"detail": "Password is not correct"}
+
+
+@auth.post('/refresh', response={200: TokenSchema, 401: Message})
+async def refresh(request, data: RefreshTokenSchema = Form(...)):
+    """
+    Обменять refresh токен на новые access и refresh токены.
+    Каждый refresh токен можно использовать один раз, повторное использование отзывает все токены этого входа.
+    """
+    tokens = await arotate_refresh_token(data.refresh_token)
+    if tokens is None:
+        AUTH_FAILURES.labels('invalid_refresh_token').inc()
+        return 401, {"detail": "Refresh token is not valid"}
+    return tokens
+
+
+@auth.post('/logout', response={200: Message, 401: Message})
+async def logout(request, data: RefreshTokenSchema = Form(...)):
+    """
+    Отозвать refresh токены этого входа
+    """
+    if not await arevoke_refresh_token(data.refresh_token):
+        return 401, {"detail": "Refresh token is not valid"}
+    return {"detail": "Logged out"}
+
+
+@auth.get('/whoami', auth=AsyncAuthBearer(), response={200: UserSchema, 401: Message})
+async def get_my_nickname(request):
+    """
+    Получить пользователя по токену
+    """
+    return request.auth
@@ -1,14 +1,14 @@
 import jwt
 from uuid import UUID
 from datetime import datetime, timedelta
-from typing import Tuple
+from typing import Optional, Tuple
 
-from django.shortcuts import get_object_or_404
 from ninja.security import HttpBearer
 
-from users.models import User
 from .schemas import TokenPayload
+from .principal import TokenUser, load_user
 from friends import settings
+from friends.metrics import AUTH_FAILURES
 
 
 ALGORITHM = settings.JWT_ALGORITHM
@@ -26,10 +26,10 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> Tuple[by
     return encoded_jwt, expire
 
 
-def create_token(user_id: UUID) -> dict:
+def create_token(user_id: UUID, username: str) -> dict:
     access_token_expires = timedelta(minutes=settings.JWT_LIVE_TIME_MINUTES)
     access_token, expires = create_access_token(
-        data={"user_id": str(user_id)}, expires_delta=access_token_expires
+        data={"user_id": str(user_id), "username": username}, expires_delta=access_token_expires
     )
     return {
         "access_token": access_token,
@@ -38,17 +38,60 @@ def create_token(user_id: UUID) -> dict:
     }
 
 
-def get_current_user(token: str):
+def decode_token(token: str) -> Optional[TokenPayload]:
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("sub") != access_token_jwt_subject:
+            # refresh токен не должен подходить как access
+            return None
         token_data = TokenPayload(**payload)
     except jwt.PyJWTError:
         return None
-    user = get_object_or_404(User, id=token_data.user_id)
-    return user
+    if token_data.user_id is None:
+        return None
+    return token_data
+
+
+def request_user_id(request) -> Optional[UUID]:
+    """
+    Id пользователя из заголовка Authorization: Bearer без похода в бд, None если токена нет или он не подходит.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    payload = decode_token(token)
+    return payload.user_id if payload is not None else None
+
+
+def get_current_user(token: str) -> Optional[TokenUser]:
+    """
+    Пользователь из токена. Токены без username (выданные раньше) дополняются из кэша/бд.
+    """
+    token_data = decode_token(token)
+    if token_data is None:
+        return None
+    if token_data.username is None:
+        return TokenUser(token_data.user_id, load_user(token_data.user_id).username)
+    return TokenUser(token_data.user_id, token_data.username)
 
 
 class AuthBearer(HttpBearer):
-    def authenticate(self, request, token: str) -> User:
+    def authenticate(self, request, token: str) -> Optional[TokenUser]:
         user = get_current_user(token)
+        if user is None:
+            AUTH_FAILURES.labels('invalid_token').inc()
         return user
+
+
+class AsyncAuthBearer(HttpBearer):
+    """
+    Авторизация для асинхронных ручек. django-ninja вызывает её синхронно прямо в event loop,
+    поэтому в бд она не ходит: токены без username здесь не принимаются.
+    """
+
+    def authenticate(self, request, token: str) -> Optional[TokenUser]:
+        token_data = decode_token(token)
+        if token_data is None or token_data.username is None:
+            AUTH_FAILURES.labels('invalid_token').inc()
+            return None
+        return TokenUser(token_data.user_id, token_data.username)
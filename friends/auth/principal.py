@@ -0,0 +1,118 @@
+import time
+import threading
+from uuid import UUID
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from django.db import DEFAULT_DB_ALIAS
+from django.shortcuts import get_object_or_404
+from django.utils.functional import cached_property
+
+from users.models import User
+from friends import settings
+
+
+class UserDeleted(Exception):
+    """
+    Пользователь токена удалён из бд, хотя токен ещё действует.
+    """
+
+
+class TTLCache:
+    """
+    Потокобезопасный LRU кэш ограниченного размера с временем жизни записей.
+    Живёт внутри одного процесса.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+user_cache = TTLCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL_SECONDS,
+)
+
+
+def load_user(user_id: UUID) -> User:
+    """
+    Получить пользователя из кэша недавно проверенных или из бд.
+    """
+    user = user_cache.get(user_id)
+    if user is None:
+        user = get_object_or_404(User, id=user_id)
+        user_cache.set(user_id, user)
+    return user
+
+
+class TokenUser:
+    """
+    Авторизованный пользователь, собранный из claims токена.
+    В бд ходит только при обращении к user.
+    """
+
+    is_authenticated = True
+
+    def __init__(self, user_id: UUID, username: str):
+        self.id = user_id
+        self.username = username
+
+    @property
+    def pk(self) -> UUID:
+        return self.id
+
+    @cached_property
+    def reference(self) -> User:
+        """
+        Экземпляр User только с id и username, для фильтров и внешних ключей в запросах.
+        Строку в бд он не проверяет: сервисы изменения дружбы сами бросают UserDeleted, если её уже нет.
+        """
+        user = User(id=self.id, username=self.username)
+        user._state.adding = False
+        user._state.db = DEFAULT_DB_ALIAS
+        return user
+
+    @cached_property
+    def user(self) -> User:
+        """
+        Полная строка пользователя из бд.
+        """
+        return load_user(self.id)
+
+    def __str__(self):
+        return self.username
@@ -0,0 +1,136 @@
+"""
+Refresh токены. Сам токен - подписанный JWT, в бд на каждый вход хранится одна строка
+с номером последнего выданного токена цепочки. Обмен токена - проверка подписи
+и один UPDATE по первичному ключу, без пароля и без чтения пользователя.
+"""
+import jwt
+from uuid import UUID
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from django.db.models import F, QuerySet
+from django.utils import timezone
+from pydantic import ValidationError
+
+from .jwt import ALGORITHM, create_token
+from .schemas import RefreshTokenPayload
+from users.models import RefreshTokenFamily
+from friends import settings
+
+
+refresh_token_jwt_subject = "refresh"
+
+
+def _refresh_expires() -> datetime:
+    return timezone.now() + timedelta(days=settings.JWT_REFRESH_LIVE_TIME_DAYS)
+
+
+def encode_refresh_token(user_id: UUID, username: str, family: UUID, generation: int, expires: datetime) -> str:
+    return jwt.encode(
+        {
+            "user_id": str(user_id),
+            "username": username,
+            "family": str(family),
+            "generation": generation,
+            "exp": expires,
+            "sub": refresh_token_jwt_subject,
+        },
+        settings.SECRET_KEY, algorithm=ALGORITHM,
+    )
+
+
+def decode_refresh_token(token: str) -> Optional[RefreshTokenPayload]:
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM])
+        if payload.get("sub") != refresh_token_jwt_subject:
+            return None
+        return RefreshTokenPayload(**payload)
+    except (jwt.PyJWTError, ValidationError):
+        return None
+
+
+def _with_refresh_token(user_id: UUID, username: str, family: UUID, generation: int, expires: datetime) -> dict:
+    return {
+        **create_token(user_id, username),
+        "refresh_token": encode_refresh_token(user_id, username, family, generation, expires),
+    }
+
+
+def _expired_families(user_id: UUID) -> QuerySet:
+    return RefreshTokenFamily.objects.filter(user_id=user_id, expires__lte=timezone.now())
+
+
+def issue_tokens(user_id: UUID, username: str) -> dict:
+    """
+    Access и refresh токены для нового входа. Заодно удаляются истёкшие цепочки пользователя.
+    """
+    _expired_families(user_id).delete()
+    family = RefreshTokenFamily(user_id=user_id, expires=_refresh_expires())
+    family.save(force_insert=True)
+    return _with_refresh_token(user_id, username, family.id, family.generation, family.expires)
+
+
+async def aissue_tokens(user_id: UUID, username: str) -> dict:
+    await _expired_families(user_id).adelete()
+    family = RefreshTokenFamily(user_id=user_id, expires=_refresh_expires())
+    await family.asave(force_insert=True)
+    return _with_refresh_token(user_id, username, family.id, family.generation, family.expires)
+
+
+def _rotation(token: str) -> Tuple[Optional[RefreshTokenPayload], Optional[QuerySet], Optional[datetime]]:
+    payload = decode_refresh_token(token)
+    if payload is None:
+        return None, None, None
+    expires = _refresh_expires()
+    current = RefreshTokenFamily.objects.filter(
+        id=payload.family, generation=payload.generation, expires__gt=timezone.now()
+    )
+    return payload, current, expires
+
+
+def _rotated(payload: RefreshTokenPayload, expires: datetime) -> dict:
+    return _with_refresh_token(payload.user_id, payload.username, payload.family, payload.generation + 1, expires)
+
+
+def rotate_refresh_token(token: str) -> Optional[dict]:
+    """
+    Обменять refresh токен на новую пару токенов. Старый токен после этого недействителен.
+    Повторное предъявление уже обменянного токена отзывает всю цепочку.
+    """
+    payload, current, expires = _rotation(token)
+    if payload is None:
+        return None
+    if current.update(generation=F('generation') + 1, expires=expires):
+        return _rotated(payload, expires)
+    # токен уже обменивали или цепочку отозвали: на всякий случай отзываем её целиком
+    RefreshTokenFamily.objects.filter(id=payload.family).delete()
+    return None
+
+
+async def arotate_refresh_token(token: str) -> Optional[dict]:
+    payload, current, expires = _rotation(token)
+    if payload is None:
+        return None
+    if await current.aupdate(generation=F('generation') + 1, expires=expires):
+        return _rotated(payload, expires)
+    await RefreshTokenFamily.objects.filter(id=payload.family).adelete()
+    return None
+
+
+def revoke_refresh_token(token: str) -> bool:
+    """
+    Отозвать цепочку, к которой относится refresh токен (выход с устройства).
+    """
+    payload = decode_refresh_token(token)
+    if payload is None:
+        return False
+    deleted, _ = RefreshTokenFamily.objects.filter(id=payload.family).delete()
+    return bool(deleted)
+
+
+async def arevoke_refresh_token(token: str) -> bool:
+    payload = decode_refresh_token(token)
+    if payload is None:
+        return False
+    deleted, _ = await RefreshTokenFamily.objects.filter(id=payload.family).adelete()
+    return bool(deleted)
@@ -1,14 +1,28 @@
 from uuid import UUID
 from datetime import datetime
+from typing import Optional
 
 from ninja import Schema
 
 
 class TokenPayload(Schema):
     user_id: UUID = None
+    username: str = None
     exp: datetime
 
 
+class RefreshTokenPayload(Schema):
+    user_id: UUID
+    username: str
+    family: UUID
+    generation: int
+    exp: datetime
+
+
+class RefreshTokenSchema(Schema):
+    refresh_token: str
+
+
 class Message(Schema):
     detail: str = "Example message"
 
@@ -17,3 +31,4 @@ class TokenSchema(Schema):
     access_token: str = "some.bearer.token"
     expires: datetime
     token_type: str = "type"
+    refresh_token: Optional[str] = None
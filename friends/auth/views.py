@@ -2,11 +2,13 @@ from django.shortcuts import get_object_or_404
 from django.contrib.auth.hashers import check_password
 from ninja import Router, Form
 
-from .jwt import create_token, AuthBearer
-
-from .schemas import TokenSchema, Message
+from .jwt import AuthBearer
+from .refresh import issue_tokens, revoke_refresh_token, rotate_refresh_token
+from .schemas import TokenSchema, RefreshTokenSchema, Message
+from friends.metrics import AUTH_FAILURES
 from users.models import User
 from users.schemas import UserSchema, UserRegistrationSchema
+from users.search import add_to_index
 
 auth = Router(tags=["auth"])
 
@@ -20,20 +22,46 @@ def register_new_user(request, data: UserRegistrationSchema = Form(...)):
     username = data.username
     if User.objects.filter(username=username).exists():
         return 409, {"detail": "This username is already taken"}
-    return User.objects.create_user(**data.dict())
+    new_user = User.objects.create_user(**data.dict())
+    add_to_index(new_user)
+    return new_user
 
 
 @auth.post('/login', response={200: TokenSchema, 400: Message, 404: Message})
 def login(request, data: UserRegistrationSchema = Form(...)):
     """
-    Получить access token
+    Получить access и refresh токены
     """
     user = get_object_or_404(User, username=data.username)
     if check_password(data.password, user.password):
-        return create_token(user.id)
+        return issue_tokens(user.id, user.username)
+    AUTH_FAILURES.labels('wrong_password').inc()
     return 400, {"detail": "Password is not correct"}
 
 
+@auth.post('/refresh', response={200: TokenSchema, 401: Message})
+def refresh(request, data: RefreshTokenSchema = Form(...)):
+    """
+    Обменять refresh токен на новые access и refresh токены.
+    Каждый refresh токен можно использовать один раз, повторное использование отзывает все токены этого входа.
+    """
+    tokens = rotate_refresh_token(data.refresh_token)
+    if tokens is None:
+        AUTH_FAILURES.labels('invalid_refresh_token').inc()
+        return 401, {"detail": "Refresh token is not valid"}
+    return tokens
+
+
+@auth.post('/logout', response={200: Message, 401: Message})
+def logout(request, data: RefreshTokenSchema = Form(...)):
+    """
+    Отозвать refresh токены этого входа
+    """
+    if not revoke_refresh_token(data.refresh_token):
+        return 401, {"detail": "Refresh token is not valid"}
+    return {"detail": "Logged out"}
+
+
 @auth.get('/whoami', auth=AuthBearer(), response={200: UserSchema, 401: Message})
 def get_my_nickname(request):
     """
@@ -12,5 +12,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'friends.settings')
+os.environ.setdefault('ROOT_URLCONF', 'friends.urls_async')
 
 application = get_asgi_application()
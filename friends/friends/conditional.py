@@ -0,0 +1,36 @@
+import hashlib
+from typing import Optional
+
+from django.http import HttpRequest, HttpResponse
+from django.utils.http import parse_etags
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def check_etag(request: HttpRequest, response: HttpResponse, *parts) -> Optional[HttpResponse]:
+    """
+    Сравнить ETag, собранный из parts и адреса запроса, с If-None-Match.
+    Возвращает готовый ответ 304, если у клиента актуальная версия,
+    иначе проставляет ETag во временный ответ ninja.
+    """
+    etag = make_etag(*parts, request.get_full_path())
+    client_etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if '*' in client_etags or etag in client_etags:
+        not_modified = HttpResponse(status=304)
+        not_modified['ETag'] = etag
+        return not_modified
+    response['ETag'] = etag
+    return None
+
+
+def check_version_etag(request: HttpRequest, response: HttpResponse, stamp) -> Optional[HttpResponse]:
+    """
+    check_etag по метке версии данных. Без метки ETag не ставится: по её отсутствию
+    нельзя понять, менялись ли данные, и 304 мог бы отдать устаревший ответ.
+    """
+    if stamp is None:
+        return None
+    return check_etag(request, response, stamp)
@@ -0,0 +1,3 @@
+"""
+Бэкенды бд Django с пулом соединений, см. friends/db_pool.py
+"""
@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from friends.db_pool import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    pass
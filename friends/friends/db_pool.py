@@ -0,0 +1,147 @@
+"""
+Пул соединений с бд внутри процесса воркера.
+Django по умолчанию открывает соединение на каждый запрос и закрывает его в конце.
+С пулом "закрытие" возвращает соединение в пул после отката незавершённой транзакции,
+а следующий запрос (в любом потоке процесса, в том числе в потоках sync_to_async под ASGI)
+получает его обратно без установки нового соединения. Соединение проверяется перед выдачей,
+если долго простаивало, и заменяется новым, если прожило дольше MAX_LIFETIME.
+"""
+import os
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from django.db import OperationalError
+
+
+class PooledConnection:
+    def __init__(self, raw: Any):
+        self.raw = raw
+        self.created = time.monotonic()
+        self.released = self.created
+
+
+class ConnectionPool:
+    """
+    Не больше max_size соединений одновременно. Если все заняты, выдача ждёт до timeout секунд.
+    """
+
+    def __init__(self, max_size: int = 10, max_lifetime: float = 3600, timeout: float = 30,
+                 health_check_idle: float = 1):
+        self.max_size = max_size
+        self.max_lifetime = max_lifetime
+        self.timeout = timeout
+        self.health_check_idle = health_check_idle
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._pid = os.getpid()
+
+    @staticmethod
+    def _discard(pooled: PooledConnection) -> None:
+        try:
+            pooled.raw.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _is_healthy(pooled: PooledConnection) -> bool:
+        try:
+            cursor = pooled.raw.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def checkout(self, connect: Callable[[], Any]) -> PooledConnection:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise OperationalError(f"No free database connection in the pool of {self.max_size} in {self.timeout}s")
+        try:
+            now = time.monotonic()
+            while True:
+                with self._lock:
+                    pooled = self._idle.pop() if self._idle else None
+                if pooled is None:
+                    return PooledConnection(connect())
+                if now - pooled.created >= self.max_lifetime:
+                    self._discard(pooled)
+                elif now - pooled.released >= self.health_check_idle and not self._is_healthy(pooled):
+                    self._discard(pooled)
+                else:
+                    return pooled
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, pooled: PooledConnection) -> None:
+        """
+        Вернуть соединение в пул. Незавершённая транзакция откатывается, сломанное соединение закрывается.
+        """
+        try:
+            pooled.raw.rollback()
+        except Exception:
+            self._discard(pooled)
+        else:
+            pooled.released = time.monotonic()
+            with self._lock:
+                self._idle.append(pooled)
+        finally:
+            self._slots.release()
+
+    def close_all(self) -> None:
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for pooled in idle:
+            self._discard(pooled)
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias: str, options: dict) -> ConnectionPool:
+    """
+    Пул процесса для алиаса бд. После fork соединения родителя не используются.
+    """
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None or pool._pid != os.getpid():
+            pool = _pools[alias] = ConnectionPool(
+                max_size=options.get('MAX_SIZE', 10),
+                max_lifetime=options.get('MAX_LIFETIME', 3600),
+                timeout=options.get('TIMEOUT', 30),
+                health_check_idle=options.get('HEALTH_CHECK_IDLE', 1),
+            )
+        return pool
+
+
+class PooledDatabaseWrapperMixin:
+    """
+    Примесь к DatabaseWrapper бэкенда Django: соединения берутся из пула и возвращаются в него.
+    Настройки пула - в ключе POOL настроек бд: MAX_SIZE, MAX_LIFETIME, TIMEOUT, HEALTH_CHECK_IDLE.
+    """
+
+    _pooled: Optional[PooledConnection] = None
+
+    @property
+    def pool(self) -> ConnectionPool:
+        return get_pool(self.alias, self.settings_dict.get('POOL') or {})
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        self._pooled = self.pool.checkout(lambda: connect(conn_params))
+        return self._pooled.raw
+
+    def _close(self):
+        pooled, self._pooled = self._pooled, None
+        if pooled is None or pooled.raw is not self.connection:
+            return super()._close()
+        self.pool.checkin(pooled)
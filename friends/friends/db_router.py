@@ -0,0 +1,137 @@
+"""
+Чтение с реплик. Запросы на чтение из REPLICA_READ_ROUTES уходят на одну из DATABASE_REPLICAS,
+всё остальное - на основную бд. После успешного изменяющего запроса (добавление и удаление
+из друзей и т.п.) чтения этого пользователя на REPLICA_PIN_SECONDS закрепляются за основной бд,
+чтобы он не увидел устаревшее состояние дружбы, пока реплика догоняет основную бд.
+Не закрепляют повторы по Idempotency-Key (ручка не выполнялась) и POST-ручки из REPLICA_NO_PIN_ROUTES.
+Закрепление - строка ReplicaPin в основной бд, поэтому оно действует во всех воркерах.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from uuid import UUID
+
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from auth.jwt import request_user_id
+from .idempotency import REPLAYED_HEADER
+from users.models import ReplicaPin
+
+
+_read_alias: ContextVar[Optional[str]] = ContextVar('read_alias', default=None)
+
+SAFE_METHODS = ('GET', 'HEAD')
+
+
+class ReplicaRouter:
+    """
+    Бд для чтения выбирает ReplicaRoutingMiddleware, вне запросов к api всё идёт в основную бд.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+@contextmanager
+def read_from(alias: Optional[str]):
+    """
+    Читать из бд alias внутри блока, None - из основной.
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def pin_to_primary(user_id: UUID) -> None:
+    """
+    Одна вставка или обновление строки пользователя.
+    """
+    expires = timezone.now() + timedelta(seconds=settings.REPLICA_PIN_SECONDS)
+    ReplicaPin.objects.using(DEFAULT_DB_ALIAS).bulk_create(
+        [ReplicaPin(user_id=user_id, expires=expires)],
+        update_conflicts=True, update_fields=['expires'], unique_fields=['user'],
+    )
+
+
+def _active_pin(user_id: UUID):
+    # закрепление, записанное в основную бд, на реплику могло ещё не доехать
+    return ReplicaPin.objects.using(DEFAULT_DB_ALIAS).filter(user_id=user_id, expires__gt=timezone.now())
+
+
+def is_pinned(user_id: UUID) -> bool:
+    return _active_pin(user_id).exists()
+
+
+def _route(request) -> Optional[str]:
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return None
+    return match.route
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+        user_id = request_user_id(request)
+        alias = None
+        if self._may_read_replica(request) and (user_id is None or not is_pinned(user_id)):
+            alias = random.choice(settings.DATABASE_REPLICAS)
+        with read_from(alias):
+            response = self.get_response(request)
+        if self._pins(request, response, user_id):
+            pin_to_primary(user_id)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+        user_id = request_user_id(request)
+        alias = None
+        if self._may_read_replica(request) and (user_id is None or not await _active_pin(user_id).aexists()):
+            alias = random.choice(settings.DATABASE_REPLICAS)
+        with read_from(alias):
+            response = await self.get_response(request)
+        if self._pins(request, response, user_id):
+            await sync_to_async(pin_to_primary)(user_id)
+        return response
+
+    @staticmethod
+    def _may_read_replica(request) -> bool:
+        return request.method in SAFE_METHODS and _route(request) in settings.REPLICA_READ_ROUTES
+
+    @staticmethod
+    def _pins(request, response, user_id: Optional[UUID]) -> bool:
+        if user_id is None or request.method in SAFE_METHODS or response.status_code >= 400:
+            return False
+        # сохранённый ответ повтора ничего не записал, а чтение пачкой ничего не меняет
+        return not response.has_header(REPLAYED_HEADER) and _route(request) not in settings.REPLICA_NO_PIN_ROUTES
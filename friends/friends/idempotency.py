@@ -0,0 +1,161 @@
+"""
+Заголовок Idempotency-Key для изменяющих ручек из IDEMPOTENT_ROUTES. Клиент на плохой сети повторяет
+запрос с тем же ключом и получает ответ первого выполнения: повтор стоит одно чтение по первичному ключу,
+без записи и без выполнения ручки, так что повторное удаление из друзей не ответит 404.
+
+Первый запрос занимает ключ строкой со status 0, повтор, пришедший пока он выполняется, получает 409.
+Ответ хранится IDEMPOTENCY_KEY_TTL_SECONDS, ответы 5xx и 401 не сохраняются и ключ освобождается.
+Ключ с тем же значением, но другим телом запроса - ошибка клиента, 422.
+"""
+import hashlib
+from datetime import timedelta
+from typing import Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+
+from auth.jwt import request_user_id
+from users.models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+
+def _is_idempotent_route(request) -> bool:
+    try:
+        match = resolve(request.path_info, getattr(request, 'urlconf', None))
+    except Resolver404:
+        return False
+    return match.route in settings.IDEMPOTENT_ROUTES
+
+
+def _keys(request) -> Tuple[str, str]:
+    """
+    Ключ записи (ключ клиента в пределах пользователя и пути) и отпечаток тела запроса.
+    """
+    scope = f"{request_user_id(request) or ''}:{request.path}:{request.headers[HEADER]}"
+    return hashlib.sha256(scope.encode()).hexdigest(), hashlib.sha256(request.body).hexdigest()
+
+
+def _replay(record: IdempotencyKey, fingerprint: str) -> HttpResponse:
+    if record.fingerprint != fingerprint:
+        return JsonResponse({"detail": f"{HEADER} is already used with another request"}, status=422)
+    if record.status == 0:
+        return JsonResponse({"detail": f"A request with this {HEADER} is still in progress"}, status=409)
+    response = HttpResponse(bytes(record.body), status=record.status, content_type=record.content_type)
+    response[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def begin(key: str, fingerprint: str) -> Optional[HttpResponse]:
+    """
+    Сохранённый ответ для повтора или None, если ключ занят этим запросом и ручку нужно выполнить.
+    """
+    now = timezone.now()
+    record = IdempotencyKey.objects.filter(key=key).first()
+    if record is not None:
+        if record.expires > now:
+            return _replay(record, fingerprint)
+        record.delete()
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                key=key, fingerprint=fingerprint,
+                expires=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+            )
+    except IntegrityError:
+        # такой же запрос занял ключ между чтением и вставкой
+        return _replay(IdempotencyKey.objects.get(key=key), fingerprint)
+    return None
+
+
+def finish(key: str, response: HttpResponse) -> None:
+    if response.streaming or response.status_code >= 500 or response.status_code == 401:
+        IdempotencyKey.objects.filter(key=key, status=0).delete()
+        return
+    IdempotencyKey.objects.filter(key=key).update(
+        status=response.status_code,
+        content_type=response.get('Content-Type', ''),
+        body=response.content,
+        expires=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL_SECONDS),
+    )
+
+
+def abort(key: str) -> None:
+    IdempotencyKey.objects.filter(key=key, status=0).delete()
+
+
+def purge_expired() -> int:
+    """
+    Удалить истёкшие ключи.
+    """
+    deleted, _ = IdempotencyKey.objects.filter(expires__lte=timezone.now()).delete()
+    return deleted
+
+
+class IdempotencyMiddleware:
+    """
+    Должен стоять после QueryInstrumentationMiddleware, чтобы его запросы попадали в статистику.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _applies(request) -> bool:
+        return request.method == 'POST' and HEADER in request.headers and _is_idempotent_route(request)
+
+    @staticmethod
+    def _invalid(request) -> Optional[HttpResponse]:
+        if not 0 < len(request.headers[HEADER]) <= MAX_KEY_LENGTH:
+            return JsonResponse({"detail": f"{HEADER} must be 1 to {MAX_KEY_LENGTH} characters"}, status=400)
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._applies(request):
+            return self.get_response(request)
+        invalid = self._invalid(request)
+        if invalid is not None:
+            return invalid
+        key, fingerprint = _keys(request)
+        replay = begin(key, fingerprint)
+        if replay is not None:
+            return replay
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            abort(key)
+            raise
+        finish(key, response)
+        return response
+
+    async def __acall__(self, request):
+        if not self._applies(request):
+            return await self.get_response(request)
+        invalid = self._invalid(request)
+        if invalid is not None:
+            return invalid
+        key, fingerprint = _keys(request)
+        replay = await sync_to_async(begin)(key, fingerprint)
+        if replay is not None:
+            return replay
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await sync_to_async(abort)(key)
+            raise
+        await sync_to_async(finish)(key, response)
+        return response
@@ -0,0 +1,157 @@
+"""
+Неблокирующее логирование. Поток запроса только кладёт запись в очередь,
+форматирование в json и запись в файл/консоль делает отдельный поток QueueListener
+(свой в каждом процессе воркера). Отладочные записи можно прореживать случайной выборкой.
+Подключается через LOGGING_CONFIG, параметры берутся из settings.LOGGING.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional
+
+from django.utils.log import DEFAULT_LOGGING
+
+
+# атрибуты, которые есть у любой записи; всё остальное попало в запись через extra
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает записи уровня level и ниже с вероятностью rate.
+    Вероятность ищется по самому длинному совпадающему префиксу имени логгера.
+    """
+
+    def __init__(self, default_rate: float = 1.0, rates: Dict[str, float] = None, level: int = logging.DEBUG):
+        super().__init__()
+        self.default_rate = default_rate
+        self.rates = rates or {}
+        self.level = level
+        self._cache: Dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        rate = self._cache.get(name)
+        if rate is None:
+            prefixes = [prefix for prefix in self.rates if name == prefix or name.startswith(prefix + '.')]
+            rate = self.rates[max(prefixes, key=len)] if prefixes else self.default_rate
+            self._cache[name] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class EnqueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в потоке запроса: очередь в памяти процесса,
+    так что запись не нужно готовить к передаче между процессами.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def parse_mapping(value: str) -> Dict[str, str]:
+    """
+    'django.db.backends=DEBUG,friends=INFO' -> {'django.db.backends': 'DEBUG', 'friends': 'INFO'}
+    """
+    mapping = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, setting = item.partition('=')
+        mapping[name.strip()] = setting.strip()
+    return mapping
+
+
+_listener: Optional[QueueListener] = None
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def _output_handlers(config: dict) -> List[logging.Handler]:
+    formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if config.get('file'):
+        handlers.append(logging.FileHandler(config['file']))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def configure_logging(config: dict) -> None:
+    """
+    config: level - уровень корневого логгера, levels - уровни отдельных логгеров ('name=LEVEL,...'),
+    file - файл для записей, debug_sample_rate - доля пропускаемых отладочных записей,
+    sample_rates - доли для отдельных логгеров ('name=0.01,...').
+    """
+    global _listener
+    _stop_listener()
+
+    records = queue.SimpleQueue()
+    _listener = QueueListener(records, *_output_handlers(config), respect_handler_level=True)
+    _listener.start()
+
+    handler = EnqueueHandler(records)
+    handler.addFilter(SamplingFilter(
+        default_rate=float(config.get('debug_sample_rate', 1.0)),
+        rates={name: float(rate) for name, rate in parse_mapping(config.get('sample_rates', '')).items()},
+    ))
+
+    root = logging.getLogger()
+    for old_handler in root.handlers[:]:
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    # Django перед LOGGING_CONFIG применяет DEFAULT_LOGGING: синхронный вывод в stderr и письма админам
+    # в потоке запроса. Их записи тоже должны только попадать в очередь через корневой логгер
+    for name in DEFAULT_LOGGING['loggers']:
+        logger = logging.getLogger(name)
+        for old_handler in logger.handlers[:]:
+            logger.removeHandler(old_handler)
+        logger.propagate = True
+    root.setLevel(config.get('level', 'INFO'))
+    for name, level in parse_mapping(config.get('levels', '')).items():
+        logging.getLogger(name).setLevel(level.upper())
+
+
+def _restart_after_fork() -> None:
+    # поток слушателя не переживает fork, в дочернем процессе заводим свой
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_restart_after_fork)
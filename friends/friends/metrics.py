@@ -0,0 +1,108 @@
+"""
+Метрики приложения в формате Prometheus.
+Под gunicorn каждый воркер - отдельный процесс, поэтому при заданной переменной окружения
+PROMETHEUS_MULTIPROC_DIR значения пишутся в mmap-файлы в этой папке, а /metrics
+суммирует файлы всех воркеров. Запись метрики - это обновление числа в отображённом файле,
+без блокировок между процессами и без сетевых вызовов.
+"""
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', "Время обработки запроса к api",
+    ('method', 'route'), buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    'http_requests', "Запросы к api",
+    ('method', 'route', 'status'),
+)
+REQUEST_ERRORS = Counter(
+    'http_request_errors', "Запросы к api, завершившиеся ошибкой сервера (5xx)",
+    ('method', 'route'),
+)
+DB_TIME = Histogram(
+    'http_request_db_duration_seconds', "Суммарное время запросов к бд за один запрос к api",
+    ('method', 'route'), buckets=LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'http_request_db_queries', "Число запросов к бд за один запрос к api",
+    ('method', 'route'), buckets=(1, 2, 3, 5, 8, 13, 21, 50, 100),
+)
+AUTH_FAILURES = Counter(
+    'auth_failures', "Отказы в авторизации",
+    ('reason',),
+)
+
+
+def _route(request) -> str:
+    """
+    Шаблон пути ручки вместо самого пути, чтобы число рядов метрик не росло с числом пользователей.
+    """
+    match = request.resolver_match
+    return '/' + match.route if match is not None else 'unmatched'
+
+
+class MetricsMiddleware:
+    """
+    Должен стоять перед QueryInstrumentationMiddleware: время бд берётся из request.db_stats.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not request.path.startswith(settings.SQL_INSTRUMENTATION_PATH_PREFIX):
+            return self.get_response(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self._observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not request.path.startswith(settings.SQL_INSTRUMENTATION_PATH_PREFIX):
+            return await self.get_response(request)
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self._observe(request, response, time.perf_counter() - started)
+        return response
+
+    @staticmethod
+    def _observe(request, response, duration: float) -> None:
+        method, route = request.method, _route(request)
+        REQUEST_LATENCY.labels(method, route).observe(duration)
+        REQUESTS.labels(method, route, str(response.status_code)).inc()
+        if response.status_code >= 500:
+            REQUEST_ERRORS.labels(method, route).inc()
+        stats = getattr(request, 'db_stats', None)
+        if stats is not None:
+            DB_TIME.labels(method, route).observe(stats.duration)
+            DB_QUERIES.labels(method, route).observe(stats.count)
+
+
+def metrics_view(request):
+    """
+    Метрики всех процессов в текстовом формате Prometheus
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,109 @@
+import json
+import base64
+import binascii
+from uuid import UUID
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+from django.db.models import Q, QuerySet
+
+from friends import settings
+
+
+Position = Tuple[datetime, UUID]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def clamp_limit(limit: Optional[int]) -> int:
+    if not limit:
+        return settings.PAGINATION_DEFAULT_LIMIT
+    return max(1, min(limit, settings.PAGINATION_MAX_LIMIT))
+
+
+def encode_cursor(payload: Any) -> str:
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Any:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise InvalidCursor("Cursor is not valid")
+
+
+def dump_position(position: Position) -> List[str]:
+    date, pk = position
+    return [date.isoformat(), str(pk)]
+
+
+def load_position(value: Any) -> Position:
+    try:
+        date, pk = value
+        return datetime.fromisoformat(date), UUID(pk)
+    except (TypeError, ValueError):
+        raise InvalidCursor("Cursor is not valid")
+
+
+def _after(queryset: QuerySet, fields: Tuple[str, str], after: Optional[Position], limit: int) -> QuerySet:
+    date_field, id_field = fields
+    queryset = queryset.order_by(date_field, id_field)
+    if after is not None:
+        date, pk = after
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__gt': date}) | Q(**{date_field: date, f'{id_field}__gt': pk})
+        )
+    return queryset[:limit + 1]
+
+
+def _split(rows: list, fields: Tuple[str, str], limit: int) -> Tuple[list, Optional[Position]]:
+    if len(rows) <= limit:
+        return rows, None
+    date_field, id_field = fields
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        return rows, (last[date_field], last[id_field])
+    return rows, (getattr(last, date_field), getattr(last, id_field))
+
+
+def keyset_page(queryset: QuerySet, fields: Tuple[str, str], after: Optional[Position],
+                limit: int) -> Tuple[list, Optional[Position]]:
+    """
+    Страница queryset, упорядоченного по паре (дата, uuid), после позиции after.
+    Строки - экземпляры моделей или словари из values() с обоими полями сортировки.
+    Возвращает строки и позицию последней строки, если дальше есть ещё.
+    """
+    return _split(list(_after(queryset, fields, after, limit)), fields, limit)
+
+
+async def akeyset_page(queryset: QuerySet, fields: Tuple[str, str], after: Optional[Position],
+                       limit: int) -> Tuple[list, Optional[Position]]:
+    """
+    Асинхронная keyset_page.
+    """
+    return _split([row async for row in _after(queryset, fields, after, limit)], fields, limit)
+
+
+def paginate(queryset: QuerySet, fields: Tuple[str, str], cursor: Optional[str],
+             limit: Optional[int]) -> Tuple[list, Optional[str]]:
+    """
+    Keyset пагинация по непрозрачному курсору.
+    """
+    after = load_position(decode_cursor(cursor)) if cursor else None
+    rows, last = keyset_page(queryset, fields, after, clamp_limit(limit))
+    return rows, encode_cursor(dump_position(last)) if last else None
+
+
+async def apaginate(queryset: QuerySet, fields: Tuple[str, str], cursor: Optional[str],
+                    limit: Optional[int]) -> Tuple[list, Optional[str]]:
+    """
+    Асинхронная paginate.
+    """
+    after = load_position(decode_cursor(cursor)) if cursor else None
+    rows, last = await akeyset_page(queryset, fields, after, clamp_limit(limit))
+    return rows, encode_cursor(dump_position(last)) if last else None
@@ -0,0 +1,38 @@
+"""
+Json ответов api через orjson и быстрый путь для списков: данные, собранные из строк бд
+уже в форме схемы ответа, рендерятся сразу, без построения и проверки pydantic моделей по каждому элементу.
+"""
+from typing import Any
+
+import orjson
+from django.http import HttpRequest, HttpResponse
+from ninja.renderers import BaseRenderer
+from ninja.responses import NinjaJSONEncoder
+
+
+class ORJSONRenderer(BaseRenderer):
+    """
+    Даты и всё, чего не знает orjson (pydantic модели, Decimal, ленивые строки), кодируются
+    как в стандартном рендерере ninja, так что ответы отличаются только пробелами.
+    """
+
+    media_type = 'application/json'
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def __init__(self):
+        self._encoder = NinjaJSONEncoder()
+
+    def render(self, request: HttpRequest, data: Any, *, response_status: int) -> bytes:
+        return orjson.dumps(data, default=self._encoder.default, option=self.options)
+
+
+renderer = ORJSONRenderer()
+
+
+def trusted_response(request: HttpRequest, response: HttpResponse, data: Any) -> HttpResponse:
+    """
+    Отрендерить data во временный ответ ninja (с его заголовками, например ETag) без проверки схемой.
+    Только для данных, которые уже имеют форму схемы ответа: словари из values() и т.п.
+    """
+    response.content = renderer.render(request, data, response_status=response.status_code)
+    return response
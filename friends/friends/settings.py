@@ -1,7 +1,7 @@
 import os
+import json
 import environ
 
-import logging.config
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -31,6 +31,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'friends.metrics.MetricsMiddleware',
+    'friends.sql_instrumentation.QueryInstrumentationMiddleware',
+    'friends.db_router.ReplicaRoutingMiddleware',
+    'friends.idempotency.IdempotencyMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -40,7 +44,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'friends.urls'
+ROOT_URLCONF = os.environ.get('ROOT_URLCONF', 'friends.urls')
 
 TEMPLATES = [
     {
@@ -60,18 +64,76 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'friends.wsgi.application'
 
+# DB_POOL=1 включает пул соединений в каждом процессе воркера, см. friends/db_pool.py
+DB_POOL = os.environ.get('DB_POOL', '').lower() in ('1', 'true', 'yes')
+POOLED_DB_ENGINES = {
+    'django.db.backends.postgresql': 'friends.db_backends.postgresql',
+    'django.db.backends.sqlite3': 'friends.db_backends.sqlite3',
+}
+DB_ENGINE = os.environ.get('DB_ENGINE')
+
 DATABASES = {
     'default': {
-        'ENGINE': os.environ.get('DB_ENGINE'),
+        'ENGINE': POOLED_DB_ENGINES.get(DB_ENGINE, DB_ENGINE) if DB_POOL else DB_ENGINE,
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('POSTGRES_USER'),
         'PASSWORD': os.environ.get('POSTGRES_PASSWORD'),
         # 'HOST': 'localhost',  # uncomment if not running in docker container
         'HOST': os.environ.get('DB_HOST'),
         'PORT': os.environ.get('DB_PORT'),
+        # без пула соединение можно держать открытым между запросами, с пулом оно возвращается в пул после запроса
+        'CONN_MAX_AGE': 0 if DB_POOL else int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'MAX_LIFETIME': float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            'HEALTH_CHECK_IDLE': float(os.environ.get('DB_POOL_HEALTH_CHECK_IDLE', 1)),
+        },
     }
 }
 
+# реплика для чтения с теми же параметрами, что у default, кроме имени бд и хоста, см. friends/db_router.py
+DATABASE_REPLICAS = []
+if os.environ.get('DB_REPLICA_NAME') or os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.environ.get('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        HOST=os.environ.get('DB_REPLICA_HOST', DATABASES['default']['HOST']),
+        PORT=os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append('replica')
+DATABASE_ROUTERS = ['friends.db_router.ReplicaRouter']
+# ручки только для чтения, которые можно отдавать с реплики
+REPLICA_READ_ROUTES = (
+    'api/v1/users',
+    'api/v1/users/search',
+    'api/v1/users/<username>',
+    'api/v1/friends/<user_id>/all',
+    'api/v1/friends/<user_id>/status',
+    'api/v1/friends/myfriends',
+)
+# POST-ручки только для чтения (тело запроса слишком большое для GET): успешный ответ не закрепляет пользователя
+REPLICA_NO_PIN_ROUTES = (
+    'api/v1/friends/status:batch',
+)
+# сколько секунд после изменения дружбы чтения пользователя идут в основную бд
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+
+# изменяющие ручки, которые принимают заголовок Idempotency-Key, см. friends/idempotency.py
+IDEMPOTENT_ROUTES = (
+    'api/v1/auth/register',
+    'api/v1/friends/status:batch',
+    'api/v1/friends/<user_id>/add',
+    'api/v1/friends/<user_id>/remove',
+    'api/v1/friends/add:batch',
+    'api/v1/friends/remove:batch',
+)
+# сколько хранится ответ для повтора и сколько ключ занят незавершённым запросом
+IDEMPOTENCY_KEY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', 24 * 60 * 60))
+IDEMPOTENCY_LOCK_SECONDS = 60
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -87,39 +149,18 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# записи уходят в очередь, в файл и консоль их пишет отдельный поток, см. friends/log.py
+LOGGING_CONFIG = 'friends.log.configure_logging'
 LOGGING = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'formatters': {
-        'console': {
-            'format': '%(name)-12s %(levelname)-8s %(message)s'
-        },
-        'file': {
-            'format': '%(asctime)s %(name)-12s %(levelname)-8s %(message)s'
-        }
-    },
-    'handlers': {
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'console'
-        },
-        'file': {
-            'level': 'DEBUG',
-            'class': 'logging.FileHandler',
-            'formatter': 'file',
-            'filename': 'debug.log'
-        }
-    },
-    'loggers': {
-        '': {
-            'level': 'DEBUG',
-            'handlers': ['console', 'file'],
-        }
-    }
+    'level': os.environ.get('LOG_LEVEL', 'DEBUG'),
+    # уровни отдельных логгеров, например 'django.db.backends=INFO,friends.sql=WARNING'
+    'levels': os.environ.get('LOG_LEVELS', ''),
+    'file': os.environ.get('LOG_FILE', 'debug.log'),
+    # доля отладочных записей, которые попадут в лог, и доли для отдельных логгеров ('django.db.backends=0.01')
+    'debug_sample_rate': float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 0.1)),
+    'sample_rates': os.environ.get('LOG_SAMPLE_RATES', ''),
 }
 
-logging.config.dictConfig(LOGGING)
-
 LANGUAGE_CODE = 'ru-ru'
 
 TIME_ZONE = 'Asia/Yekaterinburg'
@@ -136,3 +177,64 @@ AUTH_USER_MODEL = 'users.User'
 
 JWT_ALGORITHM = "HS256"
 JWT_LIVE_TIME_MINUTES = 5
+JWT_REFRESH_LIVE_TIME_DAYS = int(os.environ.get('JWT_REFRESH_LIVE_TIME_DAYS', 30))
+
+PAGINATION_DEFAULT_LIMIT = 50
+PAGINATION_MAX_LIMIT = 500
+USER_SEARCH_DEFAULT_LIMIT = 10
+USER_SEARCH_MAX_LIMIT = 50
+# поиск пользователей по индексу в памяти процесса вместо бд, для SQLite и разработки, см. users/search.py
+USER_SEARCH_MEMORY_INDEX = os.environ.get('USER_SEARCH_MEMORY_INDEX', '').lower() in ('1', 'true', 'yes')
+USER_SEARCH_INDEX_TTL_SECONDS = int(os.environ.get('USER_SEARCH_INDEX_TTL_SECONDS', 300))
+
+# сколько строк потоковой выгрузки читается из бд и отправляется клиенту за раз
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+
+# лента изменений дружбы, см. friendship/events.py
+EVENTS_PAGE_SIZE = 100
+EVENTS_POLL_INTERVAL_SECONDS = float(os.environ.get('EVENTS_POLL_INTERVAL_SECONDS', 1))
+EVENTS_DEFAULT_WAIT_SECONDS = 25
+EVENTS_MAX_WAIT_SECONDS = 60
+# под WSGI ожидание держит синхронный воркер gunicorn, и несколько ждущих клиентов занимают все воркеры,
+# поэтому по умолчанию WSGI версия отвечает сразу, а длинный опрос обслуживает ASGI приложение (Dockerfile)
+EVENTS_WSGI_MAX_WAIT_SECONDS = float(os.environ.get('EVENTS_WSGI_MAX_WAIT_SECONDS', 0))
+EVENTS_HEARTBEAT_SECONDS = 15
+EVENTS_STREAM_SECONDS = int(os.environ.get('EVENTS_STREAM_SECONDS', 300))
+EVENTS_RETRY_MILLISECONDS = 3000
+# синхронизация списков по разнице: события за страницу и срок хранения надгробий и токенов, см. friendship/changes.py
+FRIENDSHIP_CHANGES_PAGE_SIZE = 500
+FRIENDSHIP_EVENTS_RETENTION_DAYS = int(os.environ.get('FRIENDSHIP_EVENTS_RETENTION_DAYS', 30))
+
+# получатели уведомлений о дружбе: {"имя": {"url": ..., "topics": [...], "headers": {...}, "timeout": секунды}},
+# topics - friendship.request, friendship.accepted, без них - все; см. friendship/outbox.py
+OUTBOX_SINKS = json.loads(os.environ.get('OUTBOX_SINKS') or '{}')
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_CONCURRENCY = int(os.environ.get('OUTBOX_CONCURRENCY', 8))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 10))
+OUTBOX_BACKOFF_BASE_SECONDS = 1
+OUTBOX_BACKOFF_MAX_SECONDS = 600
+OUTBOX_HTTP_TIMEOUT_SECONDS = 5
+# аренда пачки - время её отправки по таймаутам sinks плюс этот запас, см. outbox.lease_seconds
+OUTBOX_LEASE_MARGIN_SECONDS = 30
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.environ.get('OUTBOX_POLL_INTERVAL_SECONDS', 1))
+
+# фоновый пересчёт возможных друзей: сколько изменений дружбы за транзакцию, см. friendship/suggestions.py
+SUGGESTIONS_BATCH_SIZE = int(os.environ.get('SUGGESTIONS_BATCH_SIZE', 1000))
+SUGGESTIONS_POLL_INTERVAL_SECONDS = float(os.environ.get('SUGGESTIONS_POLL_INTERVAL_SECONDS', 1))
+
+AUTH_USER_CACHE_SIZE = int(os.environ.get('AUTH_USER_CACHE_SIZE', 1024))
+AUTH_USER_CACHE_TTL_SECONDS = int(os.environ.get('AUTH_USER_CACHE_TTL_SECONDS', 30))
+
+FRIENDSHIP_BATCH_MAX_SIZE = 200
+
+FRIENDSHIP_GRAPH_PATH = os.environ.get('FRIENDSHIP_GRAPH_PATH')
+FRIENDSHIP_GRAPH_MAX_DEPTH = 6
+# граф догоняет ленту событий дружбы, см. friendship/graph.py: сколько секунд ждать события,
+# закоммиченные не по порядку id, и при скольких изменениях поверх снапшота собрать граф заново
+FRIENDSHIP_GRAPH_GAP_SECONDS = 60
+FRIENDSHIP_GRAPH_MAX_OVERLAY = int(os.environ.get('FRIENDSHIP_GRAPH_MAX_OVERLAY', 100000))
+
+SQL_INSTRUMENTATION_PATH_PREFIX = '/api/v1/'
+# сколько раз один и тот же запрос может выполниться за один запрос к api, прежде чем это сочтут N+1
+SQL_DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('SQL_DUPLICATE_QUERY_THRESHOLD', 3))
+SQL_STRICT_MODE = os.environ.get('SQL_STRICT_MODE', '').lower() in ('1', 'true', 'yes')
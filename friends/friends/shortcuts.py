@@ -0,0 +1,12 @@
+from django.http import Http404
+
+
+async def aget_object_or_404(klass, **kwargs):
+    """
+    Асинхронный get_object_or_404, в Django 4.2 его ещё нет.
+    """
+    queryset = klass._default_manager.all() if hasattr(klass, '_default_manager') else klass
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404(f"No {queryset.model._meta.object_name} matches the given query.")
@@ -0,0 +1,139 @@
+"""
+Учёт запросов к бд на каждый запрос к api: число, суммарное время и повторяющиеся запросы.
+Результаты отдаются в заголовках Server-Timing и X-DB-Queries. Если один и тот же запрос
+(с точностью до параметров) выполняется больше SQL_DUPLICATE_QUERY_THRESHOLD раз, то это N+1:
+в строгом режиме запрос падает с ошибкой, иначе пишется предупреждение в лог.
+"""
+import re
+import time
+import logging
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+logger = logging.getLogger('friends.sql')
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_NUMBER = re.compile(r'\b\d+\b')
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Форма запроса без параметров: списки IN любой длины и числа в тексте запроса сворачиваются.
+    """
+    return _NUMBER.sub('?', _IN_LIST.sub('(...)', sql))
+
+
+class DuplicateQueriesError(AssertionError):
+    pass
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def add(self, sql: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.shapes[normalize_sql(sql)] += 1
+
+    def duplicates(self, threshold: int) -> List[Tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > threshold]
+
+
+_current_stats: ContextVar[Optional[QueryStats]] = ContextVar('current_query_stats', default=None)
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add(sql, time.perf_counter() - started)
+
+
+def _install(connection) -> None:
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _install_on_new_connection(sender, connection, **kwargs) -> None:
+    _install(connection)
+
+
+# соединения создаются в каждом потоке отдельно, в том числе в потоках sync_to_async,
+# а статистика запроса передаётся туда через contextvar
+connection_created.connect(_install_on_new_connection)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Статистика запросов к бд остаётся в request.db_stats для внешних middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._instrumented(request):
+            return self.get_response(request)
+        stats = request.db_stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self._report(request, response, stats)
+
+    async def __acall__(self, request):
+        if not self._instrumented(request):
+            return await self.get_response(request)
+        stats = request.db_stats = QueryStats()
+        token = _current_stats.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_stats.reset(token)
+        return self._report(request, response, stats)
+
+    @staticmethod
+    def _instrumented(request) -> bool:
+        return request.path.startswith(settings.SQL_INSTRUMENTATION_PATH_PREFIX)
+
+    @staticmethod
+    def _report(request, response, stats: QueryStats):
+        response['X-DB-Queries'] = str(stats.count)
+        timing = f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'
+        if response.has_header('Server-Timing'):
+            timing = f"{response['Server-Timing']}, {timing}"
+        response['Server-Timing'] = timing
+
+        duplicates = stats.duplicates(settings.SQL_DUPLICATE_QUERY_THRESHOLD)
+        if duplicates:
+            message = f"{request.method} {request.path} repeats queries: " + '; '.join(
+                f"{count}x {shape}" for shape, count in duplicates
+            )
+            if settings.SQL_STRICT_MODE:
+                raise DuplicateQueriesError(message)
+            logger.warning(message)
+        return response
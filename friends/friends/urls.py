@@ -3,11 +3,16 @@ from django.contrib import admin
 from django.http import Http404
 from ninja import NinjaAPI, errors
 
+from .metrics import metrics_view
+from .pagination import InvalidCursor
+from .rendering import renderer
+
+from auth.principal import UserDeleted
 from users.views import user
 from auth.views import auth
 from friendship.views import friends
 
-api = NinjaAPI()
+api = NinjaAPI(renderer=renderer)
 
 api.title = "Friendship Service API"
 api.description = "Сервис, в котором можно добавлять в друзья."
@@ -18,15 +23,27 @@ api.add_router('/friends', friends)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/v1/', api.urls)
+    path('api/v1/', api.urls),
+    path('metrics', metrics_view),
 ]
 
 
-@api.exception_handler(Http404)
-def not_found_errors(request, exc):
-    return api.create_response(request, {"detail": str(exc)}, status=404)
+def add_exception_handlers(api: NinjaAPI) -> None:
+    @api.exception_handler(Http404)
+    def not_found_errors(request, exc):
+        return api.create_response(request, {"detail": str(exc)}, status=404)
+
+    @api.exception_handler(errors.ValidationError)
+    def validation_errors(request, exc):
+        return api.create_response(request, {"detail": str(exc.errors)}, status=422)
+
+    @api.exception_handler(UserDeleted)
+    def deleted_user_errors(request, exc):
+        return api.create_response(request, {"detail": "User of this token no longer exists"}, status=401)
+
+    @api.exception_handler(InvalidCursor)
+    def invalid_cursor_errors(request, exc):
+        return api.create_response(request, {"detail": str(exc)}, status=400)
 
 
-@api.exception_handler(errors.ValidationError)
-def validation_errors(request, exc):
-    return api.create_response(request, {"detail": str(exc.errors)}, status=422)
+add_exception_handlers(api)
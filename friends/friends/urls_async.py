@@ -0,0 +1,32 @@
+"""
+URLconf для ASGI: те же ручки /api/v1/, но на асинхронных роутерах.
+Подключается в friends/asgi.py через ROOT_URLCONF.
+"""
+from django.urls import path
+from django.contrib import admin
+from ninja import NinjaAPI
+
+from .metrics import metrics_view
+from .rendering import renderer
+from .urls import add_exception_handlers
+
+from users.async_views import user
+from auth.async_views import auth
+from friendship.async_views import friends
+
+api = NinjaAPI(urls_namespace='api-async', renderer=renderer)
+
+api.title = "Friendship Service API"
+api.description = "Сервис, в котором можно добавлять в друзья."
+
+api.add_router('/users', user)
+api.add_router('/auth', auth)
+api.add_router('/friends', friends)
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/v1/', api.urls),
+    path('metrics', metrics_view),
+]
+
+add_exception_handlers(api)
@@ -0,0 +1,98 @@
+"""
+Асинхронные версии сервисов для ASGI.
+Чтение идёт через async ORM, запись - через sync_to_async,
+потому что transaction.atomic в Django 4.2 работает только синхронно.
+"""
+from uuid import UUID
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+from friends.pagination import akeyset_page, apaginate, clamp_limit, dump_position, encode_cursor, load_position
+from users.models import User
+from .schemas import FriendshipStatus, FriendshipMutationResult
+from . import services, suggestions
+
+
+async def aget_friendship_status(user_from: User, user_to: User) -> FriendshipStatus:
+    status = await services.friendship_status_queryset(user_from, user_to).afirst()
+    if status is None:
+        return FriendshipStatus.NONE
+    return FriendshipStatus(status)
+
+
+async def aget_friendship_statuses(user_from: User,
+                                   user_ids: Iterable[UUID]) -> Tuple[Dict[UUID, FriendshipStatus], List[UUID]]:
+    user_ids = list(dict.fromkeys(user_ids))
+    found = {
+        user_id: status async for user_id, status in services.friendship_statuses_queryset(user_from, user_ids)
+    }
+    return services.split_friendship_statuses(user_ids, found)
+
+
+async def aget_friendship_version(user_id: UUID) -> Optional[UUID]:
+    return await services.friendship_version_queryset(user_id).afirst()
+
+
+async def aget_friends_page(user_from: User, cursor: Optional[str] = None,
+                            limit: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    rows, next_cursor = await apaginate(
+        services.edge_page_rows(services.friends_queryset(user_from)), services.EDGE_ORDERING, cursor, limit
+    )
+    return services.edge_page_users(rows), next_cursor
+
+
+async def aget_requests_page(user_from: User, cursor: Optional[str] = None,
+                             limit: Optional[int] = None) -> Tuple[List[dict], List[dict], Optional[str]]:
+    limit = clamp_limit(limit)
+    positions = services.requests_cursor_positions(cursor)
+
+    pages = {}
+    next_positions = {}
+    for status in services.REQUESTS_STATUSES:
+        if positions is not None and status.value not in positions:
+            pages[status] = []
+            continue
+        after = load_position(positions[status.value]) if positions is not None else None
+        rows, last = await akeyset_page(
+            services.edge_page_rows(services.edges_queryset(user_from, [status])), services.EDGE_ORDERING, after, limit
+        )
+        pages[status] = services.edge_page_users(rows)
+        if last is not None:
+            next_positions[status.value] = dump_position(last)
+
+    next_cursor = encode_cursor(next_positions) if next_positions else None
+    return pages[FriendshipStatus.INCOMING], pages[FriendshipStatus.OUTGOING], next_cursor
+
+
+async def aget_mutual_friends_page(user_from: User, user_to: User, cursor: Optional[str] = None,
+                                   limit: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    rows, next_cursor = await apaginate(
+        services.edge_page_rows(services.mutual_friends_queryset(user_from, user_to)), services.EDGE_ORDERING,
+        cursor, limit
+    )
+    return services.edge_page_users(rows), next_cursor
+
+
+async def aget_suggestions(user_from: User, limit: Optional[int] = None) -> List[Tuple[User, int]]:
+    return [
+        (suggestion.candidate, suggestion.mutual_count)
+        async for suggestion in suggestions.suggestions_queryset(user_from, clamp_limit(limit))
+    ]
+
+
+async def aadd_to_friends(user_from: User, user_to: User) -> None:
+    await sync_to_async(services.add_to_friends)(user_from, user_to)
+
+
+async def aremove_from_friends(user_from: User, user_to: User) -> bool:
+    return await sync_to_async(services.remove_from_friends)(user_from, user_to)
+
+
+async def abulk_add_to_friends(user_from: User, user_ids: Iterable[UUID]) -> Dict[UUID, FriendshipMutationResult]:
+    return await sync_to_async(services.bulk_add_to_friends)(user_from, list(user_ids))
+
+
+async def abulk_remove_from_friends(user_from: User,
+                                    user_ids: Iterable[UUID]) -> Dict[UUID, FriendshipMutationResult]:
+    return await sync_to_async(services.bulk_remove_from_friends)(user_from, list(user_ids))
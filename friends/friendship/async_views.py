@@ -0,0 +1,252 @@
+from uuid import UUID
+from typing import List
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from ninja import Router
+
+from auth.jwt import AsyncAuthBearer
+from auth.schemas import Message
+from friends import settings
+from friends.conditional import check_version_etag
+from friends.rendering import trusted_response
+from friends.export import export_format, astream_export
+from friends.shortcuts import aget_object_or_404
+
+from users.models import User
+from users.schemas import UserPageSchema
+from .schemas import (
+    FriendshipStatusSchema, FriendshipRequestsSchema, FriendshipStatusBatchSchema, FriendshipBatchResultSchema,
+    FriendSuggestionSchema, FriendshipDistanceSchema, FriendshipDegreeSchema, FriendshipEventsSchema,
+    FriendshipChangesSchema, UserIdsSchema
+)
+from .graph import get_graph
+
+from . import changes, events, async_services, services
+
+
+friends = Router(tags=["friends"])
+
+
+@friends.get('/myfriends', auth=AsyncAuthBearer(), response={200: UserPageSchema, 400: Message, 401: Message})
+async def get_my_friends(request, response: HttpResponse, cursor: str = None, limit: int = None):
+    """
+    Получить список своих друзей.
+    Поддерживает If-None-Match: если список не менялся, то вернётся 304.
+    """
+    user = request.auth.reference
+    not_modified = check_version_etag(request, response, await async_services.aget_friendship_version(user.pk))
+    if not_modified:
+        return not_modified
+    items, next_cursor = await async_services.aget_friends_page(user, cursor, limit)
+    return trusted_response(request, response, {"items": items, "next_cursor": next_cursor})
+
+
+@friends.get('/requests', auth=AsyncAuthBearer(), response={200: FriendshipRequestsSchema, 400: Message, 401: Message},
+             summary="Get Incoming And Outgoing Requests")
+async def get_requests(request, response: HttpResponse, cursor: str = None, limit: int = None):
+    """
+    Получить входящие и исходящие заявки.
+    Поддерживает If-None-Match: если заявки не менялись, то вернётся 304.
+    """
+    user = request.auth.reference
+    not_modified = check_version_etag(request, response, await async_services.aget_friendship_version(user.pk))
+    if not_modified:
+        return not_modified
+    incoming, outgoing, next_cursor = await async_services.aget_requests_page(user, cursor, limit)
+    return trusted_response(request, response, {"incoming": incoming, "outgoing": outgoing, "next_cursor": next_cursor})
+
+
+@friends.get('/suggestions', auth=AsyncAuthBearer(), response={200: List[FriendSuggestionSchema], 401: Message},
+             summary="Get People You May Know")
+async def get_friend_suggestions(request, limit: int = None):
+    """
+    Получить возможных друзей: друзья друзей по убыванию числа общих друзей.
+    Друзья и пользователи с заявками не попадают в список.
+    """
+    user = request.auth.reference
+    suggestions = await async_services.aget_suggestions(user, limit)
+    return [
+        FriendSuggestionSchema(id=candidate.id, username=candidate.username, mutual_count=mutual_count)
+        for candidate, mutual_count in suggestions
+    ]
+
+
+@friends.post('/status:batch', auth=AsyncAuthBearer(),
+              response={200: FriendshipStatusBatchSchema, 401: Message, 422: Message},
+              summary="Get Friendship Statuses With Many Users")
+async def get_friendship_statuses(request, data: UserIdsSchema):
+    """
+    Получить статусы дружбы с несколькими пользователями сразу.
+    Id, которых нет в сервисе, возвращаются в unknown.
+    """
+    user_from = request.auth.reference
+    statuses, unknown = await async_services.aget_friendship_statuses(user_from, data.user_ids)
+    return FriendshipStatusBatchSchema(
+        statuses={str(user_id): status for user_id, status in statuses.items()}, unknown=unknown
+    )
+
+
+@friends.get('/events', auth=AsyncAuthBearer(),
+             response={200: FriendshipEventsSchema, 401: Message},
+             summary="Wait For Friendship Changes")
+async def get_friendship_events(request, response: HttpResponse, after: int = None, timeout: float = None):
+    """
+    Длинный опрос ленты изменений дружбы: события после after (или Last-Event-ID),
+    а если их нет - первые, пришедшие за timeout секунд. Без after ждёт событий после запроса.
+    С Accept: text/event-stream отдаёт события потоком Server-Sent Events.
+    """
+    user = request.auth.reference
+    if after is None:
+        after = events.parse_last_event_id(request.headers.get('Last-Event-ID'))
+    if events.SSE in request.headers.get('Accept', ''):
+        return events.astream_events(user.pk, after)
+    items, last_id = await events.await_events(user.pk, after, events.clamp_wait(timeout))
+    return trusted_response(request, response, {"events": items, "last_event_id": last_id})
+
+
+@friends.get('/changes', auth=AsyncAuthBearer(),
+             response={200: FriendshipChangesSchema, 400: Message, 401: Message, 410: Message},
+             summary="Get Friend List Changes Since Sync Token")
+async def get_friendship_changes(request, response: HttpResponse, since: str = None):
+    """
+    Изменения своих друзей и заявок после токена since: по строке на пользователя с новым статусом,
+    none - пользователь пропал из всех списков. Без since вернёт только токен: его нужно взять до загрузки списков.
+    Если has_more, то за следующими изменениями нужно прийти с новым токеном сразу.
+    На просроченный токен отвечает 410: списки нужно скачать заново.
+    """
+    user = request.auth.reference
+    try:
+        items, token, has_more = await changes.aget_changes(user.pk, since)
+    except changes.SyncTokenExpired as exc:
+        return 410, {"detail": str(exc)}
+    return trusted_response(request, response, {"changes": items, "token": token, "has_more": has_more})
+
+
+@friends.get('/{user_id}/all', response={200: UserPageSchema, 400: Message, 404: Message},
+             summary="Get User's Friends By His Id")
+async def get_user_friends_by_id(request, response: HttpResponse, user_id, cursor: str = None, limit: int = None):
+    """
+    Получить друзей пользователя user_id.
+    Поддерживает If-None-Match: если список не менялся, то вернётся 304.
+    С Accept: application/x-ndjson или text/csv отдаёт всех друзей потоком, без страниц.
+    """
+    media_type = export_format(request)
+    if media_type is not None:
+        user = await aget_object_or_404(User, id=user_id)
+        return astream_export(services.friends_queryset(user), services.FRIEND_EXPORT_FIELDS, media_type)
+    user = await aget_object_or_404(services.user_with_version_queryset(user_id))
+    not_modified = check_version_etag(request, response, user.friendship_stamp)
+    if not_modified:
+        return not_modified
+    items, next_cursor = await async_services.aget_friends_page(user, cursor, limit)
+    return trusted_response(request, response, {"items": items, "next_cursor": next_cursor})
+
+
+@friends.get('/{user_id}/mutual', auth=AsyncAuthBearer(),
+             response={200: UserPageSchema, 400: Message, 401: Message, 404: Message},
+             summary="Get Mutual Friends With Another User By His Id")
+async def get_mutual_friends_by_id(request, response: HttpResponse, user_id, cursor: str = None, limit: int = None):
+    """
+    Получить общих друзей с пользователем user_id
+    """
+    user_from = request.auth.reference
+    user_to = await aget_object_or_404(User, id=user_id)
+    items, next_cursor = await async_services.aget_mutual_friends_page(user_from, user_to, cursor, limit)
+    return trusted_response(request, response, {"items": items, "next_cursor": next_cursor})
+
+
+async def _graph_user_exists(graph, user_id: UUID) -> bool:
+    """
+    В графе только пользователи с друзьями, остальных проверяем по бд.
+    """
+    return graph.contains(user_id) or await User.objects.filter(id=user_id).aexists()
+
+
+@friends.get('/{user_id}/distance/{other_id}', response={200: FriendshipDistanceSchema, 404: Message},
+             summary="Get Degree Of Separation Between Two Users")
+async def get_distance_by_ids(request, user_id: UUID, other_id: UUID):
+    """
+    Получить число рукопожатий между пользователями user_id и other_id
+    """
+    graph = await sync_to_async(get_graph)()
+    for checked_id in (user_id, other_id):
+        if not await _graph_user_exists(graph, checked_id):
+            return 404, {"detail": "No User matches the given query."}
+    distance = graph.distance(user_id, other_id, settings.FRIENDSHIP_GRAPH_MAX_DEPTH)
+    return FriendshipDistanceSchema(distance=distance)
+
+
+@friends.get('/{user_id}/degree', response={200: FriendshipDegreeSchema, 404: Message},
+             summary="Get User's Friends Count By His Id")
+async def get_degree_by_id(request, user_id: UUID):
+    """
+    Получить число друзей пользователя user_id
+    """
+    graph = await sync_to_async(get_graph)()
+    if not await _graph_user_exists(graph, user_id):
+        return 404, {"detail": "No User matches the given query."}
+    return FriendshipDegreeSchema(degree=graph.degree(user_id))
+
+
+@friends.get('/{user_id}/status', auth=AsyncAuthBearer(),
+             response={200: FriendshipStatusSchema, 401: Message, 404: Message},
+             summary="Get Friendship Status With Another User By His Id")
+async def get_friendship_status_by_id(request, user_id):
+    """
+    Получить статус дружбы с пользователем user_id
+    """
+    user_from = request.auth.reference
+    user_to = await aget_object_or_404(User, id=user_id)
+    status = await async_services.aget_friendship_status(user_from, user_to)
+    return FriendshipStatusSchema(status=status)
+
+
+@friends.post('/{user_id}/add', auth=AsyncAuthBearer(),
+              response={200: Message, 400: Message, 401: Message, 404: Message})
+async def add_friend_by_id(request, user_id):
+    """
+    Добавить пользователя user_id в друзья
+    """
+    user_from = request.auth.reference
+    user_to = await aget_object_or_404(User, id=user_id)
+    if user_from.id == user_to.id:
+        return 400, {"detail": "Nah you can't add yourself in friends"}
+    await async_services.aadd_to_friends(user_from, user_to)
+    return 200, {"detail": "ok"}
+
+
+@friends.post('/{user_id}/remove', auth=AsyncAuthBearer(), response={200: Message, 404: Message})
+async def remove_friend_by_id(request, user_id):
+    """
+    Удалить пользователя user_id из друзей/отменить исходящую заявку в друзья.
+    """
+    user_from = request.auth.reference
+    user_to = await aget_object_or_404(User, id=user_id)
+    if not await async_services.aremove_from_friends(user_from, user_to):
+        return 404, {"detail": "This user is not in friends and you have no outgoing request to him"}
+    return 200, {"detail": "ok"}
+
+
+@friends.post('/add:batch', auth=AsyncAuthBearer(),
+              response={200: FriendshipBatchResultSchema, 401: Message, 422: Message},
+              summary="Add Many Users In Friends")
+async def add_friends_batch(request, data: UserIdsSchema):
+    """
+    Добавить в друзья нескольких пользователей одной транзакцией
+    """
+    user_from = request.auth.reference
+    results = await async_services.abulk_add_to_friends(user_from, data.user_ids)
+    return FriendshipBatchResultSchema(results={str(user_id): result for user_id, result in results.items()})
+
+
+@friends.post('/remove:batch', auth=AsyncAuthBearer(),
+              response={200: FriendshipBatchResultSchema, 401: Message, 422: Message},
+              summary="Remove Many Users From Friends")
+async def remove_friends_batch(request, data: UserIdsSchema):
+    """
+    Удалить из друзей/отменить заявки нескольким пользователям одной транзакцией
+    """
+    user_from = request.auth.reference
+    results = await async_services.abulk_remove_from_friends(user_from, data.user_ids)
+    return FriendshipBatchResultSchema(results={str(user_id): result for user_id, result in results.items()})
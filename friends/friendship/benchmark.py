@@ -0,0 +1,248 @@
+"""
+Замеры сервисов и ручек на сгенерированном графе.
+Каждый замер повторяется несколько раз, сохраняются перцентили времени и число запросов к бд.
+Результаты пишутся в json, который можно сравнить с результатами другого коммита.
+"""
+import json
+import time
+import itertools
+from uuid import UUID
+from importlib import import_module
+from typing import Callable, Dict, List
+
+from django.conf import settings as django_settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from auth.jwt import create_token
+from auth.principal import user_cache
+from auth.refresh import issue_tokens
+from friends import settings
+from users.models import User
+from . import changes, services
+from .generator import GraphParams, generate_graph
+from .graph import get_graph, reset_graph
+
+
+class Case:
+    """
+    Замер: func вызывается repeat раз, перед каждым вызовом вне замера выполняется prepare.
+    route - ручка в виде 'METHOD /путь/{параметр}', если замеряется ручка.
+    """
+
+    def __init__(self, name: str, func: Callable[[], object], prepare: Callable[[], None] = None,
+                 route: str = None):
+        self.name = name
+        self.func = func
+        self.prepare = prepare
+        self.route = route
+
+
+def percentile(values: List[float], share: float) -> float:
+    """
+    Перцентиль отсортированного списка методом ближайшего ранга.
+    """
+    index = max(0, min(len(values) - 1, round(share * len(values) + 0.5) - 1))
+    return values[index]
+
+
+def measure(case: Case, repeat: int) -> dict:
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        if case.prepare is not None:
+            case.prepare()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            result = case.func()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(len(captured))
+        if getattr(result, 'status_code', 200) >= 400:
+            # замер ошибки ничего не говорит о скорости ручки
+            raise RuntimeError(f"{case.name} responded with {result.status_code}: {result.content[:200]}")
+    timings.sort()
+    return {
+        'route': case.route,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': max(queries),
+    }
+
+
+def _subjects(ids: List[UUID], params: GraphParams) -> Dict[str, User]:
+    """
+    Пользователи, от имени которых идут замеры: знаменитость и обычный пользователь.
+    """
+    subjects = {'regular': ids[min(params.celebrities + len(ids) // 2, len(ids) - 1)]}
+    if params.celebrities:
+        subjects['celebrity'] = ids[0]
+    users = User.objects.in_bulk(subjects.values())
+    return {label: users[user_id] for label, user_id in subjects.items()}
+
+
+def service_cases(user: User, others: List[User]) -> List[Case]:
+    other, target = others[0], others[-1]
+    batch = [friend.id for friend in others[:50]]
+    graph = get_graph()
+    return [
+        Case('get_friendship_status', lambda: services.get_friendship_status(user, other)),
+        Case('get_friendship_statuses', lambda: services.get_friendship_statuses(user, batch)),
+        Case('get_requests_and_friends', lambda: services.get_requests_and_friends(user)),
+        Case('get_friends', lambda: services.get_friends(user)),
+        Case('get_incoming_requests', lambda: services.get_incoming_requests(user)),
+        Case('get_outgoing_requests', lambda: services.get_outgoing_requests(user)),
+        Case('get_friends_page', lambda: services.get_friends_page(user)),
+        Case('get_requests_page', lambda: services.get_requests_page(user)),
+        Case('get_mutual_friends_page', lambda: services.get_mutual_friends_page(user, other)),
+        Case('get_suggestions', lambda: services.get_suggestions(user)),
+        Case('add_to_friends', lambda: services.add_to_friends(user, target),
+             prepare=lambda: services.remove_from_friends(user, target)),
+        Case('remove_from_friends', lambda: services.remove_from_friends(user, target),
+             prepare=lambda: services.add_to_friends(user, target)),
+        Case('bulk_add_to_friends', lambda: services.bulk_add_to_friends(user, batch),
+             prepare=lambda: services.bulk_remove_from_friends(user, batch)),
+        Case('bulk_remove_from_friends', lambda: services.bulk_remove_from_friends(user, batch),
+             prepare=lambda: services.bulk_add_to_friends(user, batch)),
+        Case('graph_degree', lambda: graph.degree(user.id)),
+        Case('graph_distance', lambda: graph.distance(user.id, target.id, settings.FRIENDSHIP_GRAPH_MAX_DEPTH)),
+    ]
+
+
+def endpoint_cases(user: User, others: List[User]) -> List[Case]:
+    other, target = others[0], others[-1]
+    batch_ids = [friend.id for friend in others[:50]]
+    batch = {'user_ids': [str(user_id) for user_id in batch_ids]}
+    token = create_token(user.id, user.username)['access_token']
+    client = Client(HTTP_AUTHORIZATION='Bearer ' + token)
+    anonymous = Client()
+    numbers = itertools.count()
+    refresh_tokens = []
+
+    def new_refresh_token():
+        refresh_tokens.append(issue_tokens(user.id, user.username)['refresh_token'])
+
+    def get(path: str, route: str) -> Case:
+        return Case(route, lambda: client.get('/api/v1' + path), route=route)
+
+    def post(path: str, route: str, prepare=None, **kwargs) -> Case:
+        return Case(route, lambda: client.post('/api/v1' + path, **kwargs), prepare=prepare, route=route)
+
+    def export(path: str, route: str, media_type: str) -> Case:
+        def func():
+            response = client.get('/api/v1' + path, HTTP_ACCEPT=media_type)
+            b''.join(response.streaming_content)
+            return response
+        return Case(f'{route} ({media_type})', func, route=route)
+
+    return [
+        get('/users', 'GET /users'),
+        export('/users', 'GET /users', 'application/x-ndjson'),
+        get(f'/users/{user.username}', 'GET /users/{username}'),
+        get(f'/users/search?q={user.username[:2]}', 'GET /users/search'),
+        get(f'/users/id/{user.id}', 'GET /users/id/{user_id}'),
+        Case('POST /auth/register', route='POST /auth/register', func=lambda: anonymous.post(
+            '/api/v1/auth/register', {'username': f'{user.username}n{next(numbers)}', 'password': 'benchmark'},
+        )),
+        Case('POST /auth/login', route='POST /auth/login', func=lambda: anonymous.post(
+            '/api/v1/auth/login', {'username': user.username, 'password': 'benchmark'},
+        )),
+        Case('POST /auth/refresh', route='POST /auth/refresh', prepare=new_refresh_token, func=lambda: anonymous.post(
+            '/api/v1/auth/refresh', {'refresh_token': refresh_tokens.pop()},
+        )),
+        Case('POST /auth/logout', route='POST /auth/logout', prepare=new_refresh_token, func=lambda: anonymous.post(
+            '/api/v1/auth/logout', {'refresh_token': refresh_tokens.pop()},
+        )),
+        get('/auth/whoami', 'GET /auth/whoami'),
+        get('/friends/myfriends', 'GET /friends/myfriends'),
+        get('/friends/requests', 'GET /friends/requests'),
+        get('/friends/suggestions', 'GET /friends/suggestions'),
+        get('/friends/events?after=0&timeout=0', 'GET /friends/events'),
+        get(f'/friends/changes?since={changes.encode_token(0)}', 'GET /friends/changes'),
+        post('/friends/status:batch', 'POST /friends/status:batch', data=batch, content_type='application/json'),
+        get(f'/friends/{user.id}/all', 'GET /friends/{user_id}/all'),
+        export(f'/friends/{user.id}/all', 'GET /friends/{user_id}/all', 'text/csv'),
+        get(f'/friends/{other.id}/mutual', 'GET /friends/{user_id}/mutual'),
+        get(f'/friends/{user.id}/distance/{target.id}', 'GET /friends/{user_id}/distance/{other_id}'),
+        get(f'/friends/{user.id}/degree', 'GET /friends/{user_id}/degree'),
+        get(f'/friends/{other.id}/status', 'GET /friends/{user_id}/status'),
+        post(f'/friends/{target.id}/add', 'POST /friends/{user_id}/add',
+             prepare=lambda: services.remove_from_friends(user, target)),
+        post(f'/friends/{target.id}/remove', 'POST /friends/{user_id}/remove',
+             prepare=lambda: services.add_to_friends(user, target)),
+        post('/friends/add:batch', 'POST /friends/add:batch', data=batch, content_type='application/json',
+             prepare=lambda: services.bulk_remove_from_friends(user, batch_ids)),
+        post('/friends/remove:batch', 'POST /friends/remove:batch', data=batch, content_type='application/json',
+             prepare=lambda: services.bulk_add_to_friends(user, batch_ids)),
+    ]
+
+
+def api_routes() -> List[str]:
+    """
+    Все ручки api из ROOT_URLCONF в виде 'METHOD /путь/{параметр}', чтобы найти незамеренные.
+    """
+    api = import_module(django_settings.ROOT_URLCONF).api
+    return sorted(
+        f'{method.upper()} {path}'
+        for path, methods in api.get_openapi_schema(path_prefix='')['paths'].items()
+        for method in methods
+    )
+
+
+def run(params: GraphParams, repeat: int = 20,
+        progress: Callable[[str, dict], None] = None) -> dict:
+    """
+    Сгенерировать граф в текущей бд и замерить все сервисы и ручки
+    от имени знаменитости и обычного пользователя.
+    """
+    ids = generate_graph(params)
+    reset_graph()
+    user_cache.clear()
+
+    results = {}
+    covered = set()
+    for label, user in _subjects(ids, params).items():
+        others = list(User.objects.exclude(id=user.id).order_by('username')[:60])
+        for case in itertools.chain(service_cases(user, others), endpoint_cases(user, others)):
+            name = f'{case.name}[{label}]'
+            results[name] = measure(case, repeat)
+            covered.add(case.route)
+            if progress is not None:
+                progress(name, results[name])
+    return {
+        'params': params.as_dict(),
+        'repeat': repeat,
+        'database': connection.vendor,
+        'results': results,
+        'uncovered_routes': [route for route in api_routes() if route not in covered],
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.2, min_delta_ms: float = 1.0) -> List[str]:
+    """
+    Регрессии относительно baseline: p95 выросло больше чем на threshold (и больше чем на min_delta_ms)
+    или выросло число запросов к бд.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            continue
+        if result['queries'] > old['queries']:
+            regressions.append(f"{name}: queries {old['queries']} -> {result['queries']}")
+        delta = result['p95_ms'] - old['p95_ms']
+        if delta > min_delta_ms and result['p95_ms'] > old['p95_ms'] * (1 + threshold):
+            regressions.append(f"{name}: p95 {old['p95_ms']}ms -> {result['p95_ms']}ms")
+    return regressions
+
+
+def load_results(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_results(path: str, results: dict) -> None:
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, ensure_ascii=False)
@@ -0,0 +1,107 @@
+"""
+Синхронизация списков дружбы по разнице: клиент хранит друзей и заявки у себя и забирает только
+изменения после токена синхронизации. Изменения берутся из ленты событий (FriendshipEvent):
+по строке на пользователя с его последним статусом, статус none - надгробие, пользователь пропал из всех списков.
+
+Токен - id последнего отданного события и время выдачи. Сжатие ленты (compact_events) удаляет события,
+перекрытые более поздними, и надгробия старше FRIENDSHIP_EVENTS_RETENTION_DAYS, поэтому токен живёт столько же:
+по более старому токену удалений уже не восстановить, и клиент скачивает списки заново.
+"""
+import time
+from uuid import UUID
+from datetime import timedelta
+from typing import List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from friends.pagination import InvalidCursor, decode_cursor, encode_cursor
+from .schemas import FriendshipStatus
+from .models import FriendshipEvent
+from .events import latest_event_id
+
+
+CHANGE_FIELDS = ('id', 'other_id', 'other__username', 'status')
+
+
+class SyncTokenExpired(Exception):
+    pass
+
+
+def _retention() -> timedelta:
+    return timedelta(days=settings.FRIENDSHIP_EVENTS_RETENTION_DAYS)
+
+
+def encode_token(event_id: int) -> str:
+    return encode_cursor([event_id, int(time.time())])
+
+
+def decode_token(token: str) -> int:
+    """
+    Id события из токена. SyncTokenExpired, если токен старше срока хранения надгробий.
+    """
+    try:
+        event_id, issued = decode_cursor(token)
+        event_id, issued = int(event_id), int(issued)
+    except (TypeError, ValueError):
+        raise InvalidCursor("Sync token is not valid")
+    if time.time() - issued > _retention().total_seconds():
+        raise SyncTokenExpired("Sync token has expired, reload the lists and start over")
+    return event_id
+
+
+def get_changes(user_id: UUID, since: Optional[str]) -> Tuple[List[dict], str, bool]:
+    """
+    Изменения списков пользователя после токена since (не больше FRIENDSHIP_CHANGES_PAGE_SIZE событий),
+    новый токен и есть ли изменения дальше. Без since - только токен текущего состояния.
+    """
+    if since is None:
+        return [], encode_token(latest_event_id(user_id)), False
+    after = decode_token(since)
+    limit = settings.FRIENDSHIP_CHANGES_PAGE_SIZE
+    rows = list(FriendshipEvent.objects.filter(
+        user_id=user_id, id__gt=after
+    ).order_by('id').values(*CHANGE_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    # от пары остаётся последнее событие, порядок - по времени последнего изменения
+    latest = {}
+    for row in rows:
+        latest.pop(row['other_id'], None)
+        latest[row['other_id']] = row
+    changes = [
+        {'id': row['other_id'], 'username': row['other__username'], 'status': row['status']}
+        for row in latest.values()
+    ]
+    return changes, encode_token(rows[-1]['id'] if rows else after), has_more
+
+
+aget_changes = sync_to_async(get_changes)
+
+
+def compact_events(older_than: Optional[timedelta] = None, batch_size: int = 10000) -> Tuple[int, int]:
+    """
+    Сжать ленту событий старше older_than (по умолчанию FRIENDSHIP_EVENTS_RETENTION_DAYS): удалить события,
+    перекрытые более поздними событиями той же пары, и надгробия. Удаляет пачками по диапазону id.
+    Возвращает число удалённых перекрытых событий и надгробий.
+    """
+    cutoff = timezone.now() - (older_than if older_than is not None else _retention())
+    last_id = FriendshipEvent.objects.filter(created__lt=cutoff).order_by('-id').values_list('id', flat=True).first()
+    if last_id is None:
+        return 0, 0
+    superseded = FriendshipEvent.objects.filter(Exists(FriendshipEvent.objects.filter(
+        user=OuterRef('user'), other=OuterRef('other'), id__gt=OuterRef('id')
+    )))
+    tombstones = FriendshipEvent.objects.filter(status=FriendshipStatus.NONE.value)
+
+    removed_superseded = removed_tombstones = 0
+    start = FriendshipEvent.objects.order_by('id').values_list('id', flat=True).first()
+    while start <= last_id:
+        end = min(start + batch_size - 1, last_id)
+        removed_superseded += superseded.filter(id__gte=start, id__lte=end).delete()[0]
+        removed_tombstones += tombstones.filter(id__gte=start, id__lte=end).delete()[0]
+        start = end + 1
+    return removed_superseded, removed_tombstones
@@ -0,0 +1,351 @@
+"""
+Лента изменений дружбы. Сервисы пишут FriendshipEvent каждой стороне пары при смене статуса,
+клиенты дочитывают события после последнего увиденного id длинным опросом или через Server-Sent Events.
+
+Ждущие клиенты не ходят в бд и не держат соединение с ней: в процессе один поток опрашивает
+таблицу событий раз в EVENTS_POLL_INTERVAL_SECONDS, пока кто-то ждёт, и будит тех, кому пришли события.
+Изменения, сделанные в этом же процессе, будят ждущих сразу после коммита.
+Под ASGI ожидание - это future в event loop, так что тысячи простаивающих клиентов почти ничего не стоят.
+Под WSGI каждый ждущий клиент занимал бы поток воркера, поэтому WSGI версия ручки по умолчанию не ждёт.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from uuid import UUID
+from functools import partial
+from collections import OrderedDict, defaultdict
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import StreamingHttpResponse
+
+from friends.rendering import renderer
+from .schemas import FriendshipStatus
+from .models import FriendshipEvent
+
+
+logger = logging.getLogger('friends.events')
+
+SSE = 'text/event-stream'
+EVENT_FIELDS = ('id', 'other_id', 'other__username', 'status', 'created')
+# сколько новых событий читает один опрос и для скольких пользователей помнится id последнего события
+POLL_BATCH_SIZE = 10000
+RECENT_USERS = 10000
+
+
+def record_events(changes: Iterable[Tuple[UUID, UUID, FriendshipStatus]]) -> None:
+    """
+    Записать события смены статусов: (кому, с кем, новый статус).
+    Вызывается внутри транзакции, изменившей статусы.
+    """
+    events = [FriendshipEvent(user_id=user_id, other_id=other_id, status=status.value)
+              for user_id, other_id, status in changes]
+    if not events:
+        return
+    FriendshipEvent.objects.bulk_create(events)
+    transaction.on_commit(partial(_notify_committed, [(event.id, event.user_id) for event in events]))
+
+
+def _notify_committed(events: List[Tuple[Optional[int], UUID]]) -> None:
+    get_hub().notify(events)
+
+
+def latest_event_id(user_id: Optional[UUID] = None) -> int:
+    """
+    Id последнего события пользователя или всей ленты, 0 если событий нет.
+    """
+    queryset = FriendshipEvent.objects.all() if user_id is None else FriendshipEvent.objects.filter(user_id=user_id)
+    return queryset.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _event(row: dict) -> dict:
+    return {
+        'id': row['id'],
+        'user_id': row['other_id'],
+        'username': row['other__username'],
+        'status': row['status'],
+        'created': row['created'],
+    }
+
+
+def _release_connections() -> None:
+    # ждущий клиент не должен держать соединение с бд; открытую транзакцию (тесты, ATOMIC_REQUESTS) не трогаем
+    for connection in connections.all(initialized_only=True):
+        if not connection.in_atomic_block:
+            connection.close()
+
+
+def get_events(user_id: UUID, after: Optional[int]) -> Tuple[List[dict], int]:
+    """
+    События пользователя после after (не больше EVENTS_PAGE_SIZE) и id последнего из них.
+    Без after событий нет, только id последнего события: клиент начинает с текущего момента.
+    """
+    try:
+        if after is None:
+            return [], latest_event_id(user_id)
+        rows = FriendshipEvent.objects.filter(user_id=user_id, id__gt=after).order_by('id').values(*EVENT_FIELDS)
+        events = [_event(row) for row in rows[:settings.EVENTS_PAGE_SIZE]]
+    finally:
+        _release_connections()
+    return events, events[-1]['id'] if events else after
+
+
+aget_events = sync_to_async(get_events)
+
+
+class _Waiter:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def wake(self) -> None:
+        self._event.set()
+
+    def wait(self, timeout: float) -> bool:
+        return self._event.wait(timeout)
+
+
+class _AsyncWaiter:
+    def __init__(self):
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def _set(self) -> None:
+        if not self._future.done():
+            self._future.set_result(True)
+
+    def wake(self) -> None:
+        try:
+            self._loop.call_soon_threadsafe(self._set)
+        except RuntimeError:
+            # event loop уже закрыт, будить некого
+            pass
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            return await asyncio.wait_for(self._future, timeout)
+        except asyncio.TimeoutError:
+            return False
+
+
+class EventHub:
+    """
+    Ожидание новых событий пользователей в процессе.
+    Помнит id последнего события недавно изменившихся пользователей, чтобы не пропустить событие,
+    пришедшее между чтением ленты клиентом и началом его ожидания.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: Dict[UUID, Set] = defaultdict(set)
+        self._recent: OrderedDict = OrderedDict()
+        self._last_id: Optional[int] = None
+        self._poller: Optional[threading.Thread] = None
+        self._pid = os.getpid()
+
+    def notify(self, events: Iterable[Tuple[Optional[int], UUID]]) -> None:
+        """
+        Разбудить клиентов, ждущих событий пользователей. events: пары (id события, id пользователя).
+        """
+        woken = []
+        with self._lock:
+            for event_id, user_id in events:
+                if event_id is not None and event_id > self._recent.get(user_id, 0):
+                    self._recent[user_id] = event_id
+                    self._recent.move_to_end(user_id)
+                woken.extend(self._waiters.get(user_id, ()))
+            while len(self._recent) > RECENT_USERS:
+                self._recent.popitem(last=False)
+        for waiter in woken:
+            waiter.wake()
+
+    def _register(self, user_id: UUID, after: int, waiter) -> bool:
+        with self._lock:
+            if self._recent.get(user_id, 0) > after:
+                return False
+            self._waiters[user_id].add(waiter)
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='friendship-events', daemon=True)
+                self._poller.start()
+        return True
+
+    def _unregister(self, user_id: UUID, waiter) -> None:
+        with self._lock:
+            waiters = self._waiters.get(user_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[user_id]
+
+    def listen(self, user_id: UUID, after: int, timeout: float) -> bool:
+        """
+        Ждать событие пользователя с id больше after не дольше timeout секунд. False, если не дождались.
+        """
+        waiter = _Waiter()
+        if not self._register(user_id, after, waiter):
+            return True
+        try:
+            return waiter.wait(timeout)
+        finally:
+            self._unregister(user_id, waiter)
+
+    async def alisten(self, user_id: UUID, after: int, timeout: float) -> bool:
+        waiter = _AsyncWaiter()
+        if not self._register(user_id, after, waiter):
+            return True
+        try:
+            return await waiter.wait(timeout)
+        finally:
+            self._unregister(user_id, waiter)
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _check(self) -> None:
+        if self._last_id is None:
+            self._last_id = latest_event_id()
+            return
+        rows = list(FriendshipEvent.objects.filter(
+            id__gt=self._last_id
+        ).order_by('id').values_list('id', 'user_id')[:POLL_BATCH_SIZE])
+        if rows:
+            self._last_id = rows[-1][0]
+            self.notify(rows)
+
+    def _poll(self) -> None:
+        try:
+            while True:
+                with self._lock:
+                    if not self._waiters:
+                        self._poller = None
+                        return
+                try:
+                    self._check()
+                except Exception:
+                    logger.exception("Friendship events poll failed")
+                    connections.close_all()
+                time.sleep(settings.EVENTS_POLL_INTERVAL_SECONDS)
+        finally:
+            connections.close_all()
+
+    def stop(self) -> None:
+        """
+        Разбудить всех ждущих и остановить опрос.
+        """
+        with self._lock:
+            waiters = [waiter for user_waiters in self._waiters.values() for waiter in user_waiters]
+            self._waiters.clear()
+            poller = self._poller
+        for waiter in waiters:
+            waiter.wake()
+        if poller is not None and poller is not threading.current_thread():
+            poller.join()
+
+
+_hub: Optional[EventHub] = None
+_hub_lock = threading.Lock()
+
+
+def get_hub() -> EventHub:
+    """
+    Хаб процесса. После fork поток опроса родителя в дочернем процессе не существует, заводим новый хаб.
+    """
+    global _hub
+    with _hub_lock:
+        if _hub is None or _hub._pid != os.getpid():
+            _hub = EventHub()
+        return _hub
+
+
+def reset_hub() -> None:
+    global _hub
+    with _hub_lock:
+        hub, _hub = _hub, None
+    if hub is not None:
+        hub.stop()
+
+
+def clamp_wait(timeout: Optional[float], limit: Optional[float] = None) -> float:
+    """
+    Время ожидания в пределах limit (по умолчанию EVENTS_MAX_WAIT_SECONDS).
+    """
+    limit = settings.EVENTS_MAX_WAIT_SECONDS if limit is None else limit
+    if timeout is None:
+        timeout = settings.EVENTS_DEFAULT_WAIT_SECONDS
+    return max(0, min(timeout, limit))
+
+
+def wait_for_events(user_id: UUID, after: Optional[int], timeout: float) -> Tuple[List[dict], int]:
+    """
+    Длинный опрос: события после after или, если их нет, первые пришедшие за timeout секунд.
+    """
+    deadline = time.monotonic() + timeout
+    events, last_id = get_events(user_id, after)
+    hub = get_hub()
+    while not events:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not hub.listen(user_id, last_id, remaining):
+            break
+        events, last_id = get_events(user_id, last_id)
+    return events, last_id
+
+
+async def await_events(user_id: UUID, after: Optional[int], timeout: float) -> Tuple[List[dict], int]:
+    deadline = time.monotonic() + timeout
+    events, last_id = await aget_events(user_id, after)
+    hub = get_hub()
+    while not events:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not await hub.alisten(user_id, last_id, remaining):
+            break
+        events, last_id = await aget_events(user_id, last_id)
+    return events, last_id
+
+
+def parse_last_event_id(value: Optional[str]) -> Optional[int]:
+    """
+    Заголовок Last-Event-ID, с которым EventSource переподключается после обрыва.
+    """
+    if value is None or not value.strip().isdigit():
+        return None
+    return int(value)
+
+
+def _sse_chunk(events: List[dict]) -> bytes:
+    return b''.join(
+        b'id: %d\nevent: friendship\ndata: %s\n\n' % (event['id'], renderer.render(None, event, response_status=200))
+        for event in events
+    )
+
+
+async def _sse(user_id: UUID, after: Optional[int]) -> AsyncIterator[bytes]:
+    deadline = time.monotonic() + settings.EVENTS_STREAM_SECONDS
+    hub = get_hub()
+    events, after = await aget_events(user_id, after)
+    yield b'retry: %d\n\n' % settings.EVENTS_RETRY_MILLISECONDS
+    while True:
+        if events:
+            yield _sse_chunk(events)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        if await hub.alisten(user_id, after, min(settings.EVENTS_HEARTBEAT_SECONDS, remaining)):
+            events, after = await aget_events(user_id, after)
+        else:
+            events = []
+            yield b': keepalive\n\n'
+
+
+def astream_events(user_id: UUID, after: Optional[int]) -> StreamingHttpResponse:
+    """
+    Поток событий в формате Server-Sent Events. Закрывается через EVENTS_STREAM_SECONDS,
+    клиент переподключается с Last-Event-ID и ничего не теряет.
+    """
+    response = StreamingHttpResponse(_sse(user_id, after), content_type=SSE)
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,112 @@
+"""
+Генератор синтетического графа дружбы для нагрузочных замеров.
+Степени вершин распределены по степенному закону, как в реальных соцсетях:
+у большинства пользователей мало друзей, у немногих - очень много.
+"""
+import random
+from uuid import UUID
+from datetime import timedelta
+from typing import List, Set, Tuple
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from users.models import User
+from .importer import insert_chunk
+from .models import Friendship
+from .services import rebuild_edges
+from .suggestions import rebuild_suggestions
+
+
+class GraphParams:
+    """
+    users - число пользователей, mean_degree - среднее число связей на пользователя,
+    celebrities - число знаменитостей, которым отправляет заявки celebrity_fans доля всех пользователей,
+    pending_share - доля связей, оставшихся неподтверждёнными заявками, exponent - показатель степенного закона.
+    """
+
+    def __init__(self, users: int = 1000, mean_degree: float = 20, celebrities: int = 3,
+                 celebrity_fans: float = 0.2, pending_share: float = 0.3, exponent: float = 2.5, seed: int = 0):
+        self.users = users
+        self.mean_degree = mean_degree
+        self.celebrities = celebrities
+        self.celebrity_fans = celebrity_fans
+        self.pending_share = pending_share
+        self.exponent = exponent
+        self.seed = seed
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+def generate_pairs(params: GraphParams, rng: random.Random) -> List[Tuple[int, int]]:
+    """
+    Направленные заявки (откуда, куда) между номерами пользователей 0..users-1.
+    Пары выбираются по модели Чунг-Лу с весами из распределения Парето,
+    первые params.celebrities пользователей - знаменитости.
+    """
+    weights = [rng.paretovariate(params.exponent - 1) for _ in range(params.users)]
+    cum_weights = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cum_weights.append(total)
+
+    population = range(params.users)
+    links = int(params.users * params.mean_degree / 2)
+    seen: Set[Tuple[int, int]] = set()
+    pairs = []
+    attempts = 0
+    while len(seen) < links and attempts < links * 10:
+        attempts += 1
+        left, right = rng.choices(population, cum_weights=cum_weights, k=2)
+        if left == right or (left, right) in seen or (right, left) in seen:
+            continue
+        seen.add((left, right))
+        pairs.append((left, right))
+        if rng.random() >= params.pending_share:
+            pairs.append((right, left))
+
+    fans = int(params.users * params.celebrity_fans)
+    for celebrity in range(min(params.celebrities, params.users)):
+        for fan in rng.sample(population, min(fans, params.users)):
+            if fan == celebrity or (fan, celebrity) in seen or (celebrity, fan) in seen:
+                continue
+            seen.add((fan, celebrity))
+            pairs.append((fan, celebrity))
+    return pairs
+
+
+def generate_graph(params: GraphParams, batch_size: int = 5000) -> List[UUID]:
+    """
+    Записать сгенерированный граф в бд и пересобрать производные таблицы.
+    Возвращает id пользователей в порядке номеров, первые - знаменитости.
+    """
+    rng = random.Random(params.seed)
+    # хэш пароля один на всех, чтобы генерация не упиралась в хэширование
+    password = make_password('benchmark')
+    start = timezone.now() - timedelta(days=365)
+    users = [
+        User(
+            id=UUID(int=rng.getrandbits(128), version=4), username=f'bench{i}', password=password,
+            date_created=start + timedelta(seconds=i),
+        )
+        for i in range(params.users)
+    ]
+    ids = [user.id for user in users]
+    friendships = [
+        Friendship(
+            id=UUID(int=rng.getrandbits(128), version=4), user_from_id=ids[left], user_to_id=ids[right],
+            request_date=start + timedelta(seconds=number),
+        )
+        for number, (left, right) in enumerate(generate_pairs(params, rng))
+    ]
+    use_copy = connection.vendor == 'postgresql'
+    with transaction.atomic():
+        for model, objs in ((User, users), (Friendship, friendships)):
+            for begin in range(0, len(objs), batch_size):
+                insert_chunk(model, objs[begin:begin + batch_size], use_copy)
+    rebuild_edges(batch_size=batch_size)
+    rebuild_suggestions(batch_size=batch_size)
+    return ids
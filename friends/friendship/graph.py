@@ -0,0 +1,397 @@
+"""
+Граф взаимных дружб в памяти процесса для ручек /distance и /degree.
+
+Граф догоняет ленту событий дружбы (FriendshipEvent): он помнит id последнего применённого события
+и при каждом обращении применяет более новые, так что все процессы видят одни и те же изменения,
+в том числе сделанные после сборки снапшота, из которого граф загружен. События разных транзакций
+коммитятся не по порядку id, поэтому пропущенные id ниже последнего применённого
+ещё FRIENDSHIP_GRAPH_GAP_SECONDS перепроверяются. Статусы в событиях абсолютные,
+так что повторно применить уже учтённое событие безопасно.
+"""
+import os
+import mmap
+import time
+import logging
+import struct
+import bisect
+import threading
+from uuid import UUID
+from array import array
+from datetime import timedelta
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+
+from django.db.models import Q
+from django.utils import timezone
+
+from friends import settings
+from .schemas import FriendshipStatus
+from .models import FriendshipEdge, FriendshipEvent
+
+
+MAGIC = b'FGR2'
+# magic, зарезервировано, число вершин, число записей смежности, id последнего учтённого события, время сборки
+HEADER = struct.Struct('<4sIQQQd')
+UUID_SIZE = 16
+# сколько пропущенных id событий отслеживать, больше бывает только при скачке последовательности
+MAX_GAPS = 1000
+
+logger = logging.getLogger('friends.graph')
+
+
+class _UuidColumn:
+    """
+    Отсортированные uuid вершин в буфере снапшота, по 16 байт на вершину.
+    Поиск вершины - бинарный поиск прямо по буферу, без словаря в памяти процесса.
+    """
+
+    def __init__(self, buffer: memoryview, size: int):
+        self._buffer = buffer
+        self._size = size
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index: int) -> bytes:
+        return bytes(self._buffer[index * UUID_SIZE:(index + 1) * UUID_SIZE])
+
+
+class FriendshipGraph:
+    """
+    Снапшот графа дружбы в CSR виде: для вершины i её друзья -
+    neighbors[offsets[i]:offsets[i + 1]]. Вершины - пользователи, у которых есть друзья.
+    Поверх снапшота хранятся изменения, пришедшие после его сборки.
+    event_id - id последнего учтённого события ленты, synced_at - время, на которое граф актуален.
+    """
+
+    def __init__(self, ids: memoryview, offsets: memoryview, neighbors: memoryview,
+                 mtime: Optional[int] = None, keepalive=None, event_id: int = 0, synced_at: float = 0.0):
+        self._ids = _UuidColumn(ids, len(offsets) - 1)
+        self._offsets = offsets
+        self._neighbors = neighbors
+        self.mtime = mtime
+        self._keepalive = keepalive
+        self.event_id = event_id
+        self.synced_at = synced_at
+        self._gaps: Dict[int, float] = {}
+        self._extra_ids: Dict[bytes, int] = {}
+        self._extra_keys: List[bytes] = []
+        self._added: Dict[int, Set[int]] = defaultdict(set)
+        self._removed: Dict[int, Set[int]] = defaultdict(set)
+        # число применённых чтений ленты: чтение, начатое до чужого применения, уже устарело
+        self._version = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_adjacency(cls, adjacency: Dict[UUID, Iterable[UUID]]) -> 'FriendshipGraph':
+        nodes = sorted(node.bytes for node in adjacency)
+        positions = {node: index for index, node in enumerate(nodes)}
+        offsets = array('q', [0])
+        neighbors = array('i')
+        for node in nodes:
+            neighbors.extend(sorted(positions[other.bytes] for other in adjacency[UUID(bytes=node)]))
+            offsets.append(len(neighbors))
+        return cls(memoryview(b''.join(nodes)), memoryview(offsets), memoryview(neighbors))
+
+    @classmethod
+    def build(cls) -> 'FriendshipGraph':
+        """
+        Собрать снапшот по взаимным дружбам из FriendshipEdge.
+        Учтёнными считаются события до последних FRIENDSHIP_GRAPH_GAP_SECONDS: более свежие могли
+        закоммититься уже после чтения дружб, и граф применит их при первом sync.
+        """
+        synced_at = time.time()
+        events = FriendshipEvent.objects.order_by('id').values_list('id', flat=True)
+        event_id = events.reverse().first() or 0
+        recent = events.filter(
+            created__gte=timezone.now() - timedelta(seconds=settings.FRIENDSHIP_GRAPH_GAP_SECONDS)
+        ).first()
+        if recent is not None:
+            event_id = min(event_id, recent - 1)
+
+        adjacency = defaultdict(list)
+        edges = FriendshipEdge.objects.filter(
+            status=FriendshipStatus.FRIENDS.value
+        ).values_list('owner', 'other').order_by()
+        for owner, other in edges.iterator(chunk_size=10000):
+            adjacency[owner].append(other)
+        graph = cls.from_adjacency(adjacency)
+        graph.event_id, graph.synced_at = event_id, synced_at
+        return graph
+
+    def save(self, path: str) -> None:
+        """
+        Записать снапшот в файл. Файл подменяется атомарно, воркеры подхватят его при следующем обращении.
+        """
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, 0, len(self._ids), len(self._neighbors), self.event_id, self.synced_at))
+            file.write(self._ids._buffer)
+            file.write(self._offsets.cast('B'))
+            file.write(self._neighbors.cast('B'))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'FriendshipGraph':
+        """
+        Отобразить снапшот из файла в память. Страницы файла общие для всех процессов, копирования нет.
+        """
+        with open(path, 'rb') as file:
+            mtime = os.fstat(file.fileno()).st_mtime_ns
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, nodes, entries, event_id, synced_at = HEADER.unpack_from(mapped)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a friendship graph snapshot")
+        buffer = memoryview(mapped)
+        ids_end = HEADER.size + nodes * UUID_SIZE
+        offsets_end = ids_end + (nodes + 1) * 8
+        return cls(
+            buffer[HEADER.size:ids_end],
+            buffer[ids_end:offsets_end].cast('q'),
+            buffer[offsets_end:offsets_end + entries * 4].cast('i'),
+            mtime=mtime, keepalive=mapped, event_id=event_id, synced_at=synced_at,
+        )
+
+    def _index(self, user_id: UUID) -> Optional[int]:
+        key = user_id.bytes
+        index = bisect.bisect_left(self._ids, key)
+        if index < len(self._ids) and self._ids[index] == key:
+            return index
+        return self._extra_ids.get(key)
+
+    def _index_or_add(self, user_id: UUID) -> int:
+        index = self._index(user_id)
+        if index is None:
+            index = len(self._ids) + len(self._extra_keys)
+            self._extra_ids[user_id.bytes] = index
+            self._extra_keys.append(user_id.bytes)
+        return index
+
+    def _friends(self, index: int) -> List[int]:
+        if index < len(self._ids):
+            friends = self._neighbors[self._offsets[index]:self._offsets[index + 1]].tolist()
+        else:
+            friends = []
+        removed = self._removed.get(index)
+        if removed:
+            friends = [friend for friend in friends if friend not in removed]
+        added = self._added.get(index)
+        if added:
+            friends.extend(added)
+        return friends
+
+    def _base_has_edge(self, index: int, other: int) -> bool:
+        if index >= len(self._ids):
+            return False
+        start, end = self._offsets[index], self._offsets[index + 1]
+        position = bisect.bisect_left(self._neighbors, other, start, end)
+        return position < end and self._neighbors[position] == other
+
+    def apply_friendship_changes(self, user_id: UUID, gained: Iterable[UUID], lost: Iterable[UUID]) -> None:
+        """
+        Применить поверх снапшота появившиеся и пропавшие дружбы user_id.
+        """
+        with self._lock:
+            for other_id in gained:
+                self._change(user_id, other_id, True)
+            for other_id in lost:
+                self._change(user_id, other_id, False)
+
+    def _change(self, user_id: UUID, other_id: UUID, friends: bool) -> None:
+        index, other = self._index_or_add(user_id), self._index_or_add(other_id)
+        for a, b in ((index, other), (other, index)):
+            if friends:
+                self._discard(self._removed, a, b)
+                if not self._base_has_edge(a, b):
+                    self._added[a].add(b)
+            else:
+                self._discard(self._added, a, b)
+                if self._base_has_edge(a, b):
+                    self._removed[a].add(b)
+
+    @staticmethod
+    def _discard(overlay: Dict[int, Set[int]], a: int, b: int) -> None:
+        edges = overlay.get(a)
+        if edges is not None:
+            edges.discard(b)
+            if not edges:
+                del overlay[a]
+
+    @property
+    def overlay_size(self) -> int:
+        return len(self._added) + len(self._removed)
+
+    def sync(self) -> bool:
+        """
+        Применить события ленты после event_id и перепроверить пропущенные id.
+        False, если граф отстал так, что его проще собрать заново: событий больше FRIENDSHIP_GRAPH_MAX_OVERLAY
+        или он не обновлялся дольше срока хранения событий и сжатие ленты могло удалить нужные.
+        Лента читается без блокировки графа. Если за это время её применил другой поток,
+        прочитанное отбрасывается: более старые события могли бы откатить применённые им.
+        """
+        now = time.time()
+        if now - self.synced_at > settings.FRIENDSHIP_EVENTS_RETENTION_DAYS * 24 * 60 * 60:
+            return False
+        gap_seconds = settings.FRIENDSHIP_GRAPH_GAP_SECONDS
+        limit = settings.FRIENDSHIP_GRAPH_MAX_OVERLAY
+        with self._lock:
+            version, after = self._version, self.event_id
+            gaps = [gap for gap, seen in self._gaps.items() if now - seen < gap_seconds]
+        query = Q(id__gt=after)
+        if gaps:
+            query |= Q(id__in=gaps)
+        rows = list(FriendshipEvent.objects.filter(query).order_by('id').values_list(
+            'id', 'user_id', 'other_id', 'status'
+        )[:limit + 1])
+        if len(rows) > limit:
+            return False
+
+        with self._lock:
+            if self._version != version:
+                return self.overlay_size <= limit
+            self._version += 1
+            self._gaps = {gap: seen for gap, seen in self._gaps.items() if now - seen < gap_seconds}
+            for event_id, user_id, other_id, status in rows:
+                self._gaps.pop(event_id, None)
+                self._change(user_id, other_id, status == FriendshipStatus.FRIENDS.value)
+            new_ids = {row[0] for row in rows if row[0] > after}
+            if new_ids:
+                last = max(new_ids)
+                if last - after - len(new_ids) <= MAX_GAPS:
+                    for gap in range(after + 1, last):
+                        if gap not in new_ids:
+                            self._gaps[gap] = now
+                self.event_id = last
+            self.synced_at = now
+            return self.overlay_size <= limit
+
+    def contains(self, user_id: UUID) -> bool:
+        return self._index(user_id) is not None
+
+    def degree(self, user_id: UUID) -> int:
+        index = self._index(user_id)
+        if index is None:
+            return 0
+        return len(self._friends(index))
+
+    def neighbourhood(self, user_id: UUID, depth: int) -> Dict[UUID, int]:
+        """
+        Пользователи не дальше depth рукопожатий от user_id и расстояния до них.
+        """
+        index = self._index(user_id)
+        if index is None:
+            return {user_id: 0}
+        seen = {index: 0}
+        frontier = [index]
+        for level in range(1, depth + 1):
+            next_frontier = []
+            for node in frontier:
+                for friend in self._friends(node):
+                    if friend not in seen:
+                        seen[friend] = level
+                        next_frontier.append(friend)
+            frontier = next_frontier
+        return {self._uuid(node): level for node, level in seen.items()}
+
+    def _uuid(self, index: int) -> UUID:
+        if index < len(self._ids):
+            return UUID(bytes=self._ids[index])
+        return UUID(bytes=self._extra_keys[index - len(self._ids)])
+
+    def distance(self, user_from: UUID, user_to: UUID, max_depth: int) -> Optional[int]:
+        """
+        Число рукопожатий между пользователями двусторонним BFS, None если дальше max_depth.
+        """
+        if user_from == user_to:
+            return 0
+        start, goal = self._index(user_from), self._index(user_to)
+        if start is None or goal is None:
+            return None
+        seen_from, seen_to = {start: 0}, {goal: 0}
+        frontier_from, frontier_to = [start], [goal]
+        depth_from = depth_to = 0
+        while frontier_from and frontier_to and depth_from + depth_to < max_depth:
+            if len(frontier_from) <= len(frontier_to):
+                depth_from += 1
+                frontier, seen, other_seen, depth = frontier_from, seen_from, seen_to, depth_from
+            else:
+                depth_to += 1
+                frontier, seen, other_seen, depth = frontier_to, seen_to, seen_from, depth_to
+            best = None
+            next_frontier = []
+            for node in frontier:
+                for friend in self._friends(node):
+                    if friend in other_seen:
+                        found = depth + other_seen[friend]
+                        best = found if best is None else min(best, found)
+                    if friend not in seen:
+                        seen[friend] = depth
+                        next_frontier.append(friend)
+            if best is not None:
+                return best if best <= max_depth else None
+            if frontier is frontier_from:
+                frontier_from = next_frontier
+            else:
+                frontier_to = next_frontier
+        return None
+
+
+_graph: Optional[FriendshipGraph] = None
+# mtime снапшота, который уже не догнал ленту: его незачем перечитывать, пока файл не подменят
+_stale_mtime: Optional[int] = None
+# только для пересборки, обычный sync идёт без общей блокировки
+_rebuild_lock = threading.Lock()
+
+
+def _snapshot_mtime(path: Optional[str]) -> Optional[int]:
+    if not path:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def _fresh_graph(path: Optional[str], mtime: Optional[int]) -> FriendshipGraph:
+    """
+    Граф из снапшота, если он догоняет ленту, иначе собранный по бд.
+    """
+    global _stale_mtime
+    if mtime is not None and mtime != _stale_mtime:
+        graph = FriendshipGraph.load(path)
+        if graph.sync():
+            return graph
+        logger.warning("Friendship graph snapshot %s is too far behind the event feed, building the graph "
+                       "from the database until the file is replaced (manage.py build_friendship_graph)", path)
+        _stale_mtime = mtime
+    graph = FriendshipGraph.build()
+    graph.sync()
+    return graph
+
+
+def get_graph() -> FriendshipGraph:
+    """
+    Граф процесса, догнавший ленту событий. Если задан FRIENDSHIP_GRAPH_PATH и файл есть, то он отображается
+    в память и перечитывается, когда файл подменили. Иначе, а также если снапшот слишком старый,
+    граф собирается по бд при первом обращении и заново, если слишком отстал.
+    """
+    global _graph
+    path = settings.FRIENDSHIP_GRAPH_PATH
+    mtime = _snapshot_mtime(path)
+    graph = _graph
+    replaced = mtime is not None and graph is not None and mtime not in (graph.mtime, _stale_mtime)
+    if graph is not None and not replaced and graph.sync():
+        return graph
+    with _rebuild_lock:
+        if _graph is not None and _graph is not graph:
+            # граф уже пересобрал другой поток
+            return _graph
+        _graph = _fresh_graph(path, mtime)
+        return _graph
+
+
+def reset_graph() -> None:
+    global _graph, _stale_mtime
+    with _rebuild_lock:
+        _graph = None
+        _stale_mtime = None
@@ -0,0 +1,285 @@
+"""
+Массовая загрузка пользователей и заявок в друзья из CSV/JSONL.
+Файл читается потоково пачками, каждая пачка пишется одной транзакцией:
+в PostgreSQL через COPY во временную таблицу, в остальных бд через INSERT с пропуском конфликтов.
+Даты из файла пишутся как есть, auto_now_add при загрузке не применяется.
+Повторная вставка уже загруженных строк игнорируется, поэтому после прерывания
+загрузку можно продолжить с последней сохранённой позиции.
+"""
+import io
+import os
+import csv
+import json
+import time
+from uuid import UUID, uuid4
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, models, transaction
+from django.db.models.constants import OnConflict
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from users.models import User
+from .models import Friendship
+
+
+FORMATS = ('csv', 'jsonl')
+
+
+class GraphImportError(ValueError):
+    pass
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        return 'csv'
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    raise GraphImportError(f"Can not detect format of {path}, pass it explicitly")
+
+
+def read_records(path: str, fmt: str, offset: int = 0) -> Iterator[Tuple[int, dict, int]]:
+    """
+    Записи файла начиная с байта offset: (номер строки, запись, позиция после неё).
+    Одна запись - одна строка файла, у csv первая строка - заголовок.
+    """
+    with open(path, 'rb') as file:
+        header = None
+        if fmt == 'csv':
+            header = next(csv.reader([file.readline().decode()]))
+        offset = max(offset, file.tell())
+        file.seek(offset)
+        line_number = 0
+        while True:
+            line = file.readline()
+            if not line:
+                return
+            line_number += 1
+            text = line.decode().strip()
+            if not text:
+                continue
+            try:
+                if header is not None:
+                    record = dict(zip(header, next(csv.reader([text]))))
+                else:
+                    record = json.loads(text)
+                    if not isinstance(record, dict):
+                        raise ValueError("record must be an object")
+            except (ValueError, csv.Error) as e:
+                raise GraphImportError(f"Line {line_number} after offset {offset}: {e}")
+            yield line_number, record, file.tell()
+
+
+def _uuid(record: dict, key: str) -> Optional[UUID]:
+    value = record.get(key)
+    return UUID(str(value)) if value else None
+
+
+def _date(record: dict, key: str, default: datetime) -> datetime:
+    value = record.get(key)
+    if not value:
+        return default
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError(f"{key} is not a datetime")
+    return date if timezone.is_aware(date) else timezone.make_aware(date)
+
+
+def build_users(records: Sequence[dict], executor: Optional[ProcessPoolExecutor] = None) -> List[User]:
+    """
+    Пользователи из записей с полями username и password_hash (уже захэшированный пароль)
+    или password (будет захэширован, если задан executor - в нескольких процессах).
+    Пользователи без пароля не смогут войти.
+    """
+    plain = [None if record.get('password_hash') else record.get('password') or None for record in records]
+    to_hash = [password for password in plain if password is not None]
+    if executor is not None and to_hash:
+        hashed = iter(list(executor.map(make_password, to_hash, chunksize=64)))
+    else:
+        hashed = map(make_password, to_hash)
+
+    now = timezone.now()
+    users = []
+    for record, password in zip(records, plain):
+        username = record.get('username')
+        if not username:
+            raise ValueError("username is required")
+        password_hash = record.get('password_hash')
+        if not password_hash:
+            password_hash = next(hashed) if password is not None else make_password(None)
+        users.append(User(
+            id=_uuid(record, 'id') or uuid4(), username=username, password=password_hash,
+            date_created=_date(record, 'date_created', now),
+        ))
+    return users
+
+
+def build_friendships(records: Sequence[dict]) -> List[Friendship]:
+    """
+    Заявки из записей с полями user_from, user_to и необязательным request_date.
+    Взаимные заявки - это дружба.
+    """
+    now = timezone.now()
+    friendships = []
+    for record in records:
+        user_from, user_to = _uuid(record, 'user_from'), _uuid(record, 'user_to')
+        if user_from is None or user_to is None:
+            raise ValueError("user_from and user_to are required")
+        if user_from == user_to:
+            raise ValueError("user_from and user_to must differ")
+        friendships.append(Friendship(
+            id=_uuid(record, 'id') or uuid4(), user_from_id=user_from, user_to_id=user_to,
+            request_date=_date(record, 'request_date', now),
+        ))
+    return friendships
+
+
+def _copy_insert(model, objs: Sequence[models.Model]) -> None:
+    fields = model._meta.concrete_fields
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for obj in objs:
+        writer.writerow([field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields])
+    buffer.seek(0)
+
+    table = connection.ops.quote_name(model._meta.db_table)
+    staging = connection.ops.quote_name(f'import_{model._meta.db_table}')
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'CREATE TEMPORARY TABLE IF NOT EXISTS {staging} (LIKE {table}) ON COMMIT DROP')
+        cursor.copy_expert(f'COPY {staging} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+        cursor.execute(f'INSERT INTO {table} ({columns}) SELECT {columns} FROM {staging} ON CONFLICT DO NOTHING')
+
+
+def _insert(model, objs: Sequence[models.Model]) -> None:
+    """
+    INSERT значений полей как есть: bulk_create вызывает pre_save и заменил бы даты из файла текущим временем.
+    """
+    fields = model._meta.concrete_fields
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    insert = connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)
+    suffix = connection.ops.on_conflict_suffix_sql(fields, OnConflict.IGNORE, None, None)
+    row = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+    with connection.cursor() as cursor:
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            params = [
+                field.get_db_prep_save(getattr(obj, field.attname), connection) for obj in batch for field in fields
+            ]
+            cursor.execute(f'{insert} {table} ({columns}) VALUES {", ".join([row] * len(batch))} {suffix}', params)
+
+
+def find_missing_reference(model, objs: Sequence[models.Model]) -> Optional[Tuple[int, str]]:
+    """
+    Первая строка пачки, ссылающаяся на несуществующую запись: (индекс в пачке, описание) или None.
+    Без проверки такая строка обрывает вставку пачки IntegrityError без указания строки файла.
+    """
+    for field in model._meta.concrete_fields:
+        if not field.is_relation:
+            continue
+        values = list({getattr(obj, field.attname) for obj in objs} - {None})
+        target = field.related_model._default_manager
+        batch_size = max(connection.ops.bulk_batch_size([field], values), 1)
+        existing = set()
+        for start in range(0, len(values), batch_size):
+            existing.update(target.filter(pk__in=values[start:start + batch_size]).values_list('pk', flat=True))
+        for index, obj in enumerate(objs):
+            value = getattr(obj, field.attname)
+            if value is not None and value not in existing:
+                return index, f"{field.name} {value} does not exist"
+    return None
+
+
+def insert_chunk(model, objs: Sequence[models.Model], use_copy: bool) -> None:
+    """
+    Вставить пачку строк, пропуская уже существующие (по первичному ключу или уникальным полям).
+    """
+    if use_copy:
+        _copy_insert(model, objs)
+    else:
+        _insert(model, objs)
+
+
+class Checkpoint:
+    """
+    Позиция в исходном файле, до которой строки уже записаны в бд.
+    Хранится рядом с файлом и удаляется после успешной загрузки.
+    """
+
+    def __init__(self, source: str):
+        self.path = source + '.progress'
+
+    def load(self) -> Tuple[int, int]:
+        try:
+            with open(self.path) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return 0, 0
+        return data['offset'], data['rows']
+
+    def save(self, offset: int, rows: int) -> None:
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'offset': offset, 'rows': rows}, file)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def import_file(path: str, model, build: Callable[[Sequence[dict]], List[models.Model]],
+                fmt: Optional[str] = None, batch_size: int = 10000, resume: bool = False,
+                use_copy: Optional[bool] = None,
+                progress: Callable[[int, float], None] = None) -> int:
+    """
+    Загрузить файл в таблицу model пачками по batch_size строк.
+    После каждой пачки сохраняется позиция в файле и вызывается progress(строк всего, строк в секунду).
+    Возвращает число обработанных строк файла.
+    """
+    fmt = fmt or detect_format(path)
+    if use_copy is None:
+        use_copy = connection.vendor == 'postgresql'
+    checkpoint = Checkpoint(path)
+    offset, rows = checkpoint.load() if resume else (0, 0)
+
+    started = time.monotonic()
+    imported = 0
+    records, lines, end = [], [], offset
+
+    def flush():
+        nonlocal imported
+        try:
+            objs = build(records)
+        except ValueError as e:
+            # номера строк считаются от позиции, с которой начата загрузка
+            raise GraphImportError(f"{path}: lines {lines[0]}-{lines[-1]} after byte {offset}: {e}")
+        with transaction.atomic():
+            missing = find_missing_reference(model, objs)
+            if missing is not None:
+                index, error = missing
+                raise GraphImportError(f"{path}: line {lines[index]} after byte {offset}: {error}")
+            insert_chunk(model, objs, use_copy)
+        imported += len(records)
+        checkpoint.save(end, rows + imported)
+        if progress is not None:
+            progress(rows + imported, imported / max(time.monotonic() - started, 1e-9))
+
+    for line_number, record, end in read_records(path, fmt, offset):
+        records.append(record)
+        lines.append(line_number)
+        if len(records) >= batch_size:
+            flush()
+            records, lines = [], []
+    if records:
+        flush()
+    checkpoint.clear()
+    return rows + imported
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import (
+    override_settings, setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+
+from friendship import benchmark
+from friendship.generator import GraphParams
+
+
+class Command(BaseCommand):
+    help = (
+        "Сгенерировать граф дружбы во временной тестовой бд, замерить сервисы и ручки "
+        "и сохранить результаты в json. С --baseline сравнивает с прошлым прогоном и находит регрессии"
+    )
+
+    def add_arguments(self, parser):
+        defaults = GraphParams()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--mean-degree', type=float, default=defaults.mean_degree)
+        parser.add_argument('--celebrities', type=int, default=defaults.celebrities)
+        parser.add_argument('--celebrity-fans', type=float, default=defaults.celebrity_fans,
+                            help="доля пользователей, отправивших заявку каждой знаменитости")
+        parser.add_argument('--pending-share', type=float, default=defaults.pending_share,
+                            help="доля неподтверждённых заявок")
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--urls', help="ROOT_URLCONF для замеров ручек, например friends.urls_async")
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--baseline', help="json прошлого прогона для сравнения")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="допустимый относительный рост p95")
+
+    def handle(self, *args, **options):
+        params = GraphParams(
+            users=options['users'], mean_degree=options['mean_degree'], celebrities=options['celebrities'],
+            celebrity_fans=options['celebrity_fans'], pending_share=options['pending_share'], seed=options['seed'],
+        )
+        baseline = benchmark.load_results(options['baseline']) if options['baseline'] else None
+
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            with override_settings(**({'ROOT_URLCONF': options['urls']} if options['urls'] else {})):
+                results = benchmark.run(params, repeat=options['repeat'], progress=self._progress)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        benchmark.save_results(options['output'], results)
+        self.stdout.write(self.style.SUCCESS(f"Saved results to {options['output']}"))
+        for route in results['uncovered_routes']:
+            self.stdout.write(self.style.WARNING(f"Not measured: {route}"))
+
+        if baseline is not None:
+            regressions = benchmark.compare(results, baseline, options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regressions against {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS("No regressions"))
+
+    def _progress(self, name: str, result: dict):
+        self.stdout.write(
+            f"{name}: p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, "
+            f"p99 {result['p99_ms']}ms, {result['queries']} queries"
+        )
@@ -0,0 +1,70 @@
+import time
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.utils import load_backend
+
+from friendship.benchmark import percentile
+
+
+MODES = ('per-request', 'persistent', 'pool')
+
+
+class Command(BaseCommand):
+    help = (
+        "Сравнить цикл соединения с бд на один запрос без пула (новое соединение на запрос), "
+        "с постоянными соединениями (CONN_MAX_AGE) и с пулом соединений"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+        parser.add_argument('--repeat', type=int, default=200, help="запросов на поток")
+        parser.add_argument('--threads', type=int, default=4,
+                            help="потоков, как у воркера gunicorn --threads или пула sync_to_async под ASGI")
+        parser.add_argument('--pool-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        base = dict(settings.DATABASES[options['database']])
+        plain_engine = {pooled: plain for plain, pooled in settings.POOLED_DB_ENGINES.items()}.get(
+            base['ENGINE'], base['ENGINE']
+        )
+        for mode in MODES:
+            settings_dict = dict(base, ENGINE=plain_engine, CONN_MAX_AGE=0 if mode == 'per-request' else None)
+            if mode == 'pool':
+                settings_dict.update(
+                    ENGINE=settings.POOLED_DB_ENGINES[plain_engine], CONN_MAX_AGE=0,
+                    POOL=dict(base.get('POOL') or {}, MAX_SIZE=options['pool_size'] or options['threads']),
+                )
+            timings = sorted(self._run(settings_dict, options['repeat'], options['threads']))
+            self.stdout.write(
+                f"{mode:12} p50={percentile(timings, 0.5) * 1000:.3f}ms "
+                f"p95={percentile(timings, 0.95) * 1000:.3f}ms requests={len(timings)}"
+            )
+
+    @staticmethod
+    def _run(settings_dict: dict, repeat: int, threads: int) -> list:
+        backend = load_backend(settings_dict['ENGINE'])
+        timings = []
+
+        def worker():
+            # у каждого потока своё соединение, как у django.db.connections
+            connection = backend.DatabaseWrapper(dict(settings_dict), 'benchmark')
+            local = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                # то же, что делает обработчик request_finished в конце запроса
+                connection.close_if_unusable_or_obsolete()
+                local.append(time.perf_counter() - started)
+            connection.close()
+            timings.extend(local)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return timings
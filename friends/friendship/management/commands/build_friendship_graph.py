@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from friends import settings
+from friendship.graph import FriendshipGraph
+
+
+class Command(BaseCommand):
+    help = "Собрать снапшот графа дружбы в файл, который воркеры отображают в память"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.FRIENDSHIP_GRAPH_PATH)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not path:
+            raise CommandError("Set FRIENDSHIP_GRAPH_PATH or pass --path")
+        graph = FriendshipGraph.build()
+        graph.save(path)
+        self.stdout.write(self.style.SUCCESS(f"Saved friendship graph to {path}"))
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from friendship.changes import compact_events
+
+
+class Command(BaseCommand):
+    help = "Сжать ленту событий дружбы: удалить перекрытые события и старые надгробия. Запускать по крону"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=settings.FRIENDSHIP_EVENTS_RETENTION_DAYS,
+                            help="Не трогать события моложе стольких дней")
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        superseded, tombstones = compact_events(timedelta(days=options['days']), options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {superseded} superseded friendship events and {tombstones} tombstones"
+        ))
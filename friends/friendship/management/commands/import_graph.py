@@ -0,0 +1,71 @@
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from friends import settings
+from friendship import importer
+from friendship.graph import FriendshipGraph
+from friendship.models import Friendship
+from friendship.services import rebuild_edges
+from friendship.suggestions import rebuild_suggestions
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Загрузить пользователей и заявки в друзья из CSV/JSONL пачками. "
+        "В PostgreSQL используется COPY, после прерывания можно продолжить с --resume"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', help="файл с полями id, username, password или password_hash, date_created")
+        parser.add_argument('--friendships', help="файл с полями user_from, user_to, request_date")
+        parser.add_argument('--format', choices=importer.FORMATS, help="по умолчанию определяется по расширению")
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--resume', action='store_true', help="продолжить с сохранённой позиции")
+        parser.add_argument('--no-copy', action='store_true', help="не использовать COPY даже в PostgreSQL")
+        parser.add_argument('--hash-workers', type=int, default=0,
+                            help="число процессов для хэширования открытых паролей")
+        parser.add_argument('--no-rebuild', action='store_true',
+                            help="не пересобирать статусы дружбы, возможных друзей и снапшот графа после заявок")
+
+    def _progress(self, label: str):
+        def report(rows: int, rate: float):
+            self.stdout.write(f"{label}: {rows} rows, {rate:.0f} rows/s")
+        return report
+
+    def _import(self, label: str, path: str, model, build, options) -> None:
+        try:
+            rows = importer.import_file(
+                path, model, build, fmt=options['format'], batch_size=options['batch_size'],
+                resume=options['resume'], use_copy=False if options['no_copy'] else None,
+                progress=self._progress(label),
+            )
+        except importer.GraphImportError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Imported {rows} {label} from {path}"))
+
+    def handle(self, *args, **options):
+        if not options['users'] and not options['friendships']:
+            raise CommandError("Pass --users and/or --friendships")
+
+        if options['users']:
+            if options['hash_workers'] > 0:
+                with ProcessPoolExecutor(options['hash_workers']) as executor:
+                    build = partial(importer.build_users, executor=executor)
+                    self._import('users', options['users'], User, build, options)
+            else:
+                self._import('users', options['users'], User, importer.build_users, options)
+
+        if options['friendships']:
+            self._import('friendships', options['friendships'], Friendship, importer.build_friendships, options)
+            if not options['no_rebuild']:
+                created = rebuild_edges(batch_size=options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} friendship edges"))
+                created = rebuild_suggestions(batch_size=options['batch_size'])
+                self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} friend suggestions"))
+                # события загрузки воркеры тоже догнали бы, но снапшот, отставший на всю загрузку, проще пересобрать
+                if settings.FRIENDSHIP_GRAPH_PATH:
+                    FriendshipGraph.build().save(settings.FRIENDSHIP_GRAPH_PATH)
+                    self.stdout.write(self.style.SUCCESS(f"Saved friendship graph to {settings.FRIENDSHIP_GRAPH_PATH}"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from friendship.services import rebuild_edges
+from friendship.suggestions import rebuild_suggestions
+
+
+class Command(BaseCommand):
+    help = "Пересобрать денормализованную таблицу статусов дружбы и кэш возможных друзей по заявкам"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        created = rebuild_edges(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} friendship edges"))
+        created = rebuild_suggestions(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {created} friend suggestions"))
@@ -0,0 +1,31 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from friendship.outbox import OutboxWorker, pending_count
+
+
+class Command(BaseCommand):
+    help = "Рассылать уведомления о дружбе из outbox в OUTBOX_SINKS, пока процесс не остановят (SIGTERM/SIGINT)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--concurrency', type=int, default=None, help="Не больше стольких запросов одновременно")
+        parser.add_argument('--poll-interval', type=float, default=None)
+        parser.add_argument('--once', action='store_true', help="Разослать всё готовое к отправке и выйти")
+
+    def handle(self, *args, **options):
+        worker = OutboxWorker(batch_size=options['batch_size'], concurrency=options['concurrency'])
+        if options['once']:
+            counts = worker.drain()
+            self.stdout.write(self.style.SUCCESS(
+                f"Delivered {counts['delivered']} outbox messages, {counts['failed']} failed, "
+                f"{pending_count()} pending"
+            ))
+            return
+
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: worker.stop())
+        self.stdout.write(f"Outbox worker started, {pending_count()} messages pending")
+        worker.run(options['poll_interval'])
+        self.stdout.write("Outbox worker stopped")
@@ -0,0 +1,45 @@
+import signal
+import logging
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from friendship.suggestions import drain, pending_updates
+
+
+logger = logging.getLogger('friends.suggestions')
+
+
+class Command(BaseCommand):
+    help = "Применять изменения дружбы к возможным друзьям, пока процесс не остановят (SIGTERM/SIGINT)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--poll-interval', type=float, default=None)
+        parser.add_argument('--once', action='store_true', help="Применить всё записанное и выйти")
+
+    def handle(self, *args, **options):
+        if options['once']:
+            applied = drain(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Applied {applied} friendship changes to suggestions"))
+            return
+
+        poll_interval = options['poll_interval']
+        if poll_interval is None:
+            poll_interval = settings.SUGGESTIONS_POLL_INTERVAL_SECONDS
+        stop = threading.Event()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda *_: stop.set())
+        self.stdout.write(f"Suggestions worker started, {pending_updates()} changes pending")
+        while not stop.is_set():
+            close_old_connections()
+            try:
+                applied = drain(options['batch_size'])
+            except Exception:
+                logger.exception("Suggestions worker pass failed")
+                applied = 0
+            if not applied:
+                stop.wait(poll_interval)
+        self.stdout.write("Suggestions worker stopped")
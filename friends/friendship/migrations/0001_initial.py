@@ -0,0 +1,35 @@
+# Generated by Django 4.2.1 on 2026-10-18 12:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('request_date', models.DateTimeField(auto_now_add=True)),
+                ('user_from', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outgoing_req', to=settings.AUTH_USER_MODEL)),
+                ('user_to', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='incoming_req', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['user_to', 'user_from'], name='friendship_to_from_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.UniqueConstraint(fields=('user_from', 'user_to'), name='friendship_unique_pair'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.1 on 2026-10-18 07:42
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('friendship', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendshipEdge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('outgoing', 'Outgoing'), ('incoming', 'Incoming'), ('friends', 'Friends')], max_length=8)),
+                ('status_date', models.DateTimeField()),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendship_edges', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'status'], name='friendship_edge_status_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='friendshipedge',
+            constraint=models.UniqueConstraint(fields=('owner', 'other'), name='friendship_edge_unique_pair'),
+        ),
+    ]
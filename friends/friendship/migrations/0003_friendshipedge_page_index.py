@@ -0,0 +1,21 @@
+# Generated by Django 4.2.1 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendship', '0002_friendshipedge'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='friendshipedge',
+            name='friendship_edge_status_idx',
+        ),
+        migrations.AddIndex(
+            model_name='friendshipedge',
+            index=models.Index(fields=['owner', 'status', 'status_date', 'other'], name='friendship_edge_page_idx'),
+        ),
+    ]
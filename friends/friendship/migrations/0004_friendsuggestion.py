@@ -0,0 +1,32 @@
+# Generated by Django 4.2.1 on 2026-10-18 07:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('friendship', '0003_friendshipedge_page_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mutual_count', models.PositiveIntegerField()),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friend_suggestions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-mutual_count', 'candidate'], name='friend_suggestion_rank_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='friendsuggestion',
+            constraint=models.UniqueConstraint(fields=('owner', 'candidate'), name='friend_suggestion_unique_pair'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:01
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_date_created_index'),
+        ('friendship', '0004_friendsuggestion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendshipVersion',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='friendship_version', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('stamp', models.UUIDField(default=uuid.uuid4)),
+            ],
+        ),
+    ]
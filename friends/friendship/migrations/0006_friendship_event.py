@@ -0,0 +1,29 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:54
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('friendship', '0005_friendshipversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FriendshipEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('none', 'None'), ('outgoing', 'Outgoing'), ('incoming', 'Incoming'), ('friends', 'Friends')], max_length=8)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendship_events', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'id'], name='friendship_event_user_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendship', '0006_friendship_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('topic', models.CharField(max_length=64)),
+                ('sink', models.CharField(max_length=64)),
+                ('payload', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, null=True)),
+                ('last_error', models.TextField(blank=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['next_attempt_at', 'id'], name='outbox_message_due_idx')],
+            },
+        ),
+    ]
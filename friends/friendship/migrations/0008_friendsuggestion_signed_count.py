@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('friendship', '0007_outbox_message'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='friendsuggestion',
+            name='mutual_count',
+            field=models.IntegerField(),
+        ),
+    ]
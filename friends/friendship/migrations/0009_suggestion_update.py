@@ -0,0 +1,25 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('friendship', '0008_friendsuggestion_signed_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SuggestionUpdate',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('friends', models.BooleanField()),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
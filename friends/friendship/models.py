@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.utils import timezone
 
 from users.models import User
 
@@ -24,5 +25,236 @@ class Friendship(models.Model):
         auto_now_add=True
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("user_from", "user_to"),
+                name="friendship_unique_pair"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=("user_to", "user_from"),
+                name="friendship_to_from_idx"
+            ),
+        ]
+
     def __str__(self):
         return str(self.id)
+
+
+class FriendshipEdge(models.Model):
+    """
+    Денормализованный статус дружбы owner -> other.
+    Хранится по строке на каждую сторону пары, статус none не хранится.
+    Поддерживается сервисами вместе с Friendship.
+    """
+
+    class Status(models.TextChoices):
+        OUTGOING = "outgoing"
+        INCOMING = "incoming"
+        FRIENDS = "friends"
+
+    owner = models.ForeignKey(
+        User,
+        related_name="friendship_edges",
+        on_delete=models.CASCADE
+    )
+    other = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    status = models.CharField(
+        max_length=8,
+        choices=Status.choices
+    )
+    status_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("owner", "other"),
+                name="friendship_edge_unique_pair"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=("owner", "status", "status_date", "other"),
+                name="friendship_edge_page_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} -> {self.other_id}: {self.status}"
+
+
+class FriendSuggestion(models.Model):
+    """
+    Предрасчитанные кандидаты в друзья: mutual_count общих друзей owner и candidate.
+    Обновляется в фоне по SuggestionUpdate, см. friendship/suggestions.py.
+    """
+
+    owner = models.ForeignKey(
+        User,
+        related_name="friend_suggestions",
+        on_delete=models.CASCADE
+    )
+    candidate = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    # без ограничения снизу: дельты складываются в бд, строка может уйти в минус до удаления в той же транзакции
+    mutual_count = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=("owner", "candidate"),
+                name="friend_suggestion_unique_pair"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=("owner", "-mutual_count", "candidate"),
+                name="friend_suggestion_rank_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} -> {self.candidate_id}: {self.mutual_count}"
+
+
+class SuggestionUpdate(models.Model):
+    """
+    Появившаяся (friends) или пропавшая дружба user и other, ещё не учтённая в FriendSuggestion.
+    Пишется в транзакции изменения, применяется и удаляется фоновым run_suggestions_worker.
+    """
+
+    id = models.BigAutoField(
+        primary_key=True
+    )
+    user = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    other = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    friends = models.BooleanField()
+
+    def __str__(self):
+        return f"{self.id}: {self.user_id} - {self.other_id}: {self.friends}"
+
+
+class FriendshipVersion(models.Model):
+    """
+    Метка версии списков друзей и заявок пользователя, меняется при каждом их изменении.
+    По ней считаются ETag.
+    """
+
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name="friendship_version",
+        on_delete=models.CASCADE
+    )
+    stamp = models.UUIDField(
+        default=uuid.uuid4
+    )
+
+    def __str__(self):
+        return f"{self.user_id}: {self.stamp}"
+
+
+class FriendshipEvent(models.Model):
+    """
+    Журнал изменений дружбы, только на добавление. При каждой смене статуса пары
+    каждая сторона получает событие с новым статусом со своей стороны.
+    По возрастающему id клиенты дочитывают события с последнего увиденного.
+    """
+
+    class Status(models.TextChoices):
+        NONE = "none"
+        OUTGOING = "outgoing"
+        INCOMING = "incoming"
+        FRIENDS = "friends"
+
+    id = models.BigAutoField(
+        primary_key=True
+    )
+    user = models.ForeignKey(
+        User,
+        related_name="friendship_events",
+        on_delete=models.CASCADE
+    )
+    other = models.ForeignKey(
+        User,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    status = models.CharField(
+        max_length=8,
+        choices=Status.choices
+    )
+    created = models.DateTimeField(
+        auto_now_add=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=("user", "id"),
+                name="friendship_event_user_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.user_id} -> {self.other_id}: {self.status}"
+
+
+class OutboxMessage(models.Model):
+    """
+    Исходящее уведомление для внешнего получателя (sink), пишется в той же транзакции, что и изменение дружбы.
+    Доставляется воркером run_outbox_worker и после доставки удаляется.
+    next_attempt_at пустой - сообщение больше не доставляется (ошибка в last_error).
+    """
+
+    id = models.BigAutoField(
+        primary_key=True
+    )
+    topic = models.CharField(
+        max_length=64
+    )
+    sink = models.CharField(
+        max_length=64
+    )
+    payload = models.JSONField()
+    created = models.DateTimeField(
+        auto_now_add=True
+    )
+    attempts = models.PositiveIntegerField(
+        default=0
+    )
+    next_attempt_at = models.DateTimeField(
+        null=True,
+        default=timezone.now
+    )
+    last_error = models.TextField(
+        blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=("next_attempt_at", "id"),
+                name="outbox_message_due_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.id}: {self.topic} -> {self.sink}"
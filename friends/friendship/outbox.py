@@ -0,0 +1,302 @@
+"""
+Уведомления о заявках в друзья через transactional outbox. Запись уведомления - строка OutboxMessage
+в той же транзакции, что и заявка, так что горячий путь записи не ждёт сети, а уведомление
+не теряется и не уходит за откаченную заявку. Получатели - http sinks из OUTBOX_SINKS,
+на каждый sink своя строка со своими повторами.
+
+Воркер (manage.py run_outbox_worker) забирает пачку готовых к отправке сообщений, продлевая им
+next_attempt_at на время аренды, и рассылает их параллельно, не больше OUTBOX_CONCURRENCY запросов сразу.
+Доставленные удаляются, остальные ждут повтора с экспоненциальной задержкой. Если воркер упал
+посреди отправки, сообщения уйдут снова после аренды: доставка "хотя бы один раз", получатель
+отбрасывает повторы по заголовку Idempotency-Key.
+"""
+import json
+import math
+import socket
+import random
+import logging
+import threading
+import http.client
+import urllib.error
+import urllib.request
+from uuid import UUID
+from datetime import timedelta
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from users.models import User
+from .schemas import FriendshipStatus
+from .models import OutboxMessage
+
+
+logger = logging.getLogger('friends.outbox')
+
+# какие новые статусы второй стороны пары о ней сообщают
+NOTIFICATION_TOPICS = {
+    FriendshipStatus.INCOMING: 'friendship.request',
+    FriendshipStatus.FRIENDS: 'friendship.accepted',
+}
+
+
+def _sinks_for(topic: str) -> List[str]:
+    return [
+        name for name, sink in settings.OUTBOX_SINKS.items()
+        if not sink.get('topics') or topic in sink['topics']
+    ]
+
+
+def enqueue_friendship_notifications(user_from: User, statuses: Iterable[Tuple[UUID, FriendshipStatus]]) -> None:
+    """
+    Записать уведомления пользователям, чей статус с user_from изменился: (id пользователя, его новый статус).
+    Вызывается внутри транзакции изменения. Без настроенных sinks ничего не пишет.
+    """
+    if not settings.OUTBOX_SINKS:
+        return
+    messages = []
+    for user_id, status in statuses:
+        topic = NOTIFICATION_TOPICS.get(status)
+        if topic is None:
+            continue
+        payload = {'user_id': str(user_id), 'from_user_id': str(user_from.pk), 'from_username': user_from.username}
+        messages.extend(OutboxMessage(topic=topic, sink=sink, payload=payload) for sink in _sinks_for(topic))
+    if messages:
+        OutboxMessage.objects.bulk_create(messages)
+
+
+def backoff(attempts: int) -> float:
+    """
+    Задержка перед повтором после attempts неудачных попыток, со случайным разбросом вниз до половины.
+    """
+    delay = min(settings.OUTBOX_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1), settings.OUTBOX_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1)
+
+
+class DeliveryError(Exception):
+    def __init__(self, message: str, retry: bool = True):
+        super().__init__(message)
+        self.retry = retry
+
+
+class _Deadline:
+    """
+    Общий срок одной отправки. Таймаут urlopen действует на каждую операцию с сокетом, и sink, отвечающий
+    по байту, растянул бы отправку дольше аренды пачки, поэтому по истечении срока соединение обрывается.
+    """
+
+    def __init__(self, seconds: float):
+        self.expired = False
+        self._sock = None
+        self._lock = threading.Lock()
+        self._timer = threading.Timer(seconds, self._expire)
+        self._timer.daemon = True
+
+    def __enter__(self) -> '_Deadline':
+        self._timer.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._timer.cancel()
+
+    def _shutdown(self) -> None:
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _expire(self) -> None:
+        with self._lock:
+            self.expired = True
+            if self._sock is not None:
+                self._shutdown()
+
+    def watch(self, sock: socket.socket) -> None:
+        with self._lock:
+            self._sock = sock
+            if self.expired:
+                self._shutdown()
+
+    def connection(self, connection_class, *args, **kwargs) -> http.client.HTTPConnection:
+        """
+        Соединение для urllib, сокет которого оборвётся по истечении срока.
+        """
+        conn = connection_class(*args, **kwargs)
+        connect = conn.connect
+
+        def watched_connect():
+            connect()
+            self.watch(conn.sock)
+
+        conn.connect = watched_connect
+        return conn
+
+    def opener(self) -> urllib.request.OpenerDirector:
+        deadline = self
+
+        class Watched:
+            def do_open(self, http_class, req, **http_conn_args):
+                return super().do_open(partial(deadline.connection, http_class), req, **http_conn_args)
+
+        class HTTPHandler(Watched, urllib.request.HTTPHandler):
+            pass
+
+        class HTTPSHandler(Watched, urllib.request.HTTPSHandler):
+            pass
+
+        return urllib.request.build_opener(HTTPHandler, HTTPSHandler)
+
+
+def deliver(message: OutboxMessage) -> None:
+    """
+    Отправить сообщение в его sink, не дольше таймаута sink от начала до конца ответа.
+    DeliveryError с retry=False, если повтор не поможет.
+    """
+    sink = settings.OUTBOX_SINKS.get(message.sink)
+    if sink is None:
+        raise DeliveryError(f"Unknown sink {message.sink}", retry=False)
+    body = json.dumps({
+        'id': message.id, 'topic': message.topic, 'payload': message.payload, 'created': message.created.isoformat(),
+    }).encode()
+    request = urllib.request.Request(sink['url'], data=body, method='POST', headers={
+        'Content-Type': 'application/json', 'Idempotency-Key': f'outbox-{message.id}', **sink.get('headers', {}),
+    })
+    timeout = sink.get('timeout', settings.OUTBOX_HTTP_TIMEOUT_SECONDS)
+    with _Deadline(timeout) as deadline:
+        try:
+            with deadline.opener().open(request, timeout=timeout):
+                pass
+        except urllib.error.HTTPError as exc:
+            # 4xx кроме таймаута и лимита запросов не исправится повтором
+            retry = exc.code >= 500 or exc.code in (408, 429)
+            raise DeliveryError(f"HTTP {exc.code}", retry=retry)
+        except (urllib.error.URLError, OSError, http.client.HTTPException) as exc:
+            if deadline.expired:
+                raise DeliveryError(f"Timed out after {timeout} seconds")
+            raise DeliveryError(str(getattr(exc, 'reason', exc)))
+
+
+def lease_seconds(batch_size: int, concurrency: int) -> float:
+    """
+    Аренда пачки: отправка в худшем случае идёт волнами по concurrency запросов, каждый до таймаута sink,
+    плюс OUTBOX_LEASE_MARGIN_SECONDS на чтение и запись результатов.
+    Иначе медленная пачка переживёт аренду и другой воркер отправит те же сообщения ещё раз.
+    """
+    timeout = max(
+        (sink.get('timeout', settings.OUTBOX_HTTP_TIMEOUT_SECONDS) for sink in settings.OUTBOX_SINKS.values()),
+        default=settings.OUTBOX_HTTP_TIMEOUT_SECONDS,
+    )
+    return math.ceil(batch_size / concurrency) * timeout + settings.OUTBOX_LEASE_MARGIN_SECONDS
+
+
+def _claim(batch_size: int, lease: float) -> List[OutboxMessage]:
+    """
+    Взять готовые к отправке сообщения в аренду на lease секунд: другие воркеры их не возьмут до её конца.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        due = OutboxMessage.objects.filter(next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        messages = list(due[:batch_size])
+        if messages:
+            OutboxMessage.objects.filter(id__in=[message.id for message in messages]).update(
+                next_attempt_at=now + timedelta(seconds=lease)
+            )
+    return messages
+
+
+def _attempt(message: OutboxMessage) -> Optional[DeliveryError]:
+    try:
+        deliver(message)
+    except DeliveryError as exc:
+        return exc
+    except Exception as exc:
+        logger.exception("Outbox message %s delivery crashed", message.id)
+        return DeliveryError(repr(exc))
+    return None
+
+
+class OutboxWorker:
+    """
+    Рассылка outbox: пачками по batch_size, не больше concurrency запросов одновременно.
+    """
+
+    def __init__(self, batch_size: int = None, concurrency: int = None, max_attempts: int = None):
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.concurrency = concurrency or settings.OUTBOX_CONCURRENCY
+        self.max_attempts = max_attempts or settings.OUTBOX_MAX_ATTEMPTS
+        self._stop = threading.Event()
+
+    def _record(self, results: List[Tuple[OutboxMessage, Optional[DeliveryError]]]) -> None:
+        delivered = [message.id for message, error in results if error is None]
+        if delivered:
+            OutboxMessage.objects.filter(id__in=delivered).delete()
+        now = timezone.now()
+        failed = []
+        for message, error in results:
+            if error is None:
+                continue
+            message.attempts += 1
+            message.last_error = str(error)[:1000]
+            if error.retry and message.attempts < self.max_attempts:
+                message.next_attempt_at = now + timedelta(seconds=backoff(message.attempts))
+            else:
+                message.next_attempt_at = None
+                logger.error("Outbox message %s to %s dropped after %s attempts: %s",
+                             message.id, message.sink, message.attempts, error)
+            failed.append(message)
+        if failed:
+            OutboxMessage.objects.bulk_update(failed, ['attempts', 'last_error', 'next_attempt_at'])
+
+    def run_once(self) -> Dict[str, int]:
+        """
+        Разослать одну пачку. Возвращает число доставленных и неудачных сообщений.
+        """
+        messages = _claim(self.batch_size, lease_seconds(self.batch_size, self.concurrency))
+        if not messages:
+            return {'delivered': 0, 'failed': 0}
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(messages))) as executor:
+            results = list(zip(messages, executor.map(_attempt, messages)))
+        self._record(results)
+        failed = sum(1 for _, error in results if error is not None)
+        return {'delivered': len(results) - failed, 'failed': failed}
+
+    def drain(self) -> Dict[str, int]:
+        """
+        Рассылать пачки, пока есть готовые к отправке сообщения.
+        """
+        totals = {'delivered': 0, 'failed': 0}
+        while not self._stop.is_set():
+            counts = self.run_once()
+            for key, value in counts.items():
+                totals[key] += value
+            if sum(counts.values()) < self.batch_size:
+                break
+        return totals
+
+    def run(self, poll_interval: float = None) -> None:
+        """
+        Рассылать, пока не вызван stop. Между пустыми проходами ждёт poll_interval секунд.
+        """
+        poll_interval = settings.OUTBOX_POLL_INTERVAL_SECONDS if poll_interval is None else poll_interval
+        while not self._stop.is_set():
+            # долгоживущий процесс: закрываем сломанные и устаревшие по CONN_MAX_AGE соединения, как после запроса
+            close_old_connections()
+            try:
+                counts = self.drain()
+            except Exception:
+                logger.exception("Outbox worker pass failed")
+                counts = {}
+            if not any(counts.values()):
+                self._stop.wait(poll_interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+def pending_count() -> int:
+    return OutboxMessage.objects.filter(next_attempt_at__isnull=False).count()
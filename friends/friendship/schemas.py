@@ -1,6 +1,11 @@
 from enum import Enum
-from typing import List
+from datetime import datetime
+from uuid import UUID
+from typing import Dict, List, Optional
 from ninja import Schema
+from pydantic import validator
+
+from friends import settings
 
 from users.schemas import UserSchema
 
@@ -12,6 +17,15 @@ class FriendshipStatus(str, Enum):
     FRIENDS: str = "friends"
 
 
+class FriendshipMutationResult(str, Enum):
+    ADDED: str = "added"
+    ALREADY_EXISTS: str = "already_exists"
+    REMOVED: str = "removed"
+    NOTHING_TO_REMOVE: str = "nothing_to_remove"
+    SELF: str = "self"
+    UNKNOWN_USER: str = "unknown_user"
+
+
 class FriendshipStatusSchema(Schema):
     """
     Статусы дружбы: none/outgoing/incoming/friends
@@ -22,3 +36,86 @@ class FriendshipStatusSchema(Schema):
 class FriendshipRequestsSchema(Schema):
     incoming: List[UserSchema]
     outgoing: List[UserSchema]
+    next_cursor: Optional[str] = None
+
+
+class UserIdsSchema(Schema):
+    user_ids: List[UUID]
+
+    @validator('user_ids')
+    def batch_size(cls, v):
+        assert len(v) <= settings.FRIENDSHIP_BATCH_MAX_SIZE, \
+            f'no more than {settings.FRIENDSHIP_BATCH_MAX_SIZE} user ids per request'
+        return v
+
+
+class FriendshipStatusBatchSchema(Schema):
+    """
+    Статусы дружбы по id пользователей и id, которых нет в сервисе
+    """
+    statuses: Dict[str, FriendshipStatus]
+    unknown: List[UUID]
+
+
+class FriendshipBatchResultSchema(Schema):
+    """
+    Результат массового добавления/удаления по id пользователей
+    """
+    results: Dict[str, FriendshipMutationResult]
+
+
+class FriendSuggestionSchema(Schema):
+    id: UUID
+    username: str
+    mutual_count: int
+
+
+class FriendshipDistanceSchema(Schema):
+    """
+    Число рукопожатий между пользователями, null если дальше FRIENDSHIP_GRAPH_MAX_DEPTH
+    """
+    distance: Optional[int]
+
+
+class FriendshipDegreeSchema(Schema):
+    """
+    Число друзей пользователя
+    """
+    degree: int
+
+
+class FriendshipEventSchema(Schema):
+    """
+    Новый статус дружбы с пользователем user_id
+    """
+    id: int
+    user_id: UUID
+    username: str
+    status: FriendshipStatus
+    created: datetime
+
+
+class FriendshipEventsSchema(Schema):
+    """
+    События после after и id последнего из них - after следующего запроса
+    """
+    events: List[FriendshipEventSchema]
+    last_event_id: int
+
+
+class FriendshipChangeSchema(Schema):
+    """
+    Новый статус пользователя в списках, none - его больше нет ни в одном списке
+    """
+    id: UUID
+    username: str
+    status: FriendshipStatus
+
+
+class FriendshipChangesSchema(Schema):
+    """
+    Изменения после токена since, token - since следующего запроса
+    """
+    changes: List[FriendshipChangeSchema]
+    token: str
+    has_more: bool
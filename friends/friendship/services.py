@@ -1,34 +1,317 @@
-from typing import Tuple, List
+import uuid
+from uuid import UUID
+from typing import Dict, Iterable, Optional, Set, Tuple, List
 
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q, QuerySet, Subquery
+from django.utils import timezone
+
+from friends.pagination import (
+    InvalidCursor, clamp_limit, decode_cursor, dump_position, encode_cursor, keyset_page, load_position, paginate
+)
+from auth.principal import UserDeleted
 from users.models import User
-from .schemas import FriendshipStatus
-from .models import Friendship
+from .schemas import FriendshipStatus, FriendshipMutationResult
+from .models import Friendship, FriendshipEdge, FriendshipVersion
+from . import events, outbox, suggestions
 
 
-def get_friendship_status(user_from: User, user_to: User) -> FriendshipStatus:
-    """
-    Получить статус дружбы между двумя пользователями.
-    """
+MIRRORED_STATUS = {
+    FriendshipStatus.NONE: FriendshipStatus.NONE,
+    FriendshipStatus.OUTGOING: FriendshipStatus.INCOMING,
+    FriendshipStatus.INCOMING: FriendshipStatus.OUTGOING,
+    FriendshipStatus.FRIENDS: FriendshipStatus.FRIENDS,
+}
+
+
+def _status_from_requests(exists_outgoing: bool, exists_incoming: bool) -> FriendshipStatus:
     status = FriendshipStatus.NONE
-    exists_outgoing = Friendship.objects.filter(user_from=user_from, user_to=user_to).exists()
-    exists_incoming = Friendship.objects.filter(user_from=user_to, user_to=user_from).exists()
     if exists_incoming and exists_outgoing:
         status = FriendshipStatus.FRIENDS
     elif exists_outgoing:
         status = FriendshipStatus.OUTGOING
     elif exists_incoming:
         status = FriendshipStatus.INCOMING
-
     return status
 
 
+def _pair_requests(user_from: User, user_to: User) -> QuerySet:
+    return Friendship.objects.filter(
+        Q(user_from=user_from, user_to=user_to) | Q(user_from=user_to, user_to=user_from)
+    )
+
+
+def bump_versions(user_ids: Iterable[UUID]) -> None:
+    """
+    Выдать пользователям новые метки версии списков дружбы.
+    """
+    FriendshipVersion.objects.bulk_create(
+        [FriendshipVersion(user_id=user_id, stamp=uuid.uuid4()) for user_id in user_ids],
+        update_conflicts=True, unique_fields=['user'], update_fields=['stamp'],
+    )
+
+
+def friendship_version_queryset(user_id: UUID) -> QuerySet:
+    return FriendshipVersion.objects.filter(user_id=user_id).values_list('stamp', flat=True)
+
+
+def user_with_version_queryset(user_id: UUID) -> QuerySet:
+    """
+    Пользователь с меткой версии его списков дружбы в friendship_stamp:
+    одним запросом и проверка, что пользователь есть, и метка для ETag.
+    """
+    return User.objects.filter(id=user_id).annotate(
+        friendship_stamp=Subquery(FriendshipVersion.objects.filter(user=OuterRef('pk')).values('stamp')[:1])
+    )
+
+
+def get_friendship_version(user_id: UUID) -> Optional[UUID]:
+    """
+    Метка версии списков дружбы пользователя, None если они ещё не менялись.
+    """
+    return friendship_version_queryset(user_id).first()
+
+
+def _lock_user_ids(user_ids: Iterable[UUID]) -> Set[UUID]:
+    """
+    Заблокировать строки пользователей user_ids до конца транзакции по порядку pk. Возвращает id найденных.
+    """
+    users = User.objects.select_for_update(no_key=connection.features.has_select_for_no_key_update)
+    return set(users.filter(id__in=set(user_ids)).order_by('pk').values_list('id', flat=True))
+
+
+def _lock_users(user_from: User, other_ids: Iterable[UUID]) -> Set[UUID]:
+    """
+    Заблокировать строки пользователей до конца транзакции, по порядку pk, чтобы не было взаимоблокировок.
+    Изменения пар с общим пользователем идут по очереди: встречные заявки, отправленные одновременно,
+    иначе не видят друг друга, и _sync_edges записывает устаревший статус. Возвращает id найденных пользователей.
+    UserDeleted, если user_from (пользователь из токена) уже удалён.
+    """
+    locked = _lock_user_ids({user_from.pk, *other_ids})
+    if user_from.pk not in locked:
+        raise UserDeleted(f"User {user_from.pk} no longer exists")
+    return locked
+
+
+def _sync_edges(user_from: User, other_ids: Iterable[UUID]) -> None:
+    """
+    Пересчитать денормализованные статусы пар user_from - other_ids по таблице заявок.
+    Вызывается внутри транзакции, изменившей заявки, только для пар, у которых поменялся статус,
+    пользователи пар должны быть заблокированы _lock_users до чтения заявок.
+    """
+    other_ids = set(other_ids)
+    if not other_ids:
+        return
+    directions = set(Friendship.objects.filter(
+        Q(user_from=user_from, user_to__in=other_ids) | Q(user_from__in=other_ids, user_to=user_from)
+    ).values_list('user_from', 'user_to'))
+
+    was_friends = set(FriendshipEdge.objects.filter(
+        owner=user_from, other__in=other_ids, status=FriendshipStatus.FRIENDS.value
+    ).values_list('other', flat=True))
+
+    now = timezone.now()
+    stale = []
+    edges = []
+    now_friends = set()
+    changes = []
+    for other_id in other_ids:
+        status = _status_from_requests((user_from.pk, other_id) in directions, (other_id, user_from.pk) in directions)
+        changes.append((user_from.pk, other_id, status))
+        changes.append((other_id, user_from.pk, MIRRORED_STATUS[status]))
+        if status == FriendshipStatus.NONE:
+            stale.append(other_id)
+            continue
+        if status == FriendshipStatus.FRIENDS:
+            now_friends.add(other_id)
+        edges.append(FriendshipEdge(owner=user_from, other_id=other_id, status=status.value, status_date=now))
+        edges.append(FriendshipEdge(
+            owner_id=other_id, other=user_from, status=MIRRORED_STATUS[status].value, status_date=now
+        ))
+
+    if stale:
+        FriendshipEdge.objects.filter(
+            Q(owner=user_from, other__in=stale) | Q(owner__in=stale, other=user_from)
+        ).delete()
+    if edges:
+        FriendshipEdge.objects.bulk_create(
+            edges, update_conflicts=True,
+            unique_fields=['owner', 'other'], update_fields=['status', 'status_date'],
+        )
+    bump_versions([user_from.pk, *other_ids])
+    events.record_events(changes)
+    outbox.enqueue_friendship_notifications(
+        user_from, [(user_id, status) for user_id, _, status in changes if user_id != user_from.pk]
+    )
+    gained, lost = now_friends - was_friends, was_friends - now_friends
+    suggestions.record_updates(user_from.pk, gained, lost)
+
+
+def _request_states() -> QuerySet:
+    """
+    Заявки со встречной заявкой и текущими статусами пары в FriendshipEdge с обеих сторон.
+    """
+    counter_request = Friendship.objects.filter(user_from=OuterRef('user_to'), user_to=OuterRef('user_from'))
+    edge = FriendshipEdge.objects.filter(owner=OuterRef('user_from'), other=OuterRef('user_to'))
+    mirrored_edge = FriendshipEdge.objects.filter(owner=OuterRef('user_to'), other=OuterRef('user_from'))
+    return Friendship.objects.annotate(
+        mutual=Exists(counter_request),
+        mutual_date=Subquery(counter_request.values('request_date')[:1]),
+        edge_status=Subquery(edge.values('status')[:1]),
+        mirrored_status=Subquery(mirrored_edge.values('status')[:1]),
+    ).values_list(
+        'user_from_id', 'user_to_id', 'request_date', 'mutual', 'mutual_date', 'edge_status', 'mirrored_status'
+    )
+
+
+def _rebuild_requests_batch(after: Optional[UUID], batch_size: int) -> Tuple[Optional[UUID], int]:
+    """
+    Пересобрать FriendshipEdge по batch_size заявкам после id after одной транзакцией.
+    Пользователи пачки блокируются, как при изменении заявок, и заявки перечитываются уже под блокировкой.
+    Для изменившихся статусов пишутся события, чтобы графы и /changes их увидели.
+    Возвращает id последней заявки пачки (None, если заявок больше нет) и число записанных строк.
+    """
+    with transaction.atomic():
+        requests = Friendship.objects.order_by('id')
+        if after is not None:
+            requests = requests.filter(id__gt=after)
+        batch = list(requests.values_list('id', 'user_from_id', 'user_to_id')[:batch_size])
+        if not batch:
+            return None, 0
+        users = {user_from_id for _, user_from_id, _ in batch} | {user_to_id for _, _, user_to_id in batch}
+        _lock_user_ids(users)
+
+        edges = []
+        changes = []
+        for user_from_id, user_to_id, request_date, mutual, mutual_date, edge_status, mirrored_status in (
+            _request_states().filter(id__in=[row[0] for row in batch])
+        ):
+            if mutual:
+                expected = [(user_from_id, user_to_id, FriendshipStatus.FRIENDS, max(request_date, mutual_date))]
+                current = [edge_status]
+            else:
+                expected = [
+                    (user_from_id, user_to_id, FriendshipStatus.OUTGOING, request_date),
+                    (user_to_id, user_from_id, FriendshipStatus.INCOMING, request_date),
+                ]
+                current = [edge_status, mirrored_status]
+            for (owner_id, other_id, status, status_date), current_status in zip(expected, current):
+                edges.append(FriendshipEdge(
+                    owner_id=owner_id, other_id=other_id, status=status.value, status_date=status_date
+                ))
+                if current_status != status.value:
+                    changes.append((owner_id, other_id, status))
+        FriendshipEdge.objects.bulk_create(
+            edges, update_conflicts=True,
+            unique_fields=['owner', 'other'], update_fields=['status', 'status_date'],
+        )
+        bump_versions(users)
+        events.record_events(changes)
+    return batch[-1][0], len(edges)
+
+
+def _delete_stale_edges_batch(after: int, batch_size: int) -> Optional[int]:
+    """
+    Удалить из batch_size строк FriendshipEdge после id after те, у пар которых не осталось заявок.
+    Возвращает id последней просмотренной строки, None если строк больше нет.
+    """
+    requests = Friendship.objects.filter(
+        Q(user_from=OuterRef('owner'), user_to=OuterRef('other'))
+        | Q(user_from=OuterRef('other'), user_to=OuterRef('owner'))
+    )
+    with transaction.atomic():
+        batch = list(FriendshipEdge.objects.filter(id__gt=after).order_by('id').values_list(
+            'id', 'owner_id', 'other_id'
+        )[:batch_size])
+        if not batch:
+            return None
+        _lock_user_ids({owner_id for _, owner_id, _ in batch} | {other_id for _, _, other_id in batch})
+        stale = list(FriendshipEdge.objects.filter(
+            ~Exists(requests), id__in=[row[0] for row in batch]
+        ).values_list('id', 'owner_id', 'other_id'))
+        if stale:
+            FriendshipEdge.objects.filter(id__in=[row[0] for row in stale]).delete()
+            bump_versions({owner_id for _, owner_id, _ in stale})
+            events.record_events((owner_id, other_id, FriendshipStatus.NONE) for _, owner_id, other_id in stale)
+    return batch[-1][0]
+
+
+def rebuild_edges(batch_size: int = 1000) -> int:
+    """
+    Заново заполнить FriendshipEdge по таблице Friendship: сначала по заявкам записать статусы всех пар,
+    затем удалить строки пар без заявок. Каждая пачка из batch_size строк - своя транзакция,
+    так что пересборка большой таблицы не держит одну транзакцию и блокировки до конца.
+    Для изменившихся статусов пишутся события ленты, уведомления не отправляются.
+    Возвращает количество записанных строк.
+    """
+    written = 0
+    after = None
+    while True:
+        after, count = _rebuild_requests_batch(after, batch_size)
+        if after is None:
+            break
+        written += count
+
+    after = 0
+    while after is not None:
+        after = _delete_stale_edges_batch(after, batch_size)
+    return written
+
+
+def friendship_status_queryset(user_from: User, user_to: User) -> QuerySet:
+    return FriendshipEdge.objects.filter(owner=user_from, other=user_to).values_list('status', flat=True)
+
+
+def get_friendship_status(user_from: User, user_to: User) -> FriendshipStatus:
+    """
+    Получить статус дружбы между двумя пользователями.
+    """
+    status = friendship_status_queryset(user_from, user_to).first()
+    if status is None:
+        return FriendshipStatus.NONE
+    return FriendshipStatus(status)
+
+
+def friendship_statuses_queryset(user_from: User, user_ids: List[UUID]) -> QuerySet:
+    """
+    Пары (id, статус) для найденных пользователей, статус None если связи нет.
+    """
+    edge_status = FriendshipEdge.objects.filter(owner=user_from, other=OuterRef('pk')).values('status')[:1]
+    return User.objects.filter(id__in=user_ids).annotate(
+        status=Subquery(edge_status)
+    ).values_list('id', 'status')
+
+
+def split_friendship_statuses(user_ids: List[UUID],
+                              found: Dict[UUID, Optional[str]]) -> Tuple[Dict[UUID, FriendshipStatus], List[UUID]]:
+    statuses = {
+        user_id: FriendshipStatus(found[user_id] or FriendshipStatus.NONE)
+        for user_id in user_ids if user_id in found
+    }
+    unknown = [user_id for user_id in user_ids if user_id not in found]
+    return statuses, unknown
+
+
+def get_friendship_statuses(user_from: User,
+                            user_ids: Iterable[UUID]) -> Tuple[Dict[UUID, FriendshipStatus], List[UUID]]:
+    """
+    Получить статусы дружбы с несколькими пользователями одним запросом.
+    Возвращает статусы и id, для которых пользователей не нашлось.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    found = dict(friendship_statuses_queryset(user_from, user_ids))
+    return split_friendship_statuses(user_ids, found)
+
+
 def add_to_friends(user_from: User, user_to: User) -> None:
     """
     Добавить пользователя в друзья. Если заявка уже есть, то ничего не произойдёт.
     """
-    exists = Friendship.objects.filter(user_from=user_from, user_to=user_to).exists()
-    if not exists:
-        Friendship.objects.create(user_from=user_from, user_to=user_to)
+    with transaction.atomic():
+        _lock_users(user_from, [user_to.pk])
+        _, created = Friendship.objects.get_or_create(user_from=user_from, user_to=user_to)
+        if created:
+            _sync_edges(user_from, [user_to.pk])
 
 
 def remove_from_friends(user_from: User, user_to: User) -> bool:
@@ -38,61 +321,239 @@ def remove_from_friends(user_from: User, user_to: User) -> bool:
     а затем удаляет из друзей, то заявка на одобрение дружбы тоже удаляется.
     Возвращает false, если ничего не произошло.
     """
-    outgoing_req = Friendship.objects.filter(user_from=user_from, user_to=user_to)
-    if not outgoing_req.exists():
-        return False
+    with transaction.atomic():
+        _lock_users(user_from, [user_to.pk])
+        pair = {req.user_from_id: req for req in _pair_requests(user_from, user_to).select_for_update()}
+        outgoing_req = pair.get(user_from.pk)
+        if outgoing_req is None:
+            return False
 
-    counter_request = Friendship.objects.filter(user_from=user_to, user_to=user_from)
-    if counter_request.exists():
-        if counter_request.get().request_date > outgoing_req.get().request_date:
+        counter_request = pair.get(user_to.pk)
+        if counter_request is not None and counter_request.request_date > outgoing_req.request_date:
             counter_request.delete()
-    outgoing_req.delete()
+        outgoing_req.delete()
+        _sync_edges(user_from, [user_to.pk])
     return True
 
 
+def _split_targets(user_from: User,
+                   user_ids: Iterable[UUID]) -> Tuple[List[UUID], Dict[UUID, FriendshipMutationResult]]:
+    """
+    Отделить существующих пользователей от себя самого и неизвестных id.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    existing = set(User.objects.filter(id__in=user_ids).values_list('id', flat=True))
+    targets = []
+    results = {}
+    for user_id in user_ids:
+        if user_id == user_from.pk:
+            results[user_id] = FriendshipMutationResult.SELF
+        elif user_id not in existing:
+            results[user_id] = FriendshipMutationResult.UNKNOWN_USER
+        else:
+            targets.append(user_id)
+    return targets, results
+
+
+def bulk_add_to_friends(user_from: User, user_ids: Iterable[UUID]) -> Dict[UUID, FriendshipMutationResult]:
+    """
+    Добавить в друзья нескольких пользователей одной транзакцией.
+    Возвращает результат по каждому id.
+    """
+    targets, results = _split_targets(user_from, user_ids)
+    with transaction.atomic():
+        _lock_users(user_from, targets)
+        existing = set(Friendship.objects.filter(
+            user_from=user_from, user_to__in=targets
+        ).values_list('user_to', flat=True))
+        added = [user_id for user_id in targets if user_id not in existing]
+        Friendship.objects.bulk_create(
+            [Friendship(user_from=user_from, user_to_id=user_id) for user_id in added],
+            ignore_conflicts=True,
+        )
+        _sync_edges(user_from, added)
+
+    for user_id in targets:
+        results[user_id] = FriendshipMutationResult.ALREADY_EXISTS if user_id in existing \
+            else FriendshipMutationResult.ADDED
+    return results
+
+
+def bulk_remove_from_friends(user_from: User, user_ids: Iterable[UUID]) -> Dict[UUID, FriendshipMutationResult]:
+    """
+    Удалить из друзей/отменить заявки нескольким пользователям одной транзакцией.
+    Встречная заявка удаляется, если она отправлена позже исходящей, как в remove_from_friends.
+    """
+    targets, results = _split_targets(user_from, user_ids)
+    with transaction.atomic():
+        _lock_users(user_from, targets)
+        outgoing_reqs = Friendship.objects.filter(user_from=user_from, user_to__in=targets)
+        removed = set(outgoing_reqs.select_for_update().values_list('user_to', flat=True))
+        Friendship.objects.filter(
+            Exists(outgoing_reqs.filter(user_to=OuterRef('user_from'), request_date__lt=OuterRef('request_date'))),
+            user_from__in=removed, user_to=user_from,
+        ).delete()
+        outgoing_reqs.filter(user_to__in=removed).delete()
+        _sync_edges(user_from, removed)
+
+    for user_id in targets:
+        results[user_id] = FriendshipMutationResult.REMOVED if user_id in removed \
+            else FriendshipMutationResult.NOTHING_TO_REMOVE
+    return results
+
+
+def edges_queryset(user_from: User, statuses: Iterable[FriendshipStatus]) -> QuerySet:
+    """
+    Строки FriendshipEdge пользователя с нужными статусами вместе с другими пользователями.
+    """
+    return FriendshipEdge.objects.filter(
+        owner=user_from, status__in=[status.value for status in statuses]
+    ).select_related('other').order_by('status_date', 'other_id')
+
+
+def friends_queryset(user_from: User) -> QuerySet:
+    """
+    Строки FriendshipEdge друзей пользователя.
+    """
+    return edges_queryset(user_from, [FriendshipStatus.FRIENDS])
+
+
+# колонки потоковой выгрузки друзей (friends/export.py), как в UserSchema
+FRIEND_EXPORT_FIELDS = {'id': 'other_id', 'username': 'other__username'}
+
+
+def mutual_friends_queryset(user_from: User, user_to: User) -> QuerySet:
+    """
+    Общие друзья двух пользователей: строки FriendshipEdge user_from,
+    у которых other есть и среди друзей user_to.
+    """
+    return edges_queryset(user_from, [FriendshipStatus.FRIENDS]).filter(
+        Exists(FriendshipEdge.objects.filter(
+            owner=user_to, other=OuterRef('other'), status=FriendshipStatus.FRIENDS.value
+        ))
+    )
+
+
 def get_requests_and_friends(user_from) -> Tuple[List[User], List[User], List[User]]:
     """
     Получить входящие/исходящие заявки и друзей пользователя user_from.
     """
-    possible_outgoing_req = Friendship.objects.filter(user_from=user_from)
-    possible_incoming_req = Friendship.objects.filter(user_to=user_from)
-
     outgoing_req = []
     incoming_req = []
     friends = []
+    by_status = {
+        FriendshipStatus.OUTGOING: outgoing_req,
+        FriendshipStatus.INCOMING: incoming_req,
+        FriendshipStatus.FRIENDS: friends,
+    }
 
-    for req in possible_outgoing_req:
-        if Friendship.objects.filter(user_from=req.user_to, user_to=user_from).exists():
-            friends.append(req.user_to)
-        else:
-            outgoing_req.append(req.user_to)
-
-    for req in possible_incoming_req:
-        if not Friendship.objects.filter(user_from=user_from, user_to=req.user_from).exists():
-            incoming_req.append(req.user_from)
+    for edge in edges_queryset(user_from, by_status):
+        by_status[FriendshipStatus(edge.status)].append(edge.other)
 
     return incoming_req, outgoing_req, friends
 
 
+def _edge_users(user_from: User, status: FriendshipStatus) -> List[User]:
+    return [edge.other for edge in edges_queryset(user_from, [status])]
+
+
 def get_friends(user_from) -> List[User]:
     """
     Получить друзей юзера
     """
-    _, _, friends = get_requests_and_friends(user_from)
-    return friends
+    return _edge_users(user_from, FriendshipStatus.FRIENDS)
 
 
 def get_incoming_requests(user_from) -> List[User]:
     """
     Получить входящие заявки
     """
-    incoming, _, _ = get_requests_and_friends(user_from)
-    return incoming
+    return _edge_users(user_from, FriendshipStatus.INCOMING)
 
 
 def get_outgoing_requests(user_from) -> List[User]:
     """
     Получить исходящие заявки
     """
-    _, outgoing, _ = get_requests_and_friends(user_from)
-    return outgoing
+    return _edge_users(user_from, FriendshipStatus.OUTGOING)
+
+
+EDGE_ORDERING = ('status_date', 'other_id')
+# страницы читают из бд только поля UserSchema и ключ сортировки, без экземпляров моделей
+EDGE_PAGE_FIELDS = ('other_id', 'other__username', 'status_date')
+
+
+def edge_page_rows(queryset: QuerySet) -> QuerySet:
+    return queryset.values(*EDGE_PAGE_FIELDS)
+
+
+def edge_page_users(rows: List[dict]) -> List[dict]:
+    """
+    Пользователи из строк страницы в форме UserSchema.
+    """
+    return [{'id': row['other_id'], 'username': row['other__username']} for row in rows]
+
+
+def get_friends_page(user_from: User, cursor: Optional[str] = None,
+                     limit: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Страница друзей юзера и курсор следующей страницы.
+    """
+    rows, next_cursor = paginate(edge_page_rows(friends_queryset(user_from)), EDGE_ORDERING, cursor, limit)
+    return edge_page_users(rows), next_cursor
+
+
+def requests_cursor_positions(cursor: Optional[str]) -> Optional[dict]:
+    """
+    Позиции списков заявок из курсора, None для первой страницы.
+    """
+    positions = decode_cursor(cursor) if cursor else None
+    if positions is not None and not isinstance(positions, dict):
+        raise InvalidCursor("Cursor is not valid")
+    return positions
+
+
+REQUESTS_STATUSES = (FriendshipStatus.INCOMING, FriendshipStatus.OUTGOING)
+
+
+def get_requests_page(user_from: User, cursor: Optional[str] = None,
+                      limit: Optional[int] = None) -> Tuple[List[dict], List[dict], Optional[str]]:
+    """
+    Страница входящих и исходящих заявок и общий курсор следующей страницы.
+    В курсоре хранится позиция каждого списка, у которого ещё есть заявки.
+    """
+    limit = clamp_limit(limit)
+    positions = requests_cursor_positions(cursor)
+
+    pages = {}
+    next_positions = {}
+    for status in REQUESTS_STATUSES:
+        if positions is not None and status.value not in positions:
+            pages[status] = []
+            continue
+        after = load_position(positions[status.value]) if positions is not None else None
+        rows, last = keyset_page(edge_page_rows(edges_queryset(user_from, [status])), EDGE_ORDERING, after, limit)
+        pages[status] = edge_page_users(rows)
+        if last is not None:
+            next_positions[status.value] = dump_position(last)
+
+    next_cursor = encode_cursor(next_positions) if next_positions else None
+    return pages[FriendshipStatus.INCOMING], pages[FriendshipStatus.OUTGOING], next_cursor
+
+
+def get_mutual_friends_page(user_from: User, user_to: User, cursor: Optional[str] = None,
+                            limit: Optional[int] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Страница общих друзей двух пользователей и курсор следующей страницы.
+    """
+    rows, next_cursor = paginate(
+        edge_page_rows(mutual_friends_queryset(user_from, user_to)), EDGE_ORDERING, cursor, limit
+    )
+    return edge_page_users(rows), next_cursor
+
+
+def get_suggestions(user_from: User, limit: Optional[int] = None) -> List[Tuple[User, int]]:
+    """
+    Возможные друзья по убыванию числа общих друзей.
+    """
+    return suggestions.get_suggestions(user_from, clamp_limit(limit))
@@ -0,0 +1,271 @@
+"""
+Кэш возможных друзей FriendSuggestion: число общих друзей для пар друзей друзей.
+Изменение дружбы только записывает SuggestionUpdate, а кэш поправляет фоновый воркер
+(manage.py run_suggestions_worker), так что запрос не платит за число друзей сторон.
+"""
+from uuid import UUID
+from contextlib import contextmanager
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Q, QuerySet
+
+from users.models import User
+from .schemas import FriendshipStatus
+from .models import FriendshipEdge, FriendSuggestion, SuggestionUpdate
+
+
+# ключ advisory lock PostgreSQL, под которым кэш правится и пересобирается
+SUGGESTIONS_LOCK_ID = 0x5e6e57
+
+
+def _friends_of(user_ids: Iterable[UUID]) -> Dict[UUID, Set[UUID]]:
+    friends = defaultdict(set)
+    edges = FriendshipEdge.objects.filter(
+        owner__in=list(user_ids), status=FriendshipStatus.FRIENDS.value
+    ).values_list('owner', 'other')
+    for owner, other in edges:
+        friends[owner].add(other)
+    return friends
+
+
+def record_updates(user_id: UUID, gained: Iterable[UUID], lost: Iterable[UUID]) -> None:
+    """
+    Записать, что user_id подружился с gained и перестал дружить с lost. Вызывается в транзакции изменения:
+    строка на пару, сколько бы друзей ни было у сторон, а FriendSuggestion поправит apply_updates в фоне.
+    """
+    updates = [SuggestionUpdate(user_id=user_id, other_id=other, friends=True) for other in gained]
+    updates += [SuggestionUpdate(user_id=user_id, other_id=other, friends=False) for other in lost]
+    if updates:
+        SuggestionUpdate.objects.bulk_create(updates)
+
+
+@contextmanager
+def _snapshot() -> Iterator[None]:
+    """
+    Транзакция, в которой изменения дружбы и SuggestionUpdate видны на один момент, и только одна за раз:
+    правки кэша считаются по разнице графов, её нельзя применить дважды.
+    """
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [SUGGESTIONS_LOCK_ID])
+        yield
+
+
+def _pair(user_id: UUID, other_id: UUID) -> Tuple[UUID, UUID]:
+    return (user_id, other_id) if user_id < other_id else (other_id, user_id)
+
+
+def _first_states(updates: Iterable[Tuple[UUID, UUID, bool]]) -> Dict[Tuple[UUID, UUID], bool]:
+    """
+    Дружили ли пары до первого из изменений: изменения пишутся только при смене, так что это обратное первому.
+    """
+    states = {}
+    for user_id, other_id, friends in updates:
+        states.setdefault(_pair(user_id, other_id), not friends)
+    return states
+
+
+def _with_states(friends: Dict[UUID, Set[UUID]], states: Dict[Tuple[UUID, UUID], bool]) -> Dict[UUID, Set[UUID]]:
+    """
+    Списки друзей friends, в которых пары states приведены к заданному состоянию.
+    """
+    friends = {user_id: set(others) for user_id, others in friends.items()}
+    for (user_a, user_b), are_friends in states.items():
+        for owner, other in ((user_a, user_b), (user_b, user_a)):
+            if owner not in friends:
+                continue
+            if are_friends:
+                friends[owner].add(other)
+            else:
+                friends[owner].discard(other)
+    return friends
+
+
+def _mutual_paths(friends: Dict[UUID, Set[UUID]], pairs: Iterable[Tuple[UUID, UUID]]) -> Counter:
+    """
+    Вклад путей x - z - y, проходящих через пары pairs, в mutual_count (x, y) и (y, x).
+    Путь через две изменённые пары считается один раз. friends нужны только для концов пар.
+    """
+    paths = set()
+    for user_a, user_b in pairs:
+        if user_b not in friends[user_a]:
+            continue
+        for x, z in ((user_a, user_b), (user_b, user_a)):
+            for y in friends[z]:
+                if y != x:
+                    paths.add((z, *_pair(x, y)))
+    counts = Counter()
+    for _, x, y in paths:
+        counts[(x, y)] += 1
+        counts[(y, x)] += 1
+    return counts
+
+
+def apply_updates(batch_size: int = None) -> int:
+    """
+    Поправить FriendSuggestion по первым batch_size записанным изменениям дружбы.
+    Разница считается между графом до этих изменений и после них: списки друзей концов пар читаются
+    из FriendshipEdge, а изменения, записанные позже, откатываются по тем же SuggestionUpdate.
+    Возвращает число применённых изменений.
+    """
+    batch_size = batch_size or settings.SUGGESTIONS_BATCH_SIZE
+    with _snapshot():
+        return _apply_batch(batch_size)
+
+
+def _apply_batch(batch_size: int) -> int:
+    """
+    apply_updates без своей транзакции: вызывается внутри _snapshot().
+    """
+    batch = list(SuggestionUpdate.objects.order_by('id').values_list('id', 'user_id', 'other_id', 'friends')[
+        :batch_size
+    ])
+    if not batch:
+        return 0
+    updates = [row[1:] for row in batch]
+    users = {user_id for user_id, other_id, _ in updates} | {other_id for _, other_id, _ in updates}
+    later = SuggestionUpdate.objects.filter(
+        Q(user__in=users) | Q(other__in=users), id__gt=batch[-1][0]
+    ).order_by('id').values_list('user_id', 'other_id', 'friends')
+    current = _friends_of(users)
+    after = _with_states({user_id: current[user_id] for user_id in users}, _first_states(later))
+    before_states = _first_states(updates)
+    before = _with_states(after, before_states)
+
+    deltas = _mutual_paths(after, before_states)
+    deltas.subtract(_mutual_paths(before, before_states))
+    _apply_deltas({pair: delta for pair, delta in deltas.items() if delta})
+    ids = [row[0] for row in batch]
+    for start in range(0, len(ids), settings.SUGGESTIONS_BATCH_SIZE):
+        SuggestionUpdate.objects.filter(id__in=ids[start:start + settings.SUGGESTIONS_BATCH_SIZE]).delete()
+    return len(batch)
+
+
+def drain(batch_size: int = None) -> int:
+    """
+    Применять пачки, пока есть записанные изменения. Возвращает их число.
+    """
+    batch_size = batch_size or settings.SUGGESTIONS_BATCH_SIZE
+    applied = 0
+    while True:
+        count = apply_updates(batch_size)
+        applied += count
+        if count < batch_size:
+            return applied
+
+
+def pending_updates() -> int:
+    return SuggestionUpdate.objects.count()
+
+
+def _apply_deltas(deltas: Dict[Tuple[UUID, UUID], int]) -> None:
+    """
+    Прибавить дельты к mutual_count в самой бд пачками, отсутствующие пары создать, ушедшие в ноль удалить.
+    """
+    if not deltas:
+        return
+    meta = FriendSuggestion._meta
+    fields = [meta.get_field('owner'), meta.get_field('candidate'), meta.get_field('mutual_count')]
+    table = connection.ops.quote_name(meta.db_table)
+    owner, candidate, mutual_count = (connection.ops.quote_name(field.column) for field in fields)
+    pairs = list(deltas)
+    batch_size = connection.ops.bulk_batch_size(fields, pairs) or len(pairs)
+    with connection.cursor() as cursor:
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            values = ', '.join(['(%s, %s, %s)'] * len(batch))
+            params = []
+            for pair_owner, pair_candidate in batch:
+                params += [
+                    fields[0].get_db_prep_value(pair_owner, connection),
+                    fields[1].get_db_prep_value(pair_candidate, connection),
+                    deltas[(pair_owner, pair_candidate)],
+                ]
+            cursor.execute(
+                f'INSERT INTO {table} ({owner}, {candidate}, {mutual_count}) VALUES {values} '
+                f'ON CONFLICT ({owner}, {candidate}) '
+                f'DO UPDATE SET {mutual_count} = {table}.{mutual_count} + EXCLUDED.{mutual_count}',
+                params,
+            )
+            emptied = Q()
+            for pair_owner, candidates in _by_owner(batch).items():
+                emptied |= Q(owner=pair_owner, candidate__in=candidates)
+            FriendSuggestion.objects.filter(emptied, mutual_count__lte=0).delete()
+
+
+def _by_owner(pairs: Iterable[Tuple[UUID, UUID]]) -> Dict[UUID, List[UUID]]:
+    by_owner = defaultdict(list)
+    for pair_owner, candidate in pairs:
+        by_owner[pair_owner].append(candidate)
+    return by_owner
+
+
+def _mutual_counts() -> QuerySet:
+    """
+    Число общих друзей для всех пар пользователей, у которых они есть.
+    """
+    return FriendshipEdge.objects.filter(
+        status=FriendshipStatus.FRIENDS.value,
+        other__friendship_edges__status=FriendshipStatus.FRIENDS.value,
+    ).annotate(
+        candidate=F('other__friendship_edges__other')
+    ).exclude(
+        candidate=F('owner')
+    ).values('owner', 'candidate').annotate(mutual_count=Count('id'))
+
+
+def compute_suggestions(user: User) -> QuerySet:
+    """
+    Кандидаты в друзья, посчитанные прямо по FriendshipEdge, без кэша.
+    Уже друзья и пользователи с заявками исключаются.
+    """
+    connected = FriendshipEdge.objects.filter(owner=user).values('other')
+    return _mutual_counts().filter(owner=user).exclude(
+        candidate__in=connected
+    ).order_by('-mutual_count', 'candidate')
+
+
+def rebuild_suggestions(batch_size: int = 1000) -> int:
+    """
+    Заново заполнить FriendSuggestion по FriendshipEdge пачками по batch_size владельцев, каждая - своя транзакция.
+    Перед пересборкой пачки применяются записанные изменения: после неё кэш всех владельцев соответствует
+    одному моменту, и более поздние изменения применятся к нему обычным порядком.
+    Возвращает количество созданных строк.
+    """
+    created = 0
+    after = None
+    while True:
+        with _snapshot():
+            while _apply_batch(batch_size) >= batch_size:
+                pass
+            owners = User.objects.order_by('id')
+            if after is not None:
+                owners = owners.filter(id__gt=after)
+            owners = list(owners.values_list('id', flat=True)[:batch_size])
+            if not owners:
+                return created
+            after = owners[-1]
+            FriendSuggestion.objects.filter(owner__in=owners).delete()
+            created += len(FriendSuggestion.objects.bulk_create(
+                FriendSuggestion(owner_id=row['owner'], candidate_id=row['candidate'], mutual_count=row['mutual_count'])
+                for row in _mutual_counts().filter(owner__in=owners).order_by()
+            ))
+
+
+def suggestions_queryset(user: User, limit: int) -> QuerySet:
+    """
+    Кандидаты в друзья из кэша по убыванию числа общих друзей.
+    """
+    connected = FriendshipEdge.objects.filter(owner=user, other=OuterRef('candidate'))
+    return FriendSuggestion.objects.filter(owner=user).filter(
+        ~Exists(connected)
+    ).select_related('candidate').order_by('-mutual_count', 'candidate_id')[:limit]
+
+
+def get_suggestions(user: User, limit: int) -> List[Tuple[User, int]]:
+    return [(suggestion.candidate, suggestion.mutual_count) for suggestion in suggestions_queryset(user, limit)]
@@ -1,50 +1,193 @@
-from typing import List, Optional
+from uuid import UUID
+from typing import List
 
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from ninja import Router
 
 from auth.jwt import AuthBearer
 from auth.schemas import Message
+from friends import settings
+from friends.conditional import check_version_etag
+from friends.rendering import trusted_response
+from friends.export import export_format, stream_export
 
 from users.models import User
-from users.schemas import UserSchema
-from .schemas import FriendshipStatusSchema, FriendshipRequestsSchema
+from users.schemas import UserPageSchema
+from .schemas import (
+    FriendshipStatusSchema, FriendshipRequestsSchema, FriendshipStatusBatchSchema, FriendshipBatchResultSchema,
+    FriendSuggestionSchema, FriendshipDistanceSchema, FriendshipDegreeSchema, FriendshipEventsSchema,
+    FriendshipChangesSchema, UserIdsSchema
+)
+from .graph import get_graph
 
-from . import services
+from . import changes, events, services
 
 
 friends = Router(tags=["friends"])
 
 
-@friends.get('/myfriends', auth=AuthBearer(), response={200: Optional[List[UserSchema]], 401: Message})
-def get_my_friends(request):
+@friends.get('/myfriends', auth=AuthBearer(), response={200: UserPageSchema, 400: Message, 401: Message})
+def get_my_friends(request, response: HttpResponse, cursor: str = None, limit: int = None):
     """
-    Получить список своих друзей
+    Получить список своих друзей.
+    Поддерживает If-None-Match: если список не менялся, то вернётся 304.
     """
-    user = request.auth
-    return services.get_friends(user)
+    user = request.auth.reference
+    not_modified = check_version_etag(request, response, services.get_friendship_version(user.pk))
+    if not_modified:
+        return not_modified
+    items, next_cursor = services.get_friends_page(user, cursor, limit)
+    return trusted_response(request, response, {"items": items, "next_cursor": next_cursor})
 
 
-@friends.get('/requests', auth=AuthBearer(), response={200: FriendshipRequestsSchema, 401: Message},
+@friends.get('/requests', auth=AuthBearer(), response={200: FriendshipRequestsSchema, 400: Message, 401: Message},
              summary="Get Incoming And Outgoing Requests")
-def get_requests(request):
+def get_requests(request, response: HttpResponse, cursor: str = None, limit: int = None):
     """
-    Получить входящие и исходящие заявки
+    Получить входящие и исходящие заявки.
+    Поддерживает If-None-Match: если заявки не менялись, то вернётся 304.
     """
-    user = request.auth
-    incoming = services.get_incoming_requests(user)
-    outgoing = services.get_outgoing_requests(user)
-    return FriendshipRequestsSchema(incoming=incoming, outgoing=outgoing)
+    user = request.auth.reference
+    not_modified = check_version_etag(request, response, services.get_friendship_version(user.pk))
+    if not_modified:
+        return not_modified
+    incoming, outgoing, next_cursor = services.get_requests_page(user, cursor, limit)
+    return trusted_response(request, response, {"incoming": incoming, "outgoing": outgoing, "next_cursor": next_cursor})
 
 
-@friends.get('/{user_id}/all', response=List[UserSchema],
+@friends.get('/suggestions', auth=AuthBearer(), response={200: List[FriendSuggestionSchema], 401: Message},
+             summary="Get People You May Know")
+def get_friend_suggestions(request, limit: int = None):
+    """
+    Получить возможных друзей: друзья друзей по убыванию числа общих друзей.
+    Друзья и пользователи с заявками не попадают в список.
+    """
+    user = request.auth.reference
+    return [
+        FriendSuggestionSchema(id=candidate.id, username=candidate.username, mutual_count=mutual_count)
+        for candidate, mutual_count in services.get_suggestions(user, limit)
+    ]
+
+
+@friends.post('/status:batch', auth=AuthBearer(),
+              response={200: FriendshipStatusBatchSchema, 401: Message, 422: Message},
+              summary="Get Friendship Statuses With Many Users")
+def get_friendship_statuses(request, data: UserIdsSchema):
+    """
+    Получить статусы дружбы с несколькими пользователями сразу.
+    Id, которых нет в сервисе, возвращаются в unknown.
+    """
+    user_from = request.auth.reference
+    statuses, unknown = services.get_friendship_statuses(user_from, data.user_ids)
+    return FriendshipStatusBatchSchema(
+        statuses={str(user_id): status for user_id, status in statuses.items()}, unknown=unknown
+    )
+
+
+@friends.get('/events', auth=AuthBearer(),
+             response={200: FriendshipEventsSchema, 401: Message, 406: Message},
+             summary="Wait For Friendship Changes")
+def get_friendship_events(request, response: HttpResponse, after: int = None, timeout: float = None):
+    """
+    Длинный опрос ленты изменений дружбы: события после after (или Last-Event-ID),
+    а если их нет - первые, пришедшие за timeout секунд. Без after ждёт событий после запроса.
+    Под WSGI ожидание занимает воркер, поэтому не дольше EVENTS_WSGI_MAX_WAIT_SECONDS (по умолчанию ответ сразу),
+    ждать и получать Server-Sent Events нужно от ASGI приложения.
+    """
+    if events.SSE in request.headers.get('Accept', ''):
+        return 406, {"detail": "Server-Sent Events are served by the ASGI application only"}
+    user = request.auth.reference
+    if after is None:
+        after = events.parse_last_event_id(request.headers.get('Last-Event-ID'))
+    items, last_id = events.wait_for_events(
+        user.pk, after, events.clamp_wait(timeout, settings.EVENTS_WSGI_MAX_WAIT_SECONDS)
+    )
+    return trusted_response(request, response, {"events": items, "last_event_id": last_id})
+
+
+@friends.get('/changes', auth=AuthBearer(),
+             response={200: FriendshipChangesSchema, 400: Message, 401: Message, 410: Message},
+             summary="Get Friend List Changes Since Sync Token")
+def get_friendship_changes(request, response: HttpResponse, since: str = None):
+    """
+    Изменения своих друзей и заявок после токена since: по строке на пользователя с новым статусом,
+    none - пользователь пропал из всех списков. Без since вернёт только токен: его нужно взять до загрузки списков.
+    Если has_more, то за следующими изменениями нужно прийти с новым токеном сразу.
+    На просроченный токен отвечает 410: списки нужно скачать заново.
+    """
+    user = request.auth.reference
+    try:
+        items, token, has_more = changes.get_changes(user.pk, since)
+    except changes.SyncTokenExpired as exc:
+        return 410, {"detail": str(exc)}
+    return trusted_response(request, response, {"changes": items, "token": token, "has_more": has_more})
+
+
+@friends.get('/{user_id}/all', response={200: UserPageSchema, 400: Message, 404: Message},
              summary="Get User's Friends By His Id")
-def get_user_friends_by_id(request, user_id):
+def get_user_friends_by_id(request, response: HttpResponse, user_id, cursor: str = None, limit: int = None):
+    """
+    Получить друзей пользователя user_id.
+    Поддерживает If-None-Match: если список не менялся, то вернётся 304.
+    С Accept: application/x-ndjson или text/csv отдаёт всех друзей потоком, без страниц.
     """
-    Получить друзей пользователя user_id
+    media_type = export_format(request)
+    if media_type is not None:
+        user = get_object_or_404(User, id=user_id)
+        return stream_export(services.friends_queryset(user), services.FRIEND_EXPORT_FIELDS, media_type)
+    user = get_object_or_404(services.user_with_version_queryset(user_id))
+    not_modified = check_version_etag(request, response, user.friendship_stamp)
+    if not_modified:
+        return not_modified
+    items, next_cursor = services.get_friends_page(user, cursor, limit)
+    return trusted_response(request, response, {"items": items, "next_cursor": next_cursor})
+
+
+@friends.get('/{user_id}/mutual', auth=AuthBearer(),
+             response={200: UserPageSchema, 400: Message, 401: Message, 404: Message},
+             summary="Get Mutual Friends With Another User By His Id")
+def get_mutual_friends_by_id(request, response: HttpResponse, user_id, cursor: str = None, limit: int = None):
     """
-    user = get_object_or_404(User, id=user_id)
-    return services.get_friends(user)
+    Получить общих друзей с пользователем user_id
+    """
+    user_from = request.auth.reference
+    user_to = get_object_or_404(User, id=user_id)
+    items, next_cursor = services.get_mutual_friends_page(user_from, user_to, cursor, limit)
+    return trusted_response(request, response, {"items": items, "next_cursor": next_cursor})
+
+
+def _graph_user_exists(graph, user_id: UUID) -> bool:
+    """
+    В графе только пользователи с друзьями, остальных проверяем по бд.
+    """
+    return graph.contains(user_id) or User.objects.filter(id=user_id).exists()
+
+
+@friends.get('/{user_id}/distance/{other_id}', response={200: FriendshipDistanceSchema, 404: Message},
+             summary="Get Degree Of Separation Between Two Users")
+def get_distance_by_ids(request, user_id: UUID, other_id: UUID):
+    """
+    Получить число рукопожатий между пользователями user_id и other_id
+    """
+    graph = get_graph()
+    for checked_id in (user_id, other_id):
+        if not _graph_user_exists(graph, checked_id):
+            return 404, {"detail": "No User matches the given query."}
+    distance = graph.distance(user_id, other_id, settings.FRIENDSHIP_GRAPH_MAX_DEPTH)
+    return FriendshipDistanceSchema(distance=distance)
+
+
+@friends.get('/{user_id}/degree', response={200: FriendshipDegreeSchema, 404: Message},
+             summary="Get User's Friends Count By His Id")
+def get_degree_by_id(request, user_id: UUID):
+    """
+    Получить число друзей пользователя user_id
+    """
+    graph = get_graph()
+    if not _graph_user_exists(graph, user_id):
+        return 404, {"detail": "No User matches the given query."}
+    return FriendshipDegreeSchema(degree=graph.degree(user_id))
 
 
 @friends.get('/{user_id}/status', auth=AuthBearer(),
@@ -54,7 +197,7 @@ def get_friendship_status_by_id(request, user_id):
     """
     Получить статус дружбы с пользователем user_id
     """
-    user_from = request.auth
+    user_from = request.auth.reference
     user_to = get_object_or_404(User, id=user_id)
     status = services.get_friendship_status(user_from, user_to)
     return FriendshipStatusSchema(status=status)
@@ -66,7 +209,7 @@ def add_friend_by_id(request, user_id):
     """
     Добавить пользователя user_id в друзья
     """
-    user_from = request.auth
+    user_from = request.auth.reference
     user_to = get_object_or_404(User, id=user_id)
     if user_from.id == user_to.id:
         return 400, {"detail": "Nah you can't add yourself in friends"}
@@ -79,8 +222,32 @@ def remove_friend_by_id(request, user_id):
     """
     Удалить пользователя user_id из друзей/отменить исходящую заявку в друзья.
     """
-    user_from = request.auth
+    user_from = request.auth.reference
     user_to = get_object_or_404(User, id=user_id)
     if not services.remove_from_friends(user_from, user_to):
         return 404, {"detail": "This user is not in friends and you have no outgoing request to him"}
     return 200, {"detail": "ok"}
+
+
+@friends.post('/add:batch', auth=AuthBearer(),
+              response={200: FriendshipBatchResultSchema, 401: Message, 422: Message},
+              summary="Add Many Users In Friends")
+def add_friends_batch(request, data: UserIdsSchema):
+    """
+    Добавить в друзья нескольких пользователей одной транзакцией
+    """
+    user_from = request.auth.reference
+    results = services.bulk_add_to_friends(user_from, data.user_ids)
+    return FriendshipBatchResultSchema(results={str(user_id): result for user_id, result in results.items()})
+
+
+@friends.post('/remove:batch', auth=AuthBearer(),
+              response={200: FriendshipBatchResultSchema, 401: Message, 422: Message},
+              summary="Remove Many Users From Friends")
+def remove_friends_batch(request, data: UserIdsSchema):
+    """
+    Удалить из друзей/отменить заявки нескольким пользователям одной транзакцией
+    """
+    user_from = request.auth.reference
+    results = services.bulk_remove_from_friends(user_from, data.user_ids)
+    return FriendshipBatchResultSchema(results={str(user_id): result for user_id, result in results.items()})
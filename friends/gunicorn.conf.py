@@ -0,0 +1,24 @@
+"""
+Настройки gunicorn. Файл подхватывается автоматически, если gunicorn запущен из этой папки.
+"""
+import os
+import shutil
+
+
+# у uvicorn-воркеров (Dockerfile) timeout - только пульс event loop процесса, долгие ответы он не обрывает.
+# Синхронный воркер (friends.wsgi) убивается, если один ответ, в том числе потоковая выгрузка, идёт дольше timeout
+timeout = 30
+
+
+def on_starting(server):
+    # метрики прошлого запуска не должны попасть в сумму по воркерам
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def child_exit(server, worker):
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,10 +1,17 @@
 import pytest
 from typing import Tuple
 
+from django.core.management import call_command
+from django.db import connections
 from django.test import Client
 
+from auth.principal import user_cache
 from users import models as user_models
 from friendship import models as friendship_models
+from friendship import services as friendship_services
+from friendship.graph import reset_graph
+from friendship.events import reset_hub
+from users.search import reset_index
 
 from .data_samples import USERS
 
@@ -18,10 +25,84 @@ class FixtureUtils:
         return new_user
 
     def create_friendship_request(user_from, user_to):
-        new_friendship = friendship_models.Friendship.objects.create(
-            user_from=user_from, user_to=user_to
-        )
-        return new_friendship
+        friendship_services.add_to_friends(user_from, user_to)
+        return friendship_models.Friendship.objects.get(user_from=user_from, user_to=user_to)
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache():
+    """
+    Кэш пользователей живёт в процессе, чистим его между тестами
+    """
+    user_cache.clear()
+    yield
+    user_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def clear_friendship_graph():
+    """
+    Граф дружбы тоже живёт в процессе
+    """
+    reset_graph()
+    yield
+    reset_graph()
+
+
+@pytest.fixture(autouse=True)
+def clear_search_index():
+    """
+    И индекс поиска пользователей
+    """
+    reset_index()
+    yield
+    reset_index()
+
+
+@pytest.fixture(autouse=True)
+def clear_event_hub(settings):
+    """
+    И ожидание событий дружбы, опрос бд в тестах частый
+    """
+    settings.EVENTS_POLL_INTERVAL_SECONDS = 0.01
+    reset_hub()
+    yield
+    reset_hub()
+
+
+@pytest.fixture(autouse=True)
+def strict_sql(settings):
+    """
+    В тестах повторяющиеся запросы к бд (N+1) роняют запрос к api
+    """
+    settings.SQL_STRICT_MODE = True
+
+
+@pytest.fixture(autouse=True)
+def no_replicas(settings):
+    """
+    Тестовая бд реплики - зеркало основной, в тестах всё читается из основной, кроме тестов с фикстурой replica
+    """
+    settings.DATABASE_REPLICAS = []
+
+
+@pytest.fixture()
+def replica(settings, tmp_path) -> str:
+    """
+    Отдельная sqlite бд в роли реплики: в ней только схема, без данных основной бд,
+    так что по ответам видно, откуда шло чтение
+    """
+    alias = 'test_replica'
+    connections.settings[alias] = connections.configure_settings({
+        'default': connections.settings['default'],
+        alias: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': str(tmp_path / 'replica.sqlite3')},
+    })[alias]
+    call_command('migrate', database=alias, verbosity=0)
+    settings.DATABASE_REPLICAS = [alias]
+    yield alias
+    connections[alias].close()
+    del connections[alias]
+    del connections.settings[alias]
 
 
 @pytest.fixture()
@@ -0,0 +1,215 @@
+import json
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+
+from friendship import schemas as friendship_schemas
+
+
+class SyncAsyncClient:
+    """
+    AsyncClient, который можно звать из синхронных тестов
+    """
+
+    def __init__(self, headers: dict = None):
+        self._client = AsyncClient()
+        self._headers = headers or {}
+
+    async def _request(self, method: str, *args, headers: dict = None, **kwargs):
+        headers = {**self._headers, **(headers or {})}
+        return await getattr(self._client, method)(*args, headers=headers, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return async_to_sync(self._request)('get', *args, **kwargs)
+
+    def post(self, *args, **kwargs):
+        return async_to_sync(self._request)('post', *args, **kwargs)
+
+
+@pytest.fixture()
+def async_client() -> SyncAsyncClient:
+    return SyncAsyncClient()
+
+
+@pytest.fixture()
+def async_auth_client_user1(async_client, user1) -> SyncAsyncClient:
+    response = async_client.post('/api/v1/auth/login', user1[0])
+    return SyncAsyncClient(headers={'Authorization': 'Bearer ' + response.json().get('access_token')})
+
+
+@pytest.mark.urls('friends.urls_async')
+class TestAsyncApi:
+    @pytest.mark.django_db
+    def test_register_and_whoami(self, async_client):
+        data = {'username': 'asyncuser', 'password': 'amogus11'}
+        response = async_client.post('/api/v1/auth/register', data)
+        assert response.status_code == 200
+        response = async_client.post('/api/v1/auth/register', data)
+        assert response.status_code == 409
+
+        response = async_client.post('/api/v1/auth/login', data)
+        assert response.status_code == 200
+        header = {'Authorization': 'Bearer ' + response.json().get('access_token')}
+        response = async_client.get('/api/v1/auth/whoami', headers=header)
+        assert response.status_code == 200
+        assert response.json().get('username') == data.get('username')
+
+        response = async_client.get('/api/v1/auth/whoami')
+        assert response.status_code == 401
+
+    @pytest.mark.django_db
+    def test_refresh(self, async_client, user1):
+        refresh = async_client.post('/api/v1/auth/login', user1[0]).json().get('refresh_token')
+        response = async_client.post('/api/v1/auth/refresh', {'refresh_token': refresh})
+        assert response.status_code == 200
+        new_refresh = response.json().get('refresh_token')
+
+        response = async_client.post('/api/v1/auth/refresh', {'refresh_token': refresh})
+        assert response.status_code == 401
+        response = async_client.post('/api/v1/auth/logout', {'refresh_token': new_refresh})
+        assert response.status_code == 401
+
+    @pytest.mark.django_db
+    def test_users(self, async_client, user1, user2):
+        response = async_client.get('/api/v1/users')
+        assert response.status_code == 200
+        assert len(response.json().get('items')) == 2
+
+        response = async_client.get('/api/v1/users/' + user1[1].username)
+        assert response.status_code == 200
+        assert response.json().get('id') == str(user1[1].id)
+
+        response = async_client.get('/api/v1/users/amogusamogussugoma')
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_friendship_flow(self, async_auth_client_user1, user1, user2, user3, user4,
+                             friendship_req_u2_u1, friendship_req_u4_u1):
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        client = async_auth_client_user1
+
+        response = client.post(f'/api/v1/friends/{user2_in_db.id}/add')
+        assert response.status_code == 200
+        response = client.post(f'/api/v1/friends/{user3_in_db.id}/add')
+        assert response.status_code == 200
+
+        response = client.get(f'/api/v1/friends/{user2_in_db.id}/status')
+        assert response.json().get('status') == friendship_schemas.FriendshipStatus.FRIENDS
+
+        response = client.get('/api/v1/friends/myfriends')
+        assert [x.get('username') for x in response.json().get('items')] == [user2_in_db.username]
+
+        response = client.get('/api/v1/friends/requests')
+        assert [x.get('username') for x in response.json().get('incoming')] == [user4[1].username]
+        assert [x.get('username') for x in response.json().get('outgoing')] == [user3_in_db.username]
+
+        payload = {'user_ids': [str(user2_in_db.id), str(user3_in_db.id)]}
+        response = client.post('/api/v1/friends/status:batch', payload, content_type='application/json')
+        assert response.json().get('statuses') == {
+            str(user2_in_db.id): friendship_schemas.FriendshipStatus.FRIENDS,
+            str(user3_in_db.id): friendship_schemas.FriendshipStatus.OUTGOING,
+        }
+
+        response = client.post(f'/api/v1/friends/{user3_in_db.id}/remove')
+        assert response.status_code == 200
+        response = client.post(f'/api/v1/friends/{user3_in_db.id}/remove')
+        assert response.status_code == 404
+
+        response = client.get(f'/api/v1/friends/{user2_in_db.id}/degree')
+        assert response.json().get('degree') == 1
+
+    @pytest.mark.django_db
+    def test_export(self, async_client, user1, user2, friendship_req_u1_u2, friendship_req_u2_u1):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+
+        async def read(url: str) -> bytes:
+            response = await AsyncClient().get(url, headers={'Accept': 'application/x-ndjson'})
+            assert response.streaming
+            # асинхронный поток: синхронный итератор под ASGI Django сначала прочитал бы целиком в память
+            assert response.is_async
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        lines = async_to_sync(read)('/api/v1/users').decode().splitlines()
+        assert len(lines) == 2
+        lines = async_to_sync(read)(f'/api/v1/friends/{user1_in_db.id}/all').decode().splitlines()
+        assert [json.loads(line) for line in lines] == [{'id': str(user2_in_db.id), 'username': user2_in_db.username}]
+
+    @pytest.mark.django_db
+    def test_events(self, settings, async_auth_client_user1, user1, user2, friendship_req_u2_u1):
+        _, user2_in_db = user2
+        response = async_auth_client_user1.get('/api/v1/friends/events?after=0&timeout=0')
+        assert response.status_code == 200
+        last_event_id = response.json().get('last_event_id')
+        assert [item['status'] for item in response.json().get('events')] == [
+            friendship_schemas.FriendshipStatus.INCOMING,
+        ]
+
+        response = async_auth_client_user1.post(f'/api/v1/friends/{user2_in_db.id}/add')
+        assert response.status_code == 200
+        settings.EVENTS_STREAM_SECONDS = 0
+
+        async def read() -> bytes:
+            response = await AsyncClient().get('/api/v1/friends/events', headers={
+                **async_auth_client_user1._headers, 'Accept': 'text/event-stream', 'Last-Event-ID': str(last_event_id),
+            })
+            assert response.streaming
+            assert response['Content-Type'] == 'text/event-stream'
+            return b''.join([chunk async for chunk in response.streaming_content])
+
+        messages = async_to_sync(read)().decode().split('\n\n')
+        assert messages[0] == 'retry: 3000'
+        event_id, event_type, data = messages[1].split('\n')
+        assert event_id == f'id: {last_event_id + 1}'
+        assert event_type == 'event: friendship'
+        assert json.loads(data.removeprefix('data: ')).get('status') == friendship_schemas.FriendshipStatus.FRIENDS
+
+    @pytest.mark.django_db
+    def test_changes(self, async_auth_client_user1, user1, user2):
+        _, user2_in_db = user2
+        token = async_auth_client_user1.get('/api/v1/friends/changes').json().get('token')
+        async_auth_client_user1.post(f'/api/v1/friends/{user2_in_db.id}/add')
+        response = async_auth_client_user1.get('/api/v1/friends/changes', {'since': token})
+        assert response.status_code == 200
+        assert [item['status'] for item in response.json().get('changes')] == [
+            friendship_schemas.FriendshipStatus.OUTGOING,
+        ]
+
+    @pytest.mark.django_db
+    def test_deleted_user_token(self, async_auth_client_user1, user1, user2):
+        _, user2_in_db = user2
+        user1[1].delete()
+        response = async_auth_client_user1.post(f'/api/v1/friends/{user2_in_db.id}/add')
+        assert response.status_code == 401
+
+    @pytest.mark.django_db
+    def test_not_modified(self, async_auth_client_user1, user1, user2, friendship_req_u1_u2, friendship_req_u2_u1):
+        _, user1_in_db = user1
+        client = async_auth_client_user1
+
+        for url in ('/api/v1/friends/myfriends', f'/api/v1/friends/{user1_in_db.id}/all',
+                    f'/api/v1/users/{user1_in_db.username}'):
+            response = client.get(url)
+            assert response.status_code == 200
+            response = client.get(url, headers={'If-None-Match': response['ETag']})
+            assert response.status_code == 304
+
+    @pytest.mark.django_db
+    def test_query_headers(self, async_client, user1):
+        response = async_client.get('/api/v1/users')
+        assert response.status_code == 200
+        assert response['X-DB-Queries'] == '1'
+
+    @pytest.mark.django_db
+    def test_replica_read_your_writes(self, async_auth_client_user1, user1, user2, replica):
+        _, user2_in_db = user2
+        client = async_auth_client_user1
+        response = client.get(f'/api/v1/friends/{user2_in_db.id}/status')
+        assert response.status_code == 404
+
+        response = client.post(f'/api/v1/friends/{user2_in_db.id}/add')
+        assert response.status_code == 200
+        response = client.get(f'/api/v1/friends/{user2_in_db.id}/status')
+        assert response.status_code == 200
+        assert response.json().get('status') == friendship_schemas.FriendshipStatus.OUTGOING
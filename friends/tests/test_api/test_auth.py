@@ -3,7 +3,8 @@ from freezegun import freeze_time
 from datetime import datetime, timedelta
 
 from users import models as user_models
-from friends.settings import JWT_LIVE_TIME_MINUTES
+from auth.jwt import create_access_token
+from friends.settings import JWT_LIVE_TIME_MINUTES, JWT_REFRESH_LIVE_TIME_DAYS
 
 
 class TestAuthApi:
@@ -70,3 +71,74 @@ class TestAuthApi:
         ):
             response = client.get('/api/v1/auth/whoami', **header)
             assert response.status_code == 401
+
+    @pytest.mark.django_db
+    def test_whoami_without_queries(self, auth_client_user1, user1, django_assert_num_queries):
+        with django_assert_num_queries(0):
+            response = auth_client_user1.get('/api/v1/auth/whoami')
+        assert response.status_code == 200
+        assert response.json().get('id') == str(user1[1].id)
+
+    @pytest.mark.django_db
+    def test_token_without_username(self, client, user1, django_assert_num_queries):
+        _, user_in_db = user1
+        token, _ = create_access_token({"user_id": str(user_in_db.id)})
+        header = {'HTTP_AUTHORIZATION': 'Bearer ' + token}
+
+        with django_assert_num_queries(1):
+            response = client.get('/api/v1/auth/whoami', **header)
+        assert response.status_code == 200
+        assert response.json().get('username') == user_in_db.username
+
+        with django_assert_num_queries(0):
+            response = client.get('/api/v1/auth/whoami', **header)
+        assert response.status_code == 200
+
+    @pytest.mark.django_db
+    def test_refresh_rotation(self, client, user1, django_assert_num_queries):
+        user_data, user_in_db = user1
+        response = client.post('/api/v1/auth/login', user_data)
+        first_refresh = response.json().get('refresh_token')
+
+        # refresh токен не подходит как access
+        response = client.get('/api/v1/auth/whoami', HTTP_AUTHORIZATION='Bearer ' + first_refresh)
+        assert response.status_code == 401
+
+        with django_assert_num_queries(1):
+            response = client.post('/api/v1/auth/refresh', {'refresh_token': first_refresh})
+        assert response.status_code == 200
+        second_refresh = response.json().get('refresh_token')
+        assert second_refresh != first_refresh
+        response = client.get('/api/v1/auth/whoami',
+                              HTTP_AUTHORIZATION='Bearer ' + response.json().get('access_token'))
+        assert response.json().get('id') == str(user_in_db.id)
+
+        # повторное использование старого токена отзывает всю цепочку
+        response = client.post('/api/v1/auth/refresh', {'refresh_token': first_refresh})
+        assert response.status_code == 401
+        response = client.post('/api/v1/auth/refresh', {'refresh_token': second_refresh})
+        assert response.status_code == 401
+        assert not user_models.RefreshTokenFamily.objects.exists()
+
+    @pytest.mark.django_db
+    def test_refresh_logout_and_expire(self, client, user1):
+        user_data, _ = user1
+        other_refresh = client.post('/api/v1/auth/login', user_data).json().get('refresh_token')
+        refresh = client.post('/api/v1/auth/login', user_data).json().get('refresh_token')
+
+        response = client.post('/api/v1/auth/logout', {'refresh_token': refresh})
+        assert response.status_code == 200
+        response = client.post('/api/v1/auth/refresh', {'refresh_token': refresh})
+        assert response.status_code == 401
+
+        response = client.post('/api/v1/auth/refresh', {'refresh_token': other_refresh})
+        assert response.status_code == 200
+
+        response = client.post('/api/v1/auth/refresh', {'refresh_token': 'not.a.token'})
+        assert response.status_code == 401
+
+        with freeze_time(datetime.now() + timedelta(days=JWT_REFRESH_LIVE_TIME_DAYS, seconds=1)):
+            response = client.post('/api/v1/auth/refresh', {'refresh_token': other_refresh})
+            assert response.status_code == 401
+            client.post('/api/v1/auth/login', user_data)
+        assert user_models.RefreshTokenFamily.objects.count() == 1
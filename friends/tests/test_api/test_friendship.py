@@ -1,6 +1,12 @@
+import csv
 import pytest
+from uuid import uuid4
 
 from users import models as user_models
+from friends import settings
+from friends.settings import FRIENDSHIP_BATCH_MAX_SIZE
+from friends.pagination import encode_cursor
+from friendship import events, services, suggestions
 from friendship import (
     schemas as friendship_schemas,
     models as friendship_models
@@ -12,14 +18,14 @@ class TestFriendshipApi:
     def test_my_friends_empty(self, auth_client_user1, friendship_req_u1_u3, friendship_req_u4_u1):
         response = auth_client_user1.get('/api/v1/friends/myfriends')
         assert response.status_code == 200
-        assert len(response.json()) == 0
+        assert len(response.json().get('items')) == 0
 
     @pytest.mark.django_db
     def test_my_friends(self, auth_client_user1, friendship_req_u1_u2,
                         friendship_req_u2_u1, friendship_req_u1_u3):
         response = auth_client_user1.get('/api/v1/friends/myfriends')
         assert response.status_code == 200
-        assert len(response.json()) == 1
+        assert len(response.json().get('items')) == 1
 
     @pytest.mark.django_db
     def test_requests(self, auth_client_user1, friendship_req_u1_u2,
@@ -39,8 +45,8 @@ class TestFriendshipApi:
                                friendship_req_u1_u2, friendship_req_u2_u1, friendship_req_u1_u3):
         def check_user_is_only_friend(user2: user_models.User, response):
             assert response.status_code == 200
-            assert len(response.json()) == 1
-            assert response.json()[0].get('username') == user2.username
+            assert len(response.json().get('items')) == 1
+            assert response.json().get('items')[0].get('username') == user2.username
 
         _, user1_in_db = user1
         _, user2_in_db = user2
@@ -51,6 +57,20 @@ class TestFriendshipApi:
         response = client.get('/api/v1/friends/' + str(user2_in_db.id) + '/all')
         check_user_is_only_friend(user1_in_db, response)
 
+    @pytest.mark.django_db
+    def test_export_users_friends(self, client, user1, user2, user3, friendship_req_u1_u2, friendship_req_u2_u1,
+                                  friendship_req_u1_u3):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        response = client.get('/api/v1/friends/' + str(user1_in_db.id) + '/all', HTTP_ACCEPT='text/csv')
+        assert response.status_code == 200
+        assert response.streaming
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        assert rows == [['id', 'username'], [str(user2_in_db.id), user2_in_db.username]]
+
+        response = client.get('/api/v1/friends/' + str(uuid4()) + '/all', HTTP_ACCEPT='text/csv')
+        assert response.status_code == 404
+
     @pytest.mark.django_db
     def test_get_friendship_status(self, auth_client_user1, user1, user2, user3, user4, user5,
                                    friendship_req_u1_u2, friendship_req_u2_u1, friendship_req_u1_u3,
@@ -134,3 +154,250 @@ class TestFriendshipApi:
         response = auth_client_user1.get('/api/v1/friends/' + str(user2_in_db.id) + '/status')
         assert response.status_code == 200
         assert response.json().get('status') == friendship_schemas.FriendshipStatus.NONE
+
+    @pytest.mark.django_db
+    def test_requests_pages(self, auth_client_user1, user1, user2, user3, user4, user5,
+                            friendship_req_u1_u2, friendship_req_u1_u3, friendship_req_u4_u1):
+        response = auth_client_user1.get('/api/v1/friends/requests', {'limit': 1})
+        assert response.status_code == 200
+        assert len(response.json().get('incoming')) == 1
+        assert len(response.json().get('outgoing')) == 1
+        cursor = response.json().get('next_cursor')
+        assert cursor
+
+        response = auth_client_user1.get('/api/v1/friends/requests', {'limit': 1, 'cursor': cursor})
+        assert response.status_code == 200
+        assert response.json().get('incoming') == []
+        assert len(response.json().get('outgoing')) == 1
+        assert response.json().get('next_cursor') is None
+
+    @pytest.mark.django_db
+    def test_my_friends_pages(self, auth_client_user1, user1, user2, user3,
+                              friendship_req_u1_u2, friendship_req_u2_u1, friendship_req_u1_u3):
+        _, user3_in_db = user3
+        services.add_to_friends(user3_in_db, user1[1])
+
+        response = auth_client_user1.get('/api/v1/friends/myfriends', {'limit': 1})
+        first_page = response.json()
+        params = {'limit': 1, 'cursor': first_page.get('next_cursor')}
+        response = auth_client_user1.get('/api/v1/friends/myfriends', params)
+        second_page = response.json()
+
+        usernames = {x.get('username') for x in first_page.get('items') + second_page.get('items')}
+        assert usernames == {user2[1].username, user3_in_db.username}
+        assert second_page.get('next_cursor') is None
+
+    @pytest.mark.django_db
+    def test_batch_status(self, auth_client_user1, user1, user2, user3, user4, user5,
+                          friendship_req_u1_u2, friendship_req_u2_u1, friendship_req_u1_u3,
+                          friendship_req_u4_u1, django_assert_num_queries):
+        users = [user[1] for user in (user1, user2, user3, user4, user5)]
+        unknown_id = str(uuid4())
+        payload = {'user_ids': [str(user.id) for user in users] + [unknown_id]}
+
+        with django_assert_num_queries(1):
+            response = auth_client_user1.post('/api/v1/friends/status:batch', payload,
+                                              content_type='application/json')
+        assert response.status_code == 200
+        statuses = response.json().get('statuses')
+        assert [statuses[str(user.id)] for user in users] == [
+            friendship_schemas.FriendshipStatus.NONE,
+            friendship_schemas.FriendshipStatus.FRIENDS,
+            friendship_schemas.FriendshipStatus.OUTGOING,
+            friendship_schemas.FriendshipStatus.INCOMING,
+            friendship_schemas.FriendshipStatus.NONE,
+        ]
+        assert response.json().get('unknown') == [unknown_id]
+
+    @pytest.mark.django_db
+    def test_batch_status_too_many(self, auth_client_user1):
+        payload = {'user_ids': [str(uuid4()) for _ in range(FRIENDSHIP_BATCH_MAX_SIZE + 1)]}
+        response = auth_client_user1.post('/api/v1/friends/status:batch', payload,
+                                          content_type='application/json')
+        assert response.status_code == 422
+
+    @pytest.mark.django_db
+    def test_batch_add_and_remove(self, auth_client_user1, user1, user2, user3):
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        payload = {'user_ids': [str(user2_in_db.id), str(user3_in_db.id)]}
+
+        response = auth_client_user1.post('/api/v1/friends/add:batch', payload, content_type='application/json')
+        assert response.status_code == 200
+        assert response.json().get('results') == {
+            str(user2_in_db.id): friendship_schemas.FriendshipMutationResult.ADDED,
+            str(user3_in_db.id): friendship_schemas.FriendshipMutationResult.ADDED,
+        }
+        response = auth_client_user1.get('/api/v1/friends/requests')
+        assert len(response.json().get('outgoing')) == 2
+
+        response = auth_client_user1.post('/api/v1/friends/remove:batch', payload, content_type='application/json')
+        assert response.status_code == 200
+        assert set(response.json().get('results').values()) == {friendship_schemas.FriendshipMutationResult.REMOVED}
+        response = auth_client_user1.get('/api/v1/friends/requests')
+        assert response.json().get('outgoing') == []
+
+    @pytest.mark.django_db
+    def test_mutual_friends(self, auth_client_user1, user1, user2, user3, user4):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        _, user4_in_db = user4
+        for user in (user1_in_db, user4_in_db):
+            for friend in (user2_in_db, user3_in_db):
+                services.add_to_friends(user, friend)
+                services.add_to_friends(friend, user)
+        services.remove_from_friends(user4_in_db, user3_in_db)
+        suggestions.drain()
+
+        response = auth_client_user1.get('/api/v1/friends/' + str(user4_in_db.id) + '/mutual')
+        assert response.status_code == 200
+        assert [x.get('username') for x in response.json().get('items')] == [user2_in_db.username]
+
+        response = auth_client_user1.get('/api/v1/friends/suggestions')
+        assert response.status_code == 200
+        assert response.json() == [{'id': str(user4_in_db.id), 'username': user4_in_db.username, 'mutual_count': 1}]
+
+        response = auth_client_user1.get('/api/v1/friends/' + str(uuid4()) + '/mutual')
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_distance_and_degree(self, client, user1, user2, user5, friendship_req_u1_u2, friendship_req_u2_u1):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user5_in_db = user5
+
+        response = client.get(f'/api/v1/friends/{user1_in_db.id}/distance/{user2_in_db.id}')
+        assert response.status_code == 200
+        assert response.json().get('distance') == 1
+
+        response = client.get(f'/api/v1/friends/{user1_in_db.id}/distance/{user5_in_db.id}')
+        assert response.status_code == 200
+        assert response.json().get('distance') is None
+
+        response = client.get(f'/api/v1/friends/{user1_in_db.id}/degree')
+        assert response.status_code == 200
+        assert response.json().get('degree') == 1
+
+        response = client.get(f'/api/v1/friends/{user5_in_db.id}/degree')
+        assert response.status_code == 200
+        assert response.json().get('degree') == 0
+
+        response = client.get(f'/api/v1/friends/{uuid4()}/degree')
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_my_friends_not_modified(self, auth_client_user1, user1, user2, django_assert_num_queries,
+                                     friendship_req_u1_u2, friendship_req_u2_u1):
+        _, user2_in_db = user2
+        response = auth_client_user1.get('/api/v1/friends/myfriends')
+        assert response.status_code == 200
+        etag = response['ETag']
+
+        with django_assert_num_queries(1):
+            response = auth_client_user1.get('/api/v1/friends/myfriends', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response['ETag'] == etag
+
+        response = auth_client_user1.get('/api/v1/friends/requests', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+        response = auth_client_user1.post('/api/v1/friends/' + str(user2_in_db.id) + '/remove')
+        assert response.status_code == 200
+        response = auth_client_user1.get('/api/v1/friends/myfriends', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+        assert len(response.json().get('items')) == 0
+
+    @pytest.mark.django_db
+    def test_get_users_friends_not_modified(self, client, user1, user2, user5, django_assert_num_queries,
+                                            friendship_req_u1_u2, friendship_req_u2_u1):
+        _, user1_in_db = user1
+        _, user5_in_db = user5
+        response = client.get('/api/v1/friends/' + str(user1_in_db.id) + '/all')
+        etag = response['ETag']
+        with django_assert_num_queries(1):
+            response = client.get('/api/v1/friends/' + str(user1_in_db.id) + '/all', HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+
+        # у пользователя без метки версии списков (не менялись или загружены без rebuild_edges) ETag нет
+        response = client.get('/api/v1/friends/' + str(user5_in_db.id) + '/all', HTTP_IF_NONE_MATCH='*')
+        assert response.status_code == 200
+        assert 'ETag' not in response
+
+        response = client.get('/api/v1/friends/' + str(uuid4()) + '/all', HTTP_IF_NONE_MATCH='*')
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_events(self, auth_client_user1, user1, user2, friendship_req_u2_u1):
+        _, user2_in_db = user2
+        response = auth_client_user1.get('/api/v1/friends/events?after=0&timeout=0')
+        assert response.status_code == 200
+        items = response.json().get('events')
+        assert [(item['user_id'], item['username'], item['status']) for item in items] == [
+            (str(user2_in_db.id), user2_in_db.username, friendship_schemas.FriendshipStatus.INCOMING),
+        ]
+        last_event_id = response.json().get('last_event_id')
+        assert last_event_id == items[-1]['id']
+
+        response = auth_client_user1.get('/api/v1/friends/events?timeout=0.05')
+        assert response.json() == {'events': [], 'last_event_id': last_event_id}
+
+        response = auth_client_user1.post('/api/v1/friends/' + str(user2_in_db.id) + '/add')
+        assert response.status_code == 200
+        response = auth_client_user1.get('/api/v1/friends/events?timeout=0', HTTP_LAST_EVENT_ID=str(last_event_id))
+        assert [item['status'] for item in response.json().get('events')] == [
+            friendship_schemas.FriendshipStatus.FRIENDS,
+        ]
+
+        response = auth_client_user1.get('/api/v1/friends/events', HTTP_ACCEPT='text/event-stream')
+        assert response.status_code == 406
+        response = auth_client_user1.get('/api/v1/friends/events', HTTP_AUTHORIZATION='')
+        assert response.status_code == 401
+
+    @pytest.mark.django_db
+    def test_events_wait_is_capped(self, auth_client_user1, monkeypatch):
+        waits = []
+        monkeypatch.setattr(events, 'wait_for_events', lambda user_id, after, timeout: waits.append(timeout) or ([], 0))
+        # под WSGI ждущий клиент занимает воркер: по умолчанию ответ сразу, ждать - на ASGI
+        auth_client_user1.get('/api/v1/friends/events?timeout=60')
+        auth_client_user1.get('/api/v1/friends/events')
+        assert waits == [0, 0]
+
+        monkeypatch.setattr(settings, 'EVENTS_WSGI_MAX_WAIT_SECONDS', 0.05)
+        auth_client_user1.get('/api/v1/friends/events?timeout=60')
+        assert waits == [0, 0, 0.05]
+
+    @pytest.mark.django_db
+    def test_changes(self, auth_client_user1, user1, user2, friendship_req_u1_u2):
+        _, user2_in_db = user2
+        response = auth_client_user1.get('/api/v1/friends/changes')
+        assert response.status_code == 200
+        assert response.json().get('changes') == []
+        token = response.json().get('token')
+
+        services.remove_from_friends(user1[1], user2_in_db)
+        response = auth_client_user1.get('/api/v1/friends/changes', {'since': token})
+        assert response.status_code == 200
+        assert response.json().get('changes') == [
+            {'id': str(user2_in_db.id), 'username': user2_in_db.username, 'status': 'none'},
+        ]
+        assert response.json().get('has_more') is False
+
+        response = auth_client_user1.get('/api/v1/friends/changes', {'since': 'garbage'})
+        assert response.status_code == 400
+        response = auth_client_user1.get('/api/v1/friends/changes', {'since': encode_cursor([1, 0])})
+        assert response.status_code == 410
+
+    @pytest.mark.django_db
+    def test_deleted_user_token(self, auth_client_user1, user1, user2):
+        _, user2_in_db = user2
+        user1[1].delete()
+
+        response = auth_client_user1.post('/api/v1/friends/' + str(user2_in_db.id) + '/add')
+        assert response.status_code == 401
+        response = auth_client_user1.post('/api/v1/friends/add:batch', {'user_ids': [str(user2_in_db.id)]},
+                                          content_type='application/json')
+        assert response.status_code == 401
+        assert not friendship_models.Friendship.objects.exists()
@@ -0,0 +1,126 @@
+import pytest
+from io import StringIO
+from datetime import timedelta
+from django.core.management import call_command
+from django.utils import timezone
+
+from users import models as user_models
+from friendship import models as friendship_models
+from tests.test_api.test_async import SyncAsyncClient
+
+
+KEY = {'HTTP_IDEMPOTENCY_KEY': 'retry-1'}
+
+
+class TestIdempotencyApi:
+    @pytest.mark.django_db
+    def test_remove_retry_is_replayed(self, auth_client_user1, user2, friendship_req_u1_u2):
+        _, user2_in_db = user2
+        url = '/api/v1/friends/' + str(user2_in_db.id) + '/remove'
+        response = auth_client_user1.post(url, **KEY)
+        assert response.status_code == 200
+        assert 'Idempotent-Replayed' not in response
+
+        # ответ на первую попытку потерялся, повтор получает тот же ответ, а не 404
+        response = auth_client_user1.post(url, **KEY)
+        assert response.status_code == 200
+        assert response.json() == {'detail': 'ok'}
+        assert response['Idempotent-Replayed'] == 'true'
+
+        response = auth_client_user1.post(url)
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_replay_is_single_lookup(self, auth_client_user1, user2, django_assert_num_queries):
+        _, user2_in_db = user2
+        url = '/api/v1/friends/' + str(user2_in_db.id) + '/add'
+        assert auth_client_user1.post(url, **KEY).status_code == 200
+        with django_assert_num_queries(1):
+            response = auth_client_user1.post(url, **KEY)
+        assert response.status_code == 200
+        assert friendship_models.Friendship.objects.count() == 1
+
+    @pytest.mark.django_db
+    def test_register_replay(self, client):
+        data = {'username': 'idempotentuser', 'password': 'amogus11'}
+        first = client.post('/api/v1/auth/register', data, **KEY)
+        assert first.status_code == 200
+        second = client.post('/api/v1/auth/register', data, **KEY)
+        assert second.status_code == 200
+        assert second.json() == first.json()
+        assert user_models.User.objects.filter(username=data['username']).count() == 1
+
+    @pytest.mark.django_db
+    def test_key_reused_with_another_body(self, client):
+        client.post('/api/v1/auth/register', {'username': 'idempotentuser', 'password': 'amogus11'}, **KEY)
+        response = client.post('/api/v1/auth/register', {'username': 'otheruser', 'password': 'amogus11'}, **KEY)
+        assert response.status_code == 422
+        assert not user_models.User.objects.filter(username='otheruser').exists()
+
+    @pytest.mark.django_db
+    def test_keys_are_per_user(self, client, user1_token, user2_token, user3):
+        _, user3_in_db = user3
+        url = '/api/v1/friends/' + str(user3_in_db.id) + '/add'
+        client.post(url, HTTP_AUTHORIZATION='Bearer ' + user1_token, **KEY)
+        response = client.post(url, HTTP_AUTHORIZATION='Bearer ' + user2_token, **KEY)
+        assert 'Idempotent-Replayed' not in response
+        assert friendship_models.Friendship.objects.filter(user_to=user3_in_db).count() == 2
+
+    @pytest.mark.django_db
+    def test_in_progress_and_expired(self, auth_client_user1, user2):
+        _, user2_in_db = user2
+        url = '/api/v1/friends/' + str(user2_in_db.id) + '/add'
+        assert auth_client_user1.post(url, **KEY).status_code == 200
+        record = user_models.IdempotencyKey.objects.get()
+
+        user_models.IdempotencyKey.objects.update(status=0)
+        assert auth_client_user1.post(url, **KEY).status_code == 409
+
+        user_models.IdempotencyKey.objects.update(expires=timezone.now() - timedelta(seconds=1))
+        response = auth_client_user1.post(url, **KEY)
+        assert response.status_code == 200
+        assert 'Idempotent-Replayed' not in response
+        assert user_models.IdempotencyKey.objects.get().expires > record.expires
+
+    @pytest.mark.django_db
+    def test_failed_requests_are_not_stored(self, client, auth_client_user1):
+        response = client.post('/api/v1/friends/add:batch', {'ids': []}, content_type='application/json',
+                               HTTP_AUTHORIZATION='Bearer broken', **KEY)
+        assert response.status_code == 401
+        assert not user_models.IdempotencyKey.objects.exists()
+
+        response = auth_client_user1.post('/api/v1/friends/add:batch', HTTP_IDEMPOTENCY_KEY='x' * 256)
+        assert response.status_code == 400
+
+    @pytest.mark.django_db
+    def test_other_routes_are_ignored(self, client, user1):
+        client.post('/api/v1/auth/login', user1[0], **KEY)
+        assert not user_models.IdempotencyKey.objects.exists()
+
+    @pytest.mark.django_db
+    def test_purge_command(self, auth_client_user1, user2):
+        _, user2_in_db = user2
+        auth_client_user1.post('/api/v1/friends/' + str(user2_in_db.id) + '/add', **KEY)
+        auth_client_user1.post('/api/v1/friends/' + str(user2_in_db.id) + '/remove', **KEY)
+        user_models.IdempotencyKey.objects.filter(
+            key=user_models.IdempotencyKey.objects.values_list('key', flat=True).first()
+        ).update(expires=timezone.now())
+
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        assert 'Removed 1 expired idempotency keys' in out.getvalue()
+        assert user_models.IdempotencyKey.objects.count() == 1
+
+
+@pytest.mark.urls('friends.urls_async')
+class TestAsyncIdempotencyApi:
+    @pytest.mark.django_db
+    def test_register_replay(self):
+        client = SyncAsyncClient(headers={'Idempotency-Key': 'retry-1'})
+        data = {'username': 'asyncidempotent', 'password': 'amogus11'}
+        first = client.post('/api/v1/auth/register', data)
+        assert first.status_code == 200
+        second = client.post('/api/v1/auth/register', data)
+        assert second.status_code == 200
+        assert second['Idempotent-Replayed'] == 'true'
+        assert second.json() == first.json()
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+
+class TestMetrics:
+    @pytest.mark.django_db
+    def test_route_metrics(self, client, auth_client_user1, user1):
+        auth_client_user1.get('/api/v1/friends/myfriends')
+        client.get('/api/v1/auth/whoami', HTTP_AUTHORIZATION='Bearer broken')
+
+        response = client.get('/metrics')
+        assert response.status_code == 200
+        text = response.content.decode()
+        assert 'http_request_duration_seconds_count{method="GET",route="/api/v1/friends/myfriends"}' in text
+        assert 'http_requests_total{method="GET",route="/api/v1/auth/whoami",status="401"}' in text
+        assert 'http_request_db_duration_seconds_count{method="GET",route="/api/v1/friends/myfriends"}' in text
+        assert 'auth_failures_total{reason="invalid_token"}' in text
+
+    def test_multiprocess_aggregation(self, tmp_path):
+        env = {**os.environ, 'PROMETHEUS_MULTIPROC_DIR': str(tmp_path), 'DJANGO_SETTINGS_MODULE': 'friends.settings'}
+        setup = "import django; django.setup(); from friends import metrics; "
+        for _ in range(2):
+            subprocess.run([sys.executable, '-c', setup + "metrics.AUTH_FAILURES.labels('wrong_password').inc()"],
+                           env=env, check=True)
+        output = subprocess.run(
+            [sys.executable, '-c', setup + "print(metrics.metrics_view(None).content.decode())"],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+        assert 'auth_failures_total{reason="wrong_password"} 2.0' in output
@@ -0,0 +1,81 @@
+import pytest
+from django.utils import timezone
+
+from friends.db_router import ReplicaRouter, is_pinned, pin_to_primary, read_from
+from friendship import schemas as friendship_schemas
+from users import models as user_models
+
+
+class TestReplicaRouting:
+    def test_router(self):
+        router = ReplicaRouter()
+        assert router.db_for_read(user_models.User) is None
+        with read_from('replica'):
+            assert router.db_for_read(user_models.User) == 'replica'
+            assert router.db_for_write(user_models.User) == 'default'
+        assert router.db_for_read(user_models.User) is None
+
+    @pytest.mark.django_db
+    def test_many_pins(self, replica, django_assert_num_queries):
+        users = user_models.User.objects.bulk_create(user_models.User(username=f'pinned{i}') for i in range(400))
+        with django_assert_num_queries(1):
+            pin_to_primary(users[0].id)
+        for user in users[1:]:
+            pin_to_primary(user.id)
+        # закрепления не вытесняют друг друга и читаются из основной бд
+        with read_from(replica):
+            assert all(is_pinned(user.id) for user in users)
+        pin_to_primary(users[0].id)
+        assert user_models.ReplicaPin.objects.count() == len(users)
+
+    @pytest.mark.django_db
+    def test_reads_from_replica(self, auth_client_user1, user1, user2, replica):
+        _, user2_in_db = user2
+        # реплика пустая, пользователей в ней ещё нет
+        response = auth_client_user1.get('/api/v1/users/' + user2_in_db.username)
+        assert response.status_code == 404
+        response = auth_client_user1.get('/api/v1/friends/' + str(user2_in_db.id) + '/all')
+        assert response.status_code == 404
+        # остальные ручки читают из основной бд
+        response = auth_client_user1.get('/api/v1/auth/whoami')
+        assert response.status_code == 200
+
+    @pytest.mark.django_db
+    def test_read_your_writes(self, auth_client_user1, client, user1, user2_token, user2, replica):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        response = auth_client_user1.post('/api/v1/friends/' + str(user2_in_db.id) + '/add')
+        assert response.status_code == 200
+
+        response = auth_client_user1.get('/api/v1/friends/' + str(user2_in_db.id) + '/status')
+        assert response.status_code == 200
+        assert response.json().get('status') == friendship_schemas.FriendshipStatus.OUTGOING
+
+        # второй пользователь ничего не менял и читает с реплики
+        response = client.get('/api/v1/friends/' + str(user1_in_db.id) + '/status',
+                              HTTP_AUTHORIZATION='Bearer ' + user2_token)
+        assert response.status_code == 404
+
+        # закрепление за основной бд истекло
+        user_models.ReplicaPin.objects.update(expires=timezone.now())
+        response = auth_client_user1.get('/api/v1/friends/' + str(user2_in_db.id) + '/status')
+        assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_no_pin_without_writes(self, auth_client_user1, user1, user2, replica):
+        _, user2_in_db = user2
+        response = auth_client_user1.post('/api/v1/friends/status:batch', {'user_ids': [str(user2_in_db.id)]},
+                                          content_type='application/json')
+        assert response.status_code == 200
+        assert not user_models.ReplicaPin.objects.exists()
+
+        url = '/api/v1/friends/' + str(user2_in_db.id) + '/add'
+        response = auth_client_user1.post(url, HTTP_IDEMPOTENCY_KEY='retry-1')
+        assert response.status_code == 200
+        assert user_models.ReplicaPin.objects.exists()
+        user_models.ReplicaPin.objects.all().delete()
+
+        # повтор отдаёт сохранённый ответ и ничего не пишет
+        response = auth_client_user1.post(url, HTTP_IDEMPOTENCY_KEY='retry-1')
+        assert response['Idempotent-Replayed'] == 'true'
+        assert not user_models.ReplicaPin.objects.exists()
@@ -0,0 +1,50 @@
+import logging
+from uuid import uuid4
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from friends.sql_instrumentation import DuplicateQueriesError, QueryInstrumentationMiddleware, normalize_sql
+from users import models as user_models
+
+
+def n_plus_one_view(request):
+    for _ in range(5):
+        user_models.User.objects.filter(id=uuid4()).exists()
+    return HttpResponse()
+
+
+class TestSqlInstrumentation:
+    @pytest.mark.django_db
+    def test_headers(self, auth_client_user1, user1, user2, friendship_req_u1_u2):
+        response = auth_client_user1.get('/api/v1/friends/requests')
+        assert response.status_code == 200
+        assert int(response['X-DB-Queries']) >= 1
+        assert response['Server-Timing'].startswith('db;dur=')
+
+        response = auth_client_user1.get('/admin/login/')
+        assert not response.has_header('X-DB-Queries')
+
+    @pytest.mark.django_db
+    def test_duplicate_queries(self, settings, caplog):
+        middleware = QueryInstrumentationMiddleware(n_plus_one_view)
+        request = RequestFactory().get('/api/v1/test')
+
+        with pytest.raises(DuplicateQueriesError):
+            middleware(request)
+
+        settings.SQL_STRICT_MODE = False
+        with caplog.at_level(logging.WARNING, logger='friends.sql'):
+            response = middleware(request)
+        assert response['X-DB-Queries'] == '5'
+        assert 'repeats queries' in caplog.text
+
+        settings.SQL_DUPLICATE_QUERY_THRESHOLD = 5
+        caplog.clear()
+        middleware(request)
+        assert 'repeats queries' not in caplog.text
+
+    def test_normalize_sql(self):
+        assert normalize_sql('SELECT 1 FROM t WHERE id IN (%s, %s,%s) LIMIT 21') == \
+            normalize_sql('SELECT 1 FROM t WHERE id IN (%s, %s) LIMIT 1')
@@ -1,6 +1,10 @@
+import csv
+import json
 import pytest
 from uuid import uuid4
 
+from users import models as user_models
+
 
 class TestUserApi:
     @pytest.mark.django_db
@@ -10,10 +14,56 @@ class TestUserApi:
         response = client.get('/api/v1/users')
 
         assert response.status_code == 200
-        assert len(response.json()) == 2
-        for userdata in response.json():
+        assert len(response.json().get('items')) == 2
+        for userdata in response.json().get('items'):
             assert userdata.get('username') in usernames
 
+    @pytest.mark.django_db
+    def test_export_users(self, client, settings, user1, user2, user3):
+        settings.EXPORT_CHUNK_SIZE = 2
+        expected = [{'id': str(user.id), 'username': user.username}
+                    for user in user_models.User.objects.order_by('date_created', 'id')]
+
+        response = client.get('/api/v1/users', HTTP_ACCEPT='application/x-ndjson')
+        assert response.status_code == 200
+        assert response.streaming
+        assert response['Content-Type'] == 'application/x-ndjson'
+        chunks = list(response.streaming_content)
+        assert len(chunks) == 2
+        assert [json.loads(line) for line in b''.join(chunks).decode().splitlines()] == expected
+
+        response = client.get('/api/v1/users', HTTP_ACCEPT='text/csv;q=0.9, application/json;q=0.5')
+        assert response['Content-Type'] == 'text/csv'
+        rows = list(csv.DictReader(b''.join(response.streaming_content).decode().splitlines()))
+        assert rows == expected
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('memory_index', [False, True])
+    def test_search_users(self, client, settings, memory_index):
+        settings.USER_SEARCH_MEMORY_INDEX = memory_index
+        for username in ('alice', 'Alicia', 'alex', 'bob', 'Al'):
+            user_models.User.objects.create_user(username=username, password='amogus99')
+
+        response = client.get('/api/v1/users/search', {'q': 'AL'})
+        assert response.status_code == 200
+        assert [item['username'] for item in response.json()] == ['Al', 'alex', 'alice', 'Alicia']
+
+        response = client.get('/api/v1/users/search', {'q': 'ali', 'limit': 1})
+        assert [item['username'] for item in response.json()] == ['alice']
+
+        response = client.post('/api/v1/auth/register', {'username': 'alan', 'password': 'amogus99'})
+        assert response.status_code == 200
+        response = client.get('/api/v1/users/search', {'q': 'ala'})
+        assert response.json() == [{'id': response.json()[0]['id'], 'username': 'alan'}]
+
+        assert client.get('/api/v1/users/search', {'q': 'z'}).json() == []
+        assert client.get('/api/v1/users/search', {'q': ''}).status_code == 422
+
+    @pytest.mark.django_db
+    def test_search_is_reserved(self, client):
+        response = client.post('/api/v1/auth/register', {'username': 'search', 'password': 'amogus99'})
+        assert response.status_code == 422
+
     @pytest.mark.django_db
     def test_get_specific_user_by_id(self, client, user1):
         user_data, user_in_db = user1
@@ -34,6 +84,19 @@ class TestUserApi:
         assert response.json().get('id') == str(user_in_db.id)
         assert response.json().get('username') == user_data.get('username')
 
+    @pytest.mark.django_db
+    def test_get_specific_user_not_modified(self, client, user1):
+        _, user_in_db = user1
+        response = client.get('/api/v1/users/' + user_in_db.username)
+        etag = response['ETag']
+
+        response = client.get('/api/v1/users/' + user_in_db.username, HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 304
+        assert response.content == b''
+
+        response = client.get('/api/v1/users/id/' + str(user_in_db.id), HTTP_IF_NONE_MATCH=etag)
+        assert response.status_code == 200
+
     @pytest.mark.django_db
     def test_get_user_by_random_uuid(self, client):
         user_id = str(uuid4())
@@ -47,3 +110,27 @@ class TestUserApi:
 
         response = client.get('/api/v1/users/' + username)
         assert response.status_code == 404
+
+    @pytest.mark.django_db
+    def test_get_all_users_pages(self, client):
+        user_models.User.objects.bulk_create(
+            user_models.User(username=f'pageuser{i}') for i in range(7)
+        )
+        seen = []
+        cursor = None
+        for _ in range(3):
+            params = {'limit': 3}
+            if cursor:
+                params['cursor'] = cursor
+            response = client.get('/api/v1/users', params)
+            assert response.status_code == 200
+            seen.extend(x.get('username') for x in response.json().get('items'))
+            cursor = response.json().get('next_cursor')
+
+        assert cursor is None
+        assert sorted(seen) == sorted(f'pageuser{i}' for i in range(7))
+
+    @pytest.mark.django_db
+    def test_get_all_users_bad_cursor(self, client):
+        response = client.get('/api/v1/users', {'cursor': 'amogus'})
+        assert response.status_code == 400
@@ -0,0 +1,54 @@
+import random
+from collections import Counter
+
+import pytest
+
+from friendship import benchmark
+from friendship import models as friendship_models
+from friendship.generator import GraphParams, generate_pairs
+
+
+class TestBenchmark:
+    def test_generator_is_seeded_and_skewed(self):
+        params = GraphParams(users=500, mean_degree=10, celebrities=2, celebrity_fans=0.5, seed=7)
+        pairs = generate_pairs(params, random.Random(params.seed))
+        assert pairs == generate_pairs(params, random.Random(params.seed))
+        assert len(set(pairs)) == len(pairs)
+        assert all(left != right for left, right in pairs)
+
+        degrees = Counter()
+        for left, right in pairs:
+            degrees[left] += 1
+            degrees[right] += 1
+        assert degrees[0] >= 250
+        assert sorted(degrees.values())[len(degrees) // 2] < 20
+
+    @pytest.mark.django_db
+    def test_run_covers_all_routes(self):
+        params = GraphParams(users=80, mean_degree=6, celebrities=1, celebrity_fans=0.5)
+        results = benchmark.run(params, repeat=2)
+
+        assert results['uncovered_routes'] == []
+        assert friendship_models.FriendshipEdge.objects.exists()
+        for label in ('celebrity', 'regular'):
+            result = results['results'][f'get_requests_and_friends[{label}]']
+            assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+            assert result['queries'] == 1
+            assert results['results'][f'GET /friends/requests[{label}]']['route'] == 'GET /friends/requests'
+
+    def test_compare(self):
+        baseline = {'results': {
+            'fast': {'p95_ms': 1.0, 'queries': 1},
+            'slow': {'p95_ms': 10.0, 'queries': 2},
+            'queries': {'p95_ms': 10.0, 'queries': 2},
+        }}
+        current = {'results': {
+            'fast': {'p95_ms': 1.5, 'queries': 1},
+            'slow': {'p95_ms': 15.0, 'queries': 2},
+            'queries': {'p95_ms': 9.0, 'queries': 3},
+            'new': {'p95_ms': 100.0, 'queries': 10},
+        }}
+        regressions = benchmark.compare(current, baseline, threshold=0.2)
+        assert len(regressions) == 2
+        assert regressions[0].startswith('slow')
+        assert regressions[1].startswith('queries')
@@ -0,0 +1,82 @@
+from io import StringIO
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+
+from friends.pagination import InvalidCursor, encode_cursor
+from friendship import changes, services
+from friendship.models import FriendshipEvent
+
+
+class TestFriendshipChanges:
+    @pytest.mark.django_db
+    def test_changes_are_collapsed(self, user1, user2, user3, user4):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        _, user4_in_db = user4
+        services.add_to_friends(user1_in_db, user4_in_db)
+
+        items, token, has_more = changes.get_changes(user1_in_db.id, None)
+        assert items == [] and not has_more
+
+        services.add_to_friends(user1_in_db, user2_in_db)
+        services.add_to_friends(user2_in_db, user1_in_db)
+        services.add_to_friends(user3_in_db, user1_in_db)
+        services.remove_from_friends(user1_in_db, user4_in_db)
+        items, next_token, has_more = changes.get_changes(user1_in_db.id, token)
+        assert [(item['id'], item['username'], item['status']) for item in items] == [
+            (user2_in_db.id, user2_in_db.username, 'friends'),
+            (user3_in_db.id, user3_in_db.username, 'incoming'),
+            (user4_in_db.id, user4_in_db.username, 'none'),
+        ]
+        assert not has_more
+        assert changes.get_changes(user1_in_db.id, next_token)[0] == []
+
+    @pytest.mark.django_db
+    def test_changes_pages(self, settings, user1, user2, user3):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        settings.FRIENDSHIP_CHANGES_PAGE_SIZE = 1
+        _, token, _ = changes.get_changes(user1_in_db.id, None)
+        services.add_to_friends(user1_in_db, user2_in_db)
+        services.add_to_friends(user1_in_db, user3_in_db)
+
+        items, token, has_more = changes.get_changes(user1_in_db.id, token)
+        assert [item['id'] for item in items] == [user2_in_db.id]
+        assert has_more
+        items, token, has_more = changes.get_changes(user1_in_db.id, token)
+        assert [item['id'] for item in items] == [user3_in_db.id]
+        assert not has_more
+
+    def test_tokens(self, settings):
+        assert changes.decode_token(changes.encode_token(42)) == 42
+        with pytest.raises(InvalidCursor):
+            changes.decode_token('garbage')
+        with pytest.raises(InvalidCursor):
+            changes.decode_token(encode_cursor({'id': 1}))
+        with pytest.raises(changes.SyncTokenExpired):
+            changes.decode_token(encode_cursor([42, 0]))
+
+    @pytest.mark.django_db
+    def test_compact_events(self, user1, user2, user3):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        services.add_to_friends(user1_in_db, user2_in_db)
+        services.add_to_friends(user2_in_db, user1_in_db)
+        services.add_to_friends(user1_in_db, user3_in_db)
+        services.remove_from_friends(user1_in_db, user3_in_db)
+        assert FriendshipEvent.objects.count() == 8
+
+        assert changes.compact_events(timedelta(days=1)) == (0, 0)
+        assert changes.compact_events(timedelta(0), batch_size=3) == (4, 2)
+        assert set(FriendshipEvent.objects.values_list('user', 'other', 'status')) == {
+            (user1_in_db.id, user2_in_db.id, 'friends'), (user2_in_db.id, user1_in_db.id, 'friends'),
+        }
+
+        out = StringIO()
+        call_command('compact_friendship_events', '--days', '0', stdout=out)
+        assert 'Removed 0 superseded' in out.getvalue()
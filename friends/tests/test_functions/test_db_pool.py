@@ -0,0 +1,84 @@
+import sqlite3
+import threading
+
+import pytest
+from django.db import OperationalError
+
+from friends import db_pool
+from friends.db_backends.sqlite3.base import DatabaseWrapper
+
+
+class TestConnectionPool:
+    @pytest.fixture()
+    def connect(self, tmp_path):
+        path = str(tmp_path / 'pool.sqlite3')
+        return lambda: sqlite3.connect(path, check_same_thread=False)
+
+    def test_reuses_connection(self, connect):
+        pool = db_pool.ConnectionPool(max_size=2)
+        first = pool.checkout(connect)
+        pool.checkin(first)
+        second = pool.checkout(connect)
+        assert second is first
+        assert pool.idle_count == 0
+
+    def test_replaces_old_connection(self, connect):
+        pool = db_pool.ConnectionPool(max_size=1, max_lifetime=0)
+        first = pool.checkout(connect)
+        pool.checkin(first)
+        second = pool.checkout(connect)
+        assert second is not first
+        with pytest.raises(sqlite3.ProgrammingError):
+            first.raw.execute('SELECT 1')
+
+    def test_replaces_broken_connection(self, connect):
+        pool = db_pool.ConnectionPool(max_size=1, health_check_idle=0)
+        first = pool.checkout(connect)
+        pool.checkin(first)
+        first.raw.close()
+        second = pool.checkout(connect)
+        assert second is not first
+        assert second.raw.execute('SELECT 1').fetchone() == (1,)
+
+    def test_rollback_on_checkin(self, connect):
+        pool = db_pool.ConnectionPool(max_size=1)
+        pooled = pool.checkout(connect)
+        pooled.raw.execute('CREATE TABLE items (id INTEGER)')
+        pooled.raw.commit()
+        pooled.raw.execute('INSERT INTO items VALUES (1)')
+        pool.checkin(pooled)
+        assert pool.checkout(connect).raw.execute('SELECT count(*) FROM items').fetchone() == (0,)
+
+    def test_timeout_when_exhausted(self, connect):
+        pool = db_pool.ConnectionPool(max_size=1, timeout=0.01)
+        pooled = pool.checkout(connect)
+        with pytest.raises(OperationalError):
+            pool.checkout(connect)
+        pool.checkin(pooled)
+        assert pool.checkout(connect) is pooled
+
+    def test_database_wrapper(self, tmp_path, django_db_blocker):
+        settings_dict = {
+            'ENGINE': 'friends.db_backends.sqlite3', 'NAME': str(tmp_path / 'wrapper.sqlite3'),
+            'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'AUTOCOMMIT': True, 'ATOMIC_REQUESTS': False,
+            'OPTIONS': {}, 'TIME_ZONE': None, 'POOL': {'MAX_SIZE': 2},
+        }
+        raw_connections = []
+
+        def request():
+            # под ASGI запросы выполняются в разных потоках, у каждого своя обёртка соединения
+            connection = DatabaseWrapper(dict(settings_dict), 'test_pool')
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            raw_connections.append(connection.connection)
+            connection.close_if_unusable_or_obsolete()
+            raw_connections.append(connection.connection)
+
+        with django_db_blocker.unblock():
+            for _ in range(3):
+                thread = threading.Thread(target=request)
+                thread.start()
+                thread.join()
+        assert raw_connections[1::2] == [None] * 3
+        assert len(set(map(id, raw_connections[::2]))) == 1
+        db_pool.get_pool('test_pool', {}).close_all()
@@ -0,0 +1,147 @@
+import time
+import threading
+from uuid import uuid4
+
+import pytest
+
+from friendship import events, services
+from friendship.models import FriendshipEvent
+from friendship.schemas import FriendshipStatus
+
+
+def listen_in_thread(hub: events.EventHub, user_id, after: int, timeout: float) -> dict:
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(woken=hub.listen(user_id, after, timeout)))
+    thread.start()
+    result['thread'] = thread
+    return result
+
+
+def wait_for_waiters(hub: events.EventHub, count: int) -> None:
+    deadline = time.monotonic() + 5
+    while hub.waiting < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+class TestEventHub:
+    def test_notify_wakes_listener(self):
+        hub = events.EventHub()
+        user_id, other_id = uuid4(), uuid4()
+        waiting = listen_in_thread(hub, user_id, 0, 5)
+        wait_for_waiters(hub, 1)
+
+        hub.notify([(1, other_id)])
+        assert hub.waiting == 1
+        started = time.monotonic()
+        hub.notify([(2, user_id)])
+        waiting['thread'].join()
+        assert waiting['woken'] is True
+        assert time.monotonic() - started < 1
+        assert hub.waiting == 0
+        hub.stop()
+
+    def test_listen_timeout(self):
+        hub = events.EventHub()
+        assert hub.listen(uuid4(), 0, 0.01) is False
+        hub.stop()
+
+    def test_recent_event_is_not_missed(self):
+        # событие пришло между чтением ленты клиентом и началом ожидания
+        hub = events.EventHub()
+        user_id = uuid4()
+        hub.notify([(5, user_id)])
+        assert hub.listen(user_id, 4, 5) is True
+        assert hub.listen(user_id, 5, 0.01) is False
+        hub.stop()
+
+    def test_stop_wakes_listeners(self):
+        hub = events.EventHub()
+        waiting = listen_in_thread(hub, uuid4(), 0, 5)
+        wait_for_waiters(hub, 1)
+        hub.stop()
+        waiting['thread'].join()
+        assert waiting['woken'] is True
+
+    @pytest.mark.django_db(transaction=True)
+    def test_poller_wakes_listener(self, user1, user2):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        hub = events.get_hub()
+        waiting = listen_in_thread(hub, user1_in_db.id, 0, 5)
+        wait_for_waiters(hub, 1)
+        while hub._last_id is None:
+            time.sleep(0.001)
+
+        # событие из другого процесса: в этом процессе после коммита никто не будит
+        FriendshipEvent.objects.create(user=user1_in_db, other=user2_in_db, status=FriendshipStatus.INCOMING.value)
+        waiting['thread'].join()
+        assert waiting['woken'] is True
+
+
+class TestFriendshipEvents:
+    @pytest.mark.django_db
+    def test_services_record_events(self, user1, user2, user3):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+
+        services.add_to_friends(user1_in_db, user2_in_db)
+        services.add_to_friends(user2_in_db, user1_in_db)
+        services.add_to_friends(user2_in_db, user1_in_db)
+        services.bulk_add_to_friends(user1_in_db, [user3_in_db.id])
+        services.remove_from_friends(user1_in_db, user2_in_db)
+
+        assert list(FriendshipEvent.objects.filter(user=user1_in_db).order_by('id').values_list('other', 'status')) == [
+            (user2_in_db.id, 'outgoing'), (user2_in_db.id, 'friends'), (user3_in_db.id, 'outgoing'),
+            (user2_in_db.id, 'none'),
+        ]
+        assert list(FriendshipEvent.objects.filter(user=user2_in_db).order_by('id').values_list('other', 'status')) == [
+            (user1_in_db.id, 'incoming'), (user1_in_db.id, 'friends'), (user1_in_db.id, 'none'),
+        ]
+
+    @pytest.mark.django_db
+    def test_get_events(self, settings, user1, user2, user4, friendship_req_u2_u1, friendship_req_u4_u1):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        settings.EVENTS_PAGE_SIZE = 1
+
+        items, last_id = events.get_events(user1_in_db.id, None)
+        assert items == []
+        assert last_id == events.latest_event_id(user1_in_db.id)
+
+        items, first_id = events.get_events(user1_in_db.id, 0)
+        assert [(item['user_id'], item['username'], item['status']) for item in items] == [
+            (user2_in_db.id, user2_in_db.username, 'incoming'),
+        ]
+        items, second_id = events.get_events(user1_in_db.id, first_id)
+        assert len(items) == 1
+        assert second_id == last_id
+        assert events.get_events(user1_in_db.id, last_id) == ([], last_id)
+
+    @pytest.mark.django_db
+    def test_change_wakes_listener_after_commit(self, user1, user2, django_capture_on_commit_callbacks):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        hub = events.get_hub()
+        waiting = listen_in_thread(hub, user2_in_db.id, 0, 5)
+        wait_for_waiters(hub, 1)
+
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            services.add_to_friends(user1_in_db, user2_in_db)
+            assert hub.waiting == 1
+        assert callbacks
+        waiting['thread'].join()
+        assert waiting['woken'] is True
+
+    def test_clamp_wait(self, settings):
+        assert events.clamp_wait(None) == settings.EVENTS_DEFAULT_WAIT_SECONDS
+        assert events.clamp_wait(-1) == 0
+        assert events.clamp_wait(10 ** 6) == settings.EVENTS_MAX_WAIT_SECONDS
+        assert events.clamp_wait(None, 5) == 5
+        assert events.clamp_wait(3, 5) == 3
+
+    def test_parse_last_event_id(self):
+        assert events.parse_last_event_id('42') == 42
+        assert events.parse_last_event_id('abc') is None
+        assert events.parse_last_event_id(None) is None
@@ -0,0 +1,211 @@
+import time
+import pytest
+from uuid import uuid4
+from django.db import connection
+
+from friends import settings
+from friendship import services
+from friendship.graph import FriendshipGraph, get_graph
+from friendship.models import FriendshipEvent
+from friendship.schemas import FriendshipStatus
+
+
+def chain(size: int):
+    """
+    Цепочка пользователей 0 - 1 - ... - size-1
+    """
+    users = [uuid4() for _ in range(size)]
+    adjacency = {user: [] for user in users}
+    for left, right in zip(users, users[1:]):
+        adjacency[left].append(right)
+        adjacency[right].append(left)
+    return users, adjacency
+
+
+class TestFriendshipGraph:
+    def test_distance_and_degree(self):
+        users, adjacency = chain(6)
+        graph = FriendshipGraph.from_adjacency(adjacency)
+
+        assert graph.distance(users[0], users[5], max_depth=6) == 5
+        assert graph.distance(users[5], users[1], max_depth=6) == 4
+        assert graph.distance(users[0], users[5], max_depth=4) is None
+        assert graph.distance(users[2], users[2], max_depth=6) == 0
+        assert graph.distance(users[0], uuid4(), max_depth=6) is None
+        assert graph.degree(users[0]) == 1
+        assert graph.degree(users[3]) == 2
+        assert graph.degree(uuid4()) == 0
+        assert graph.neighbourhood(users[0], 2) == {users[0]: 0, users[1]: 1, users[2]: 2}
+
+    def test_deltas(self):
+        users, adjacency = chain(6)
+        graph = FriendshipGraph.from_adjacency(adjacency)
+        newcomer = uuid4()
+
+        graph.apply_friendship_changes(users[0], gained=[users[5], newcomer], lost=[users[1]])
+
+        assert graph.distance(users[0], users[5], max_depth=6) == 1
+        assert graph.distance(users[1], users[0], max_depth=6) == 5
+        assert graph.distance(newcomer, users[4], max_depth=6) == 3
+        assert graph.degree(users[0]) == 2
+        assert graph.degree(users[1]) == 1
+
+        assert graph.neighbourhood(newcomer, 1) == {newcomer: 0, users[0]: 1}
+
+        graph.apply_friendship_changes(users[0], gained=[users[1]], lost=[users[5], newcomer])
+        assert graph.distance(users[0], users[5], max_depth=6) == 5
+        assert graph.degree(newcomer) == 0
+
+    def test_save_and_load(self, tmp_path):
+        users, adjacency = chain(5)
+        path = str(tmp_path / 'graph.bin')
+        FriendshipGraph.from_adjacency(adjacency).save(path)
+
+        graph = FriendshipGraph.load(path)
+        assert graph.distance(users[0], users[4], max_depth=6) == 4
+        assert graph.degree(users[2]) == 2
+
+    @pytest.mark.django_db
+    def test_build_and_follow_services(self, user1, user2, user3, friendship_req_u1_u2, friendship_req_u2_u1,
+                                       django_capture_on_commit_callbacks, monkeypatch, tmp_path):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        path = str(tmp_path / 'graph.bin')
+        monkeypatch.setattr(settings, 'FRIENDSHIP_GRAPH_PATH', path)
+        FriendshipGraph.build().save(path)
+
+        graph = get_graph()
+        assert graph.distance(user1_in_db.id, user2_in_db.id, max_depth=6) == 1
+        assert graph.distance(user1_in_db.id, user3_in_db.id, max_depth=6) is None
+
+        with django_capture_on_commit_callbacks(execute=True):
+            services.add_to_friends(user2_in_db, user3_in_db)
+            services.add_to_friends(user3_in_db, user2_in_db)
+        assert get_graph().distance(user1_in_db.id, user3_in_db.id, max_depth=6) == 2
+
+    @pytest.mark.django_db
+    def test_follows_changes_from_other_processes(self, user1, user2, user3, friendship_req_u1_u2,
+                                                  friendship_req_u2_u1):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        assert get_graph().degree(user2_in_db.id) == 1
+
+        # изменения без on_commit этого процесса, граф узнаёт о них из ленты событий
+        services.add_to_friends(user2_in_db, user3_in_db)
+        services.add_to_friends(user3_in_db, user2_in_db)
+        services.remove_from_friends(user1_in_db, user2_in_db)
+        graph = get_graph()
+        assert graph.degree(user2_in_db.id) == 1
+        assert graph.distance(user2_in_db.id, user3_in_db.id, max_depth=6) == 1
+        assert graph.distance(user1_in_db.id, user3_in_db.id, max_depth=6) is None
+
+    @pytest.mark.django_db
+    def test_snapshot_replays_later_changes(self, user1, user2, user3, friendship_req_u1_u2, friendship_req_u2_u1,
+                                            monkeypatch, tmp_path):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        path = str(tmp_path / 'graph.bin')
+        monkeypatch.setattr(settings, 'FRIENDSHIP_GRAPH_PATH', path)
+        snapshot = FriendshipGraph.build()
+
+        services.add_to_friends(user2_in_db, user3_in_db)
+        services.add_to_friends(user3_in_db, user2_in_db)
+        # снапшот собран до изменения, а подменил файл после
+        snapshot.save(path)
+        assert FriendshipGraph.load(path).event_id == snapshot.event_id
+        assert get_graph().distance(user1_in_db.id, user3_in_db.id, max_depth=6) == 2
+
+    @pytest.mark.django_db
+    def test_late_commits(self, monkeypatch, user1, user2, user3):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        graph = FriendshipGraph.from_adjacency({})
+        graph.synced_at = time.time()
+
+        def event(other, **kwargs):
+            return FriendshipEvent.objects.create(user=user1_in_db, other=other,
+                                                  status=FriendshipStatus.FRIENDS.value, **kwargs)
+
+        event(user2_in_db)
+        late_id = event(user3_in_db).id
+        event(user2_in_db)
+        FriendshipEvent.objects.filter(id=late_id).delete()
+        assert graph.sync()
+        assert graph.degree(user1_in_db.id) == 1
+
+        # событие с меньшим id закоммитилось позже более нового
+        event(user3_in_db, id=late_id)
+        assert graph.sync()
+        assert graph.degree(user1_in_db.id) == 2
+
+        # пропуск, который так и не заполнился, через FRIENDSHIP_GRAPH_GAP_SECONDS больше не проверяется
+        rolled_back_id = event(user2_in_db).id
+        event(user2_in_db)
+        FriendshipEvent.objects.filter(id=rolled_back_id).delete()
+        graph.sync()
+        assert list(graph._gaps) == [rolled_back_id]
+        monkeypatch.setattr(settings, 'FRIENDSHIP_GRAPH_GAP_SECONDS', 0)
+        graph.sync()
+        assert graph._gaps == {}
+
+    @pytest.mark.django_db
+    def test_rebuild_when_too_far_behind(self, monkeypatch, user1, user2, user3, friendship_req_u1_u2,
+                                         friendship_req_u2_u1):
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        graph = get_graph()
+        monkeypatch.setattr(settings, 'FRIENDSHIP_GRAPH_MAX_OVERLAY', 1)
+        services.add_to_friends(user2_in_db, user3_in_db)
+        services.add_to_friends(user3_in_db, user2_in_db)
+
+        rebuilt = get_graph()
+        assert rebuilt is not graph
+        assert rebuilt.degree(user2_in_db.id) == 2
+        assert rebuilt.overlay_size == 0
+
+    @pytest.mark.django_db
+    def test_stale_snapshot_is_not_reloaded(self, monkeypatch, tmp_path, caplog, user1, user2, friendship_req_u1_u2,
+                                            friendship_req_u2_u1):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        path = str(tmp_path / 'graph.bin')
+        monkeypatch.setattr(settings, 'FRIENDSHIP_GRAPH_PATH', path)
+        snapshot = FriendshipGraph.build()
+        # снапшот старше срока хранения событий
+        snapshot.synced_at = time.time() - (settings.FRIENDSHIP_EVENTS_RETENTION_DAYS + 1) * 24 * 60 * 60
+        snapshot.save(path)
+
+        build = FriendshipGraph.build
+        builds = []
+        monkeypatch.setattr(FriendshipGraph, 'build', classmethod(lambda cls: builds.append(1) or build()))
+        for _ in range(5):
+            assert get_graph().degree(user1_in_db.id) == 1
+        assert len(builds) == 1
+        assert 'too far behind' in caplog.text
+
+        # новый снапшот подхватывается
+        FriendshipGraph.build().save(path)
+        assert get_graph().mtime is not None
+
+    @pytest.mark.django_db
+    def test_outdated_read_is_dropped(self, user1, user2, friendship_req_u1_u2, friendship_req_u2_u1):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        graph = FriendshipGraph.build()
+        event_id = graph.event_id
+        services.remove_from_friends(user1_in_db, user2_in_db)
+
+        def concurrent_sync(execute, sql, params, many, context):
+            # другой поток применил ленту, пока этот её читал
+            graph._version += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(concurrent_sync):
+            assert graph.sync()
+        assert graph.event_id == event_id
+        assert graph.sync()
+        assert graph.degree(user1_in_db.id) == 0
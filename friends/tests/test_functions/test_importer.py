@@ -0,0 +1,173 @@
+import csv
+import json
+
+import pytest
+from io import StringIO
+from uuid import uuid4
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+
+from friends import settings
+
+from users import models as user_models
+from friendship import importer
+from friendship.graph import FriendshipGraph, get_graph
+from friendship import models as friendship_models
+from friendship.schemas import FriendshipStatus
+
+
+def write_users(path, users):
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=('id', 'username', 'password', 'password_hash'))
+        writer.writeheader()
+        writer.writerows(users)
+
+
+def write_friendships(path, friendships):
+    with open(path, 'w') as file:
+        for user_from, user_to in friendships:
+            record = {'user_from': str(user_from), 'user_to': str(user_to), 'request_date': '2020-01-01T00:00:00+00:00'}
+            file.write(json.dumps(record) + '\n')
+
+
+class TestImportGraph:
+    @pytest.mark.django_db
+    def test_import_users_and_friendships(self, tmp_path):
+        ids = [uuid4() for _ in range(3)]
+        users_path, friendships_path = str(tmp_path / 'users.csv'), str(tmp_path / 'friendships.jsonl')
+        write_users(users_path, [
+            {'id': ids[0], 'username': 'imported0', 'password': 'amogus11'},
+            {'id': ids[1], 'username': 'imported1', 'password_hash': make_password('amogus12')},
+            {'id': ids[2], 'username': 'imported2'},
+        ])
+        write_friendships(friendships_path, [(ids[0], ids[1]), (ids[1], ids[0]), (ids[0], ids[2])])
+
+        out = StringIO()
+        call_command('import_graph', users=users_path, friendships=friendships_path, batch_size=2, stdout=out)
+        assert 'rows/s' in out.getvalue()
+
+        users = {user.id: user for user in user_models.User.objects.all()}
+        assert check_password('amogus11', users[ids[0]].password)
+        assert check_password('amogus12', users[ids[1]].password)
+        assert not users[ids[2]].has_usable_password()
+
+        edges = set(friendship_models.FriendshipEdge.objects.values_list('owner', 'other', 'status'))
+        assert (ids[0], ids[1], FriendshipStatus.FRIENDS.value) in edges
+        assert (ids[2], ids[0], FriendshipStatus.INCOMING.value) in edges
+        dates = friendship_models.Friendship.objects.values_list('request_date', flat=True)
+        assert {date.year for date in dates} == {2020}
+        assert not (tmp_path / 'friendships.jsonl.progress').exists()
+
+    @pytest.mark.django_db
+    def test_resume_after_interruption(self, tmp_path, monkeypatch):
+        users = [{'id': uuid4(), 'username': f'imported{i}', 'password_hash': '!'} for i in range(7)]
+        path = str(tmp_path / 'users.csv')
+        write_users(path, users)
+
+        insert_chunk = importer.insert_chunk
+        calls = []
+
+        def failing_insert_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 3:
+                raise KeyboardInterrupt
+            insert_chunk(*args, **kwargs)
+
+        monkeypatch.setattr(importer, 'insert_chunk', failing_insert_chunk)
+        with pytest.raises(KeyboardInterrupt):
+            call_command('import_graph', users=path, batch_size=2, stdout=StringIO())
+        assert user_models.User.objects.count() == 4
+
+        call_command('import_graph', users=path, batch_size=2, resume=True, stdout=StringIO())
+        assert len(calls) == 5
+        assert set(user_models.User.objects.values_list('id', flat=True)) == {user['id'] for user in users}
+
+        # повторная загрузка с начала не создаёт дублей
+        call_command('import_graph', users=path, batch_size=2, stdout=StringIO())
+        assert user_models.User.objects.count() == 7
+
+    @pytest.mark.django_db
+    def test_bad_record(self, tmp_path):
+        path = str(tmp_path / 'friendships.jsonl')
+        user = uuid4()
+        write_friendships(path, [(user, user)])
+        with pytest.raises(CommandError):
+            call_command('import_graph', friendships=path, stdout=StringIO())
+
+    @pytest.mark.django_db
+    def test_unknown_user(self, tmp_path, user1, user2):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        path = str(tmp_path / 'friendships.jsonl')
+        unknown = uuid4()
+        write_friendships(path, [(user1_in_db.id, user2_in_db.id), (user2_in_db.id, unknown)])
+        with pytest.raises(importer.GraphImportError, match=f'line 2 after byte 0: user_to {unknown} does not exist'):
+            importer.import_file(path, friendship_models.Friendship, importer.build_friendships)
+        assert not friendship_models.Friendship.objects.exists()
+
+    @pytest.mark.django_db
+    def test_dates_are_kept_without_touching_model(self, tmp_path, user1, user2):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        path = str(tmp_path / 'friendships.jsonl')
+        write_friendships(path, [(user1_in_db.id, user2_in_db.id)])
+        field = friendship_models.Friendship._meta.get_field('request_date')
+
+        importer.import_file(path, friendship_models.Friendship, importer.build_friendships, use_copy=False)
+        assert field.auto_now_add
+        assert friendship_models.Friendship.objects.get().request_date.year == 2020
+
+    @pytest.mark.django_db
+    def test_import_is_seen_by_graphs_and_changes(self, tmp_path, monkeypatch, user1, user2, user3):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        graph_path = str(tmp_path / 'graph.bin')
+        monkeypatch.setattr(settings, 'FRIENDSHIP_GRAPH_PATH', graph_path)
+        FriendshipGraph.build().save(graph_path)
+        assert get_graph().degree(user1_in_db.id) == 0
+
+        path = str(tmp_path / 'friendships.jsonl')
+        write_friendships(path, [
+            (user1_in_db.id, user2_in_db.id), (user2_in_db.id, user1_in_db.id), (user1_in_db.id, user3_in_db.id),
+        ])
+        call_command('import_graph', friendships=path, batch_size=1, stdout=StringIO())
+
+        # граф процесса догоняет загрузку по ленте событий, снапшот пересобран
+        assert get_graph().distance(user1_in_db.id, user2_in_db.id, max_depth=6) == 1
+        assert FriendshipGraph.load(graph_path).degree(user1_in_db.id) == 1
+        events = set(friendship_models.FriendshipEvent.objects.values_list('user', 'other', 'status'))
+        assert events == {
+            (user1_in_db.id, user2_in_db.id, FriendshipStatus.FRIENDS.value),
+            (user2_in_db.id, user1_in_db.id, FriendshipStatus.FRIENDS.value),
+            (user1_in_db.id, user3_in_db.id, FriendshipStatus.OUTGOING.value),
+            (user3_in_db.id, user1_in_db.id, FriendshipStatus.INCOMING.value),
+        }
+
+        # повторная загрузка ничего не меняет и событий не пишет
+        call_command('import_graph', friendships=path, stdout=StringIO())
+        assert friendship_models.FriendshipEvent.objects.count() == 4
+
+    @pytest.mark.django_db
+    @pytest.mark.skipif(connection.vendor != 'postgresql', reason="COPY есть только в PostgreSQL")
+    def test_copy_import(self, tmp_path, user1, user2):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        existing = friendship_models.Friendship.objects.create(user_from=user1_in_db, user_to=user2_in_db)
+        path = str(tmp_path / 'friendships.jsonl')
+        write_friendships(path, [(user1_in_db.id, user2_in_db.id), (user2_in_db.id, user1_in_db.id)])
+
+        importer.import_file(path, friendship_models.Friendship, importer.build_friendships, use_copy=True)
+        importer.import_file(path, friendship_models.Friendship, importer.build_friendships, use_copy=True)
+
+        requests = {
+            request.user_from_id: request for request in friendship_models.Friendship.objects.all()
+        }
+        assert len(requests) == 2
+        # конфликт по паре пропускается, существующая заявка не меняется
+        assert requests[user1_in_db.id].id == existing.id
+        assert requests[user1_in_db.id].request_date == existing.request_date
+        assert requests[user2_in_db.id].request_date.year == 2020
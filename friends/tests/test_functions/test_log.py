@@ -0,0 +1,73 @@
+import sys
+import json
+import logging
+
+import pytest
+from django.conf import settings
+from django.utils.log import configure_logging
+
+from friends import log
+
+
+def make_record(name: str, level: int, msg: str = 'message', **extra) -> logging.LogRecord:
+    record = logging.LogRecord(name, level, __file__, 1, msg, (), None)
+    record.__dict__.update(extra)
+    return record
+
+
+class TestLogging:
+    def test_json_formatter(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.LogRecord('friends', logging.ERROR, __file__, 1, 'user %s', ('u1',), sys.exc_info())
+        record.route = '/api/v1/users'
+        data = json.loads(log.JsonFormatter().format(record))
+        assert data['message'] == 'user u1'
+        assert data['level'] == 'ERROR'
+        assert data['route'] == '/api/v1/users'
+        assert 'ValueError: boom' in data['exception']
+
+    def test_sampling_filter(self):
+        sampling = log.SamplingFilter(default_rate=0, rates={'django.db': 1, 'django.db.backends.schema': 0})
+        assert not sampling.filter(make_record('friends', logging.DEBUG))
+        assert sampling.filter(make_record('friends', logging.INFO))
+        assert sampling.filter(make_record('django.db.backends', logging.DEBUG))
+        assert not sampling.filter(make_record('django.db.backends.schema', logging.DEBUG))
+        assert not sampling.filter(make_record('django.dbx', logging.DEBUG))
+
+    def test_parse_mapping(self):
+        assert log.parse_mapping(' django.db.backends=INFO, friends=debug ,') == {
+            'django.db.backends': 'INFO', 'friends': 'debug',
+        }
+
+    @pytest.fixture()
+    def restore_logging(self):
+        yield
+        logging.getLogger('friends.test').setLevel(logging.NOTSET)
+        log.configure_logging(settings.LOGGING)
+
+    def test_configure_logging(self, tmp_path, restore_logging):
+        path = tmp_path / 'log.jsonl'
+        log.configure_logging({
+            'level': 'DEBUG', 'levels': 'friends.test=INFO', 'file': str(path), 'debug_sample_rate': 0,
+        })
+        root = logging.getLogger()
+        assert [type(handler) for handler in root.handlers] == [log.EnqueueHandler]
+
+        logging.getLogger('friends.test').debug('dropped by level')
+        logging.getLogger('friends.other').debug('dropped by sampling')
+        logging.getLogger('friends.test').info('kept', extra={'user_id': 42})
+        log._stop_listener()
+
+        records = [json.loads(line) for line in path.read_text().splitlines()]
+        assert [(record['message'], record['user_id']) for record in records] == [('kept', 42)]
+
+    def test_django_loggers_only_enqueue(self, restore_logging):
+        # так же, как при django.setup(): сначала DEFAULT_LOGGING, потом LOGGING_CONFIG
+        configure_logging(settings.LOGGING_CONFIG, settings.LOGGING)
+        for name in ('django', 'django.server', 'django.request'):
+            logger = logging.getLogger(name)
+            assert logger.handlers == []
+            assert logger.propagate
+        assert [type(handler) for handler in logging.getLogger().handlers] == [log.EnqueueHandler]
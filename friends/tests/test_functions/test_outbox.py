@@ -0,0 +1,210 @@
+import json
+import time
+import threading
+from io import StringIO
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from friendship import outbox, services
+from friendship.models import OutboxMessage
+
+
+class StubSink:
+    """
+    Локальный http получатель: запоминает запросы и отвечает статусами из очереди statuses (по умолчанию 200).
+    Если задан trickle, ответ уходит по байту раз в trickle секунд.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.statuses = []
+        self.delay = 0
+        self.trickle = 0
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with sink._lock:
+                    sink.in_flight += 1
+                    sink.max_in_flight = max(sink.max_in_flight, sink.in_flight)
+                    sink.requests.append((dict(self.headers), body))
+                    status = sink.statuses.pop(0) if sink.statuses else 200
+                time.sleep(sink.delay)
+                with sink._lock:
+                    sink.in_flight -= 1
+                if sink.trickle:
+                    for byte in f'HTTP/1.1 {status} OK\r\nContent-Length: 0\r\n\r\n'.encode():
+                        try:
+                            self.wfile.write(bytes([byte]))
+                            self.wfile.flush()
+                        except OSError:
+                            return
+                        time.sleep(sink.trickle)
+                    return
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/hook'
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture()
+def sink(settings):
+    stub = StubSink()
+    settings.OUTBOX_SINKS = {'push': {'url': stub.url, 'headers': {'Authorization': 'Bearer sink'}}}
+    yield stub
+    stub.close()
+
+
+def make_due():
+    OutboxMessage.objects.filter(next_attempt_at__isnull=False).update(next_attempt_at=timezone.now())
+
+
+class TestOutbox:
+    @pytest.mark.django_db
+    def test_nothing_is_written_without_sinks(self, user1, user2):
+        services.add_to_friends(user1[1], user2[1])
+        assert not OutboxMessage.objects.exists()
+
+    @pytest.mark.django_db
+    def test_notifications_are_written_with_changes(self, settings, sink, user1, user2, user3):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        settings.OUTBOX_SINKS['accepted'] = {'url': sink.url, 'topics': ['friendship.accepted']}
+
+        services.add_to_friends(user1_in_db, user2_in_db)
+        services.add_to_friends(user2_in_db, user1_in_db)
+        services.bulk_add_to_friends(user1_in_db, [user3_in_db.id])
+        services.remove_from_friends(user1_in_db, user3_in_db)
+
+        assert OutboxMessage.objects.count() == 4
+        assert set(OutboxMessage.objects.values_list('topic', 'sink', 'payload__user_id')) == {
+            ('friendship.accepted', 'accepted', str(user1_in_db.id)),
+            ('friendship.accepted', 'push', str(user1_in_db.id)),
+            ('friendship.request', 'push', str(user2_in_db.id)),
+            ('friendship.request', 'push', str(user3_in_db.id)),
+        }
+
+    @pytest.mark.django_db
+    def test_worker_delivers(self, sink, user1, user2):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        services.add_to_friends(user1_in_db, user2_in_db)
+        message = OutboxMessage.objects.get()
+
+        assert outbox.OutboxWorker().drain() == {'delivered': 1, 'failed': 0}
+        assert not OutboxMessage.objects.exists()
+        headers, body = sink.requests[0]
+        assert headers['Idempotency-Key'] == f'outbox-{message.id}'
+        assert headers['Authorization'] == 'Bearer sink'
+        assert body['topic'] == 'friendship.request'
+        assert body['payload'] == {
+            'user_id': str(user2_in_db.id), 'from_user_id': str(user1_in_db.id), 'from_username': user1_in_db.username,
+        }
+
+    @pytest.mark.django_db
+    def test_worker_retries_with_backoff(self, settings, sink, user1, user2):
+        settings.OUTBOX_BACKOFF_BASE_SECONDS = 60
+        services.add_to_friends(user1[1], user2[1])
+        sink.statuses = [503]
+        worker = outbox.OutboxWorker()
+
+        started = timezone.now()
+        assert worker.run_once() == {'delivered': 0, 'failed': 1}
+        message = OutboxMessage.objects.get()
+        assert message.attempts == 1
+        assert message.last_error == 'HTTP 503'
+        assert started + timedelta(seconds=30) <= message.next_attempt_at <= timezone.now() + timedelta(seconds=60)
+        assert worker.run_once() == {'delivered': 0, 'failed': 0}
+
+        make_due()
+        assert worker.run_once() == {'delivered': 1, 'failed': 0}
+        assert len(sink.requests) == 2
+        assert sink.requests[0][0]['Idempotency-Key'] == sink.requests[1][0]['Idempotency-Key']
+
+    @pytest.mark.django_db
+    def test_worker_gives_up(self, settings, sink, user1, user2):
+        settings.OUTBOX_SINKS['gone'] = {'url': sink.url + '/gone', 'topics': ['friendship.request']}
+        services.add_to_friends(user1[1], user2[1])
+        sink.statuses = [404, 500, 500]
+        worker = outbox.OutboxWorker(concurrency=1, max_attempts=2)
+
+        assert worker.run_once() == {'delivered': 0, 'failed': 2}
+        make_due()
+        assert worker.run_once() == {'delivered': 0, 'failed': 1}
+        assert outbox.pending_count() == 0
+        assert sorted(OutboxMessage.objects.values_list('attempts', 'last_error')) == [(1, 'HTTP 404'), (2, 'HTTP 500')]
+
+    @pytest.mark.django_db
+    def test_claimed_messages_are_leased(self, sink, user1, user2):
+        services.add_to_friends(user1[1], user2[1])
+        assert len(outbox._claim(10, 60)) == 1
+        assert outbox._claim(10, 60) == []
+
+    def test_lease_covers_slow_batch(self, settings, sink):
+        settings.OUTBOX_HTTP_TIMEOUT_SECONDS = 5
+        settings.OUTBOX_LEASE_MARGIN_SECONDS = 30
+        # 100 сообщений по 8 одновременно - 13 волн до 5 секунд каждая
+        assert outbox.lease_seconds(100, 8) == 13 * 5 + 30
+        settings.OUTBOX_SINKS = {'push': {'url': sink.url}, 'slow': {'url': sink.url, 'timeout': 20}}
+        assert outbox.lease_seconds(10, 10) == 20 + 30
+
+    @pytest.mark.django_db
+    def test_delivery_deadline(self, settings, sink, user1, user2):
+        settings.OUTBOX_SINKS['push']['timeout'] = 0.3
+        services.add_to_friends(user1[1], user2[1])
+        # каждый байт приходит раньше таймаута сокета, но весь ответ - только через 2 секунды
+        sink.trickle = 0.05
+        message = OutboxMessage.objects.get()
+
+        started = time.monotonic()
+        with pytest.raises(outbox.DeliveryError, match='Timed out after 0.3 seconds') as error:
+            outbox.deliver(message)
+        assert time.monotonic() - started < 1
+        assert error.value.retry
+
+        sink.trickle = 0
+        outbox.deliver(message)
+
+    @pytest.mark.django_db
+    def test_concurrency_limit(self, sink, user1):
+        _, user1_in_db = user1
+        users = services.User.objects.bulk_create(services.User(username=f'outbox{i}') for i in range(6))
+        services.bulk_add_to_friends(user1_in_db, [user.id for user in users])
+        sink.delay = 0.05
+
+        assert outbox.OutboxWorker(batch_size=4, concurrency=2).drain() == {'delivered': 6, 'failed': 0}
+        assert sink.max_in_flight == 2
+
+    def test_backoff(self, settings):
+        settings.OUTBOX_BACKOFF_BASE_SECONDS = 1
+        settings.OUTBOX_BACKOFF_MAX_SECONDS = 10
+        assert 0.5 <= outbox.backoff(1) <= 1
+        assert 4 <= outbox.backoff(4) <= 8
+        assert 5 <= outbox.backoff(30) <= 10
+
+    @pytest.mark.django_db
+    def test_command_once(self, sink, user1, user2):
+        services.add_to_friends(user1[1], user2[1])
+        out = StringIO()
+        call_command('run_outbox_worker', '--once', stdout=out)
+        assert 'Delivered 1 outbox messages, 0 failed, 0 pending' in out.getvalue()
+        assert len(sink.requests) == 1
@@ -0,0 +1,44 @@
+import pytest
+from freezegun import freeze_time
+
+from auth.principal import TTLCache, TokenUser
+
+
+class TestTTLCache:
+    def test_evicts_least_recently_used(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert cache.get('a') == 1
+        cache.set('c', 3)
+
+        assert cache.get('b') is None
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert len(cache) == 2
+
+    def test_expires(self):
+        with freeze_time("2010-01-11T02:23:34+00:00") as frozen:
+            cache = TTLCache(maxsize=2, ttl=30)
+            cache.set('a', 1)
+            frozen.tick(29)
+            assert cache.get('a') == 1
+            frozen.tick(2)
+            assert cache.get('a') is None
+
+    def test_disabled(self):
+        cache = TTLCache(maxsize=0, ttl=30)
+        cache.set('a', 1)
+        assert cache.get('a') is None
+
+
+class TestTokenUser:
+    @pytest.mark.django_db
+    def test_user_is_lazy(self, user1, django_assert_num_queries):
+        _, user_in_db = user1
+        with django_assert_num_queries(0):
+            principal = TokenUser(user_in_db.id, user_in_db.username)
+            assert principal.reference.pk == user_in_db.id
+        with django_assert_num_queries(1):
+            assert principal.user == user_in_db
+            assert principal.user.date_created == user_in_db.date_created
@@ -0,0 +1,27 @@
+import json
+from uuid import uuid4
+from datetime import datetime
+
+from django.http import HttpResponse
+from ninja.responses import NinjaJSONEncoder
+
+from friends.rendering import renderer, trusted_response
+from users.schemas import UserSchema
+
+
+class TestRendering:
+    def test_same_as_ninja_encoder(self):
+        data = {
+            'id': uuid4(), 'expires': datetime(2023, 5, 1, 12, 30, 15, 123456), 'user': UserSchema(id=uuid4()),
+            1: [None, 1.5, 'строка'],
+        }
+        rendered = renderer.render(None, data, response_status=200)
+        assert json.loads(rendered) == json.loads(json.dumps(data, cls=NinjaJSONEncoder))
+
+    def test_trusted_response(self):
+        response = HttpResponse('', content_type='application/json; charset=utf-8')
+        response['ETag'] = '"tag"'
+        user_id = uuid4()
+        assert trusted_response(None, response, {'items': [{'id': user_id, 'username': 'user'}]}) is response
+        assert response['ETag'] == '"tag"'
+        assert json.loads(response.content) == {'items': [{'id': str(user_id), 'username': 'user'}]}
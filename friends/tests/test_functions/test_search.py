@@ -0,0 +1,26 @@
+import uuid
+
+import pytest
+from django.db import connection
+
+from users import search
+
+
+class TestUserSearch:
+    def test_prefix_index(self):
+        index = search.PrefixIndex([
+            ('ивановa'.lower(), 'Ивановa', uuid.uuid4()), ('иван', 'Иван', uuid.uuid4()), ('ива', 'ива', uuid.uuid4()),
+        ])
+        assert [user['username'] for user in index.search('ИВАН', 10)] == ['Иван', 'Ивановa']
+        index.add(uuid.uuid4(), 'Иванка')
+        assert [user['username'] for user in index.search('иван', 2)] == ['Иван', 'Иванка']
+        assert index.search('я', 10) == []
+
+    def test_next_prefix(self):
+        assert search._next_prefix('ab') == 'ac'
+        assert search._next_prefix('a' + chr(0x10FFFF)) is None
+
+    @pytest.mark.django_db
+    @pytest.mark.skipif(connection.vendor != 'sqlite', reason="план запроса SQLite")
+    def test_uses_index(self):
+        assert 'user_username_search_idx' in search.search_queryset('al', 10).explain()
@@ -0,0 +1,309 @@
+import time
+import random
+import threading
+
+import pytest
+from io import StringIO
+from uuid import uuid4
+
+from django.db import connection, connections
+from django.core.management import call_command
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+
+from users import models as user_models
+from friendship import services, suggestions
+from friendship.schemas import FriendshipMutationResult
+from friendship import models as friendship_models
+
+
+def create_graph(center: user_models.User, edges: int):
+    """
+    Создаёт вокруг center по edges друзей, входящих и исходящих заявок.
+    """
+    users = user_models.User.objects.bulk_create(
+        user_models.User(username=f'graphuser{i}') for i in range(edges * 3)
+    )
+    friends, incoming, outgoing = users[:edges], users[edges:edges * 2], users[edges * 2:]
+    requests = []
+    for friend in friends:
+        requests.append(friendship_models.Friendship(user_from=center, user_to=friend))
+        requests.append(friendship_models.Friendship(user_from=friend, user_to=center))
+    for user in incoming:
+        requests.append(friendship_models.Friendship(user_from=user, user_to=center))
+    for user in outgoing:
+        requests.append(friendship_models.Friendship(user_from=center, user_to=user))
+    friendship_models.Friendship.objects.bulk_create(requests)
+    services.rebuild_edges()
+    return friends, incoming, outgoing
+
+
+class TestFriendshipServices:
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('edges', [1, 10, 50])
+    def test_requests_and_friends_query_count(self, django_assert_num_queries, user1, edges):
+        _, user1_in_db = user1
+        friends, incoming, outgoing = create_graph(user1_in_db, edges)
+
+        with django_assert_num_queries(1):
+            result = services.get_requests_and_friends(user1_in_db)
+
+        assert [set(users) for users in result] == [set(incoming), set(outgoing), set(friends)]
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize('edges', [1, 10, 50])
+    def test_lists_query_count(self, django_assert_num_queries, user1, edges):
+        _, user1_in_db = user1
+        friends, incoming, outgoing = create_graph(user1_in_db, edges)
+
+        with django_assert_num_queries(1):
+            assert set(services.get_friends(user1_in_db)) == set(friends)
+        with django_assert_num_queries(1):
+            assert set(services.get_incoming_requests(user1_in_db)) == set(incoming)
+        with django_assert_num_queries(1):
+            assert set(services.get_outgoing_requests(user1_in_db)) == set(outgoing)
+
+    @pytest.mark.django_db
+    def test_friendship_status_query_count(self, django_assert_num_queries, user1):
+        _, user1_in_db = user1
+        friends, incoming, outgoing = create_graph(user1_in_db, 5)
+
+        with django_assert_num_queries(1):
+            status = services.get_friendship_status(user1_in_db, friends[0])
+        assert status == services.FriendshipStatus.FRIENDS
+        assert services.get_friendship_status(user1_in_db, incoming[0]) == services.FriendshipStatus.INCOMING
+        assert services.get_friendship_status(user1_in_db, outgoing[0]) == services.FriendshipStatus.OUTGOING
+
+    @pytest.mark.django_db
+    def test_edges_follow_mutations(self, user1, user2):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+
+        services.add_to_friends(user1_in_db, user2_in_db)
+        assert services.get_friendship_status(user1_in_db, user2_in_db) == services.FriendshipStatus.OUTGOING
+        assert services.get_friendship_status(user2_in_db, user1_in_db) == services.FriendshipStatus.INCOMING
+
+        services.add_to_friends(user2_in_db, user1_in_db)
+        assert services.get_friendship_status(user1_in_db, user2_in_db) == services.FriendshipStatus.FRIENDS
+        assert services.get_friendship_status(user2_in_db, user1_in_db) == services.FriendshipStatus.FRIENDS
+
+        services.remove_from_friends(user1_in_db, user2_in_db)
+        assert services.get_friendship_status(user1_in_db, user2_in_db) == services.FriendshipStatus.NONE
+        assert not friendship_models.FriendshipEdge.objects.exists()
+
+    @pytest.mark.skipif(not connection.features.has_select_for_update, reason="нужны блокировки строк")
+    @pytest.mark.django_db(transaction=True)
+    def test_concurrent_counter_requests(self, monkeypatch, user1, user2):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        sync_edges = services._sync_edges
+        second_synced = threading.Event()
+
+        def interleaved_sync_edges(user_from, other_ids):
+            if user_from.pk == user1_in_db.pk:
+                # первая транзакция считает статус, когда вторая уже посчитала свой, но ещё не закоммитила
+                second_synced.wait(1)
+                sync_edges(user_from, other_ids)
+            else:
+                sync_edges(user_from, other_ids)
+                second_synced.set()
+                time.sleep(0.3)
+
+        def add(user_from, user_to):
+            try:
+                services.add_to_friends(user_from, user_to)
+            finally:
+                connections.close_all()
+
+        monkeypatch.setattr(services, '_sync_edges', interleaved_sync_edges)
+        first = threading.Thread(target=add, args=(user1_in_db, user2_in_db))
+        first.start()
+        time.sleep(0.1)
+        second = threading.Thread(target=add, args=(user2_in_db, user1_in_db))
+        second.start()
+        first.join()
+        second.join()
+
+        assert services.get_friendship_status(user1_in_db, user2_in_db) == services.FriendshipStatus.FRIENDS
+        assert services.get_friendship_status(user2_in_db, user1_in_db) == services.FriendshipStatus.FRIENDS
+
+    @pytest.mark.django_db
+    def test_rebuild_edges_matches_mutations(self, user1, user2, user3, user4,
+                                             friendship_req_u1_u2, friendship_req_u2_u1,
+                                             friendship_req_u1_u3, friendship_req_u4_u1):
+        edges = set(friendship_models.FriendshipEdge.objects.values_list('owner', 'other', 'status'))
+        friendship_models.FriendshipEdge.objects.all().delete()
+
+        call_command('rebuild_friendship_edges', stdout=StringIO())
+
+        assert len(edges) == 6
+        assert set(friendship_models.FriendshipEdge.objects.values_list('owner', 'other', 'status')) == edges
+
+    @pytest.mark.django_db
+    def test_rebuild_edges_in_batches(self, user1, user2, user3, user4,
+                                      friendship_req_u1_u2, friendship_req_u2_u1,
+                                      friendship_req_u1_u3, friendship_req_u4_u1):
+        _, user1_in_db = user1
+        _, user3_in_db = user3
+        _, user4_in_db = user4
+        edges = set(friendship_models.FriendshipEdge.objects.values_list('owner', 'other', 'status'))
+        friendship_models.FriendshipEdge.objects.filter(owner=user1_in_db).delete()
+        friendship_models.FriendshipEdge.objects.create(
+            owner=user3_in_db, other=user4_in_db,
+            status=services.FriendshipStatus.FRIENDS.value, status_date=timezone.now(),
+        )
+        friendship_models.FriendshipEvent.objects.all().delete()
+
+        assert services.rebuild_edges(batch_size=1) == 6
+        assert set(friendship_models.FriendshipEdge.objects.values_list('owner', 'other', 'status')) == edges
+        # события только о том, что изменилось: восстановленные статусы user1 и удалённая пара без заявок
+        events = set(friendship_models.FriendshipEvent.objects.values_list('user', 'other', 'status'))
+        assert {user for user, _, _ in events} == {user1_in_db.id, user3_in_db.id}
+        assert len(events) == 4
+
+    @pytest.mark.django_db
+    def test_bulk_add_query_count(self, user1):
+        _, user1_in_db = user1
+
+        def bulk_add(size: int):
+            users = user_models.User.objects.bulk_create(
+                user_models.User(username=f'bulkuser{size}_{i}') for i in range(size)
+            )
+            with CaptureQueriesContext(connection) as queries:
+                results = services.bulk_add_to_friends(user1_in_db, [user.id for user in users])
+            assert set(results.values()) == {FriendshipMutationResult.ADDED}
+            return users, len(queries)
+
+        few, few_queries = bulk_add(1)
+        many, many_queries = bulk_add(50)
+        # число запросов не зависит от числа пользователей
+        assert few_queries == many_queries
+        assert set(services.get_outgoing_requests(user1_in_db)) == set(few + many)
+
+        results = services.bulk_add_to_friends(user1_in_db, [few[0].id, user1_in_db.id])
+        assert results[few[0].id] == FriendshipMutationResult.ALREADY_EXISTS
+        assert results[user1_in_db.id] == FriendshipMutationResult.SELF
+
+    @pytest.mark.django_db
+    def test_bulk_remove_keeps_earlier_counter_request(self, user1, user2, user3, user4,
+                                                       friendship_req_u1_u2, friendship_req_u2_u1,
+                                                       friendship_req_u1_u3, friendship_req_u4_u1):
+        _, user1_in_db = user1
+        _, user2_in_db = user2
+        _, user3_in_db = user3
+        _, user4_in_db = user4
+        services.add_to_friends(user1_in_db, user4_in_db)
+        unknown_id = uuid4()
+
+        results = services.bulk_remove_from_friends(
+            user1_in_db, [user2_in_db.id, user3_in_db.id, user4_in_db.id, unknown_id]
+        )
+        assert results == {
+            user2_in_db.id: FriendshipMutationResult.REMOVED,
+            user3_in_db.id: FriendshipMutationResult.REMOVED,
+            user4_in_db.id: FriendshipMutationResult.REMOVED,
+            unknown_id: FriendshipMutationResult.UNKNOWN_USER,
+        }
+        # заявка user2 пришла позже заявки user1 и удалилась, заявка user4 была раньше и осталась
+        assert services.get_friendship_status(user1_in_db, user2_in_db) == services.FriendshipStatus.NONE
+        assert services.get_friendship_status(user1_in_db, user3_in_db) == services.FriendshipStatus.NONE
+        assert services.get_friendship_status(user1_in_db, user4_in_db) == services.FriendshipStatus.INCOMING
+
+        results = services.bulk_remove_from_friends(user1_in_db, [user3_in_db.id])
+        assert results == {user3_in_db.id: FriendshipMutationResult.NOTHING_TO_REMOVE}
+
+
+class TestFriendSuggestions:
+    def cached_suggestions(self):
+        return set(friendship_models.FriendSuggestion.objects.values_list('owner', 'candidate', 'mutual_count'))
+
+    @pytest.mark.django_db
+    def test_incremental_matches_rebuild(self):
+        rng = random.Random(42)
+        users = user_models.User.objects.bulk_create(
+            user_models.User(username=f'suggestuser{i}') for i in range(12)
+        )
+        for _ in range(120):
+            user_from, user_to = rng.sample(users, 2)
+            if rng.random() < 0.7:
+                services.add_to_friends(user_from, user_to)
+            else:
+                services.remove_from_friends(user_from, user_to)
+            if rng.random() < 0.1:
+                services.bulk_add_to_friends(user_from, [user.id for user in rng.sample(users, 4)])
+            if rng.random() < 0.1:
+                services.bulk_remove_from_friends(user_from, [user.id for user in rng.sample(users, 4)])
+            if rng.random() < 0.1:
+                # воркер отстаёт: пачка применяется, пока после неё уже записаны другие изменения
+                suggestions.apply_updates(batch_size=rng.randint(1, 10))
+
+        suggestions.drain(batch_size=3)
+        assert suggestions.pending_updates() == 0
+        incremental = self.cached_suggestions()
+        assert incremental
+        suggestions.rebuild_suggestions()
+        assert self.cached_suggestions() == incremental
+
+        # пересборка пачками по владельцам сначала применяет записанные изменения
+        user_from = user_models.User.objects.create(username='suggestuser_new')
+        services.add_to_friends(user_from, users[0])
+        services.add_to_friends(users[0], user_from)
+        services.remove_from_friends(user_from, users[0])
+        assert suggestions.pending_updates()
+        assert suggestions.rebuild_suggestions(batch_size=1) == len(incremental)
+        assert suggestions.pending_updates() == 0
+        assert self.cached_suggestions() == incremental
+
+    @pytest.mark.django_db
+    def test_suggestions_ranking(self, user1, user2, user3, user4, user5):
+        users = [user[1] for user in (user1, user2, user3, user4, user5)]
+        me, friend_a, friend_b, stranger, requested = users
+        for friend in (friend_a, friend_b):
+            services.add_to_friends(me, friend)
+            services.add_to_friends(friend, me)
+            services.add_to_friends(friend, stranger)
+            services.add_to_friends(stranger, friend)
+        services.add_to_friends(friend_a, requested)
+        services.add_to_friends(requested, friend_a)
+        services.add_to_friends(me, requested)
+        suggestions.drain()
+
+        assert services.get_suggestions(me) == [(stranger, 2)]
+        assert list(suggestions.compute_suggestions(me)) == [
+            {'owner': me.id, 'candidate': stranger.id, 'mutual_count': 2}
+        ]
+
+        services.remove_from_friends(friend_b, me)
+        suggestions.drain()
+        assert services.get_suggestions(me) == [(stranger, 1)]
+        assert services.get_suggestions(friend_b) == [(friend_a, 1)]
+
+    @pytest.mark.django_db
+    def test_write_path_does_not_depend_on_degree(self, user1, user2, django_assert_num_queries):
+        celebrity, newcomer = user1[1], user2[1]
+        fans = user_models.User.objects.bulk_create(user_models.User(username=f'fan{i}') for i in range(50))
+        services.bulk_add_to_friends(celebrity, [fan.id for fan in fans])
+        for fan in fans:
+            services.add_to_friends(fan, celebrity)
+        suggestions.drain()
+        assert friendship_models.FriendSuggestion.objects.count() == 50 * 49
+
+        services.add_to_friends(newcomer, celebrity)
+        rows = friendship_models.FriendSuggestion.objects.count()
+        # принятие заявки пишет одну строку изменения, а не по строке на каждого друга знаменитости
+        services.add_to_friends(celebrity, newcomer)
+        assert friendship_models.FriendSuggestion.objects.count() == rows
+        assert suggestions.pending_updates() == 1
+
+        assert suggestions.drain() == 1
+        assert services.get_suggestions(newcomer, 100) == [(fan, 1) for fan in sorted(fans, key=lambda fan: fan.id)]
+        assert friendship_models.FriendSuggestion.objects.count() == 50 * 49 + 2 * 50
+
+    @pytest.mark.django_db
+    def test_worker_command_once(self, user1, user2):
+        services.add_to_friends(user1[1], user2[1])
+        services.add_to_friends(user2[1], user1[1])
+        out = StringIO()
+        call_command('run_suggestions_worker', '--once', stdout=out)
+        assert 'Applied 1 friendship changes' in out.getvalue()
+        assert suggestions.pending_updates() == 0
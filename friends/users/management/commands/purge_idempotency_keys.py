@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from friends.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Удалить истёкшие ключи Idempotency-Key. Запускать по крону"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f"Removed {deleted} expired idempotency keys"))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_created', 'id'], name='user_date_created_idx'),
+        ),
+    ]
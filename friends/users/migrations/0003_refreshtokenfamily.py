@@ -0,0 +1,25 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:05
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_date_created_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RefreshTokenFamily',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('generation', models.PositiveIntegerField(default=0)),
+                ('expires', models.DateTimeField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='refresh_token_families', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.1 on 2026-10-18 08:49
+
+from django.db import migrations, models
+import users.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_refreshtokenfamily'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(users.models.SearchKey('username'), name='user_username_search_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReplicaPin',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('expires', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -1,5 +1,6 @@
 import uuid
 from django.db import models
+from django.db.models import CharField, Func
 from django.contrib.auth.models import (
     AbstractBaseUser, BaseUserManager, PermissionsMixin
 )
@@ -25,6 +26,20 @@ class CustomUserManager(BaseUserManager):
         return user
 
 
+class SearchKey(Func):
+    """
+    lower(username) с побайтовым сравнением. В PostgreSQL это COLLATE "C": индекс по такому выражению
+    годится и для диапазона по префиксу, и для сортировки, в отличие от varchar_pattern_ops,
+    который умеет только LIKE. В SQLite строки и так сравниваются побайтово.
+    """
+
+    template = '(LOWER(%(expressions)s) COLLATE "C")'
+    output_field = CharField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(compiler, connection, template='LOWER(%(expressions)s)', **extra_context)
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """
     Модель пользователя...
@@ -38,5 +53,49 @@ class User(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = 'username'
     objects = CustomUserManager()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=("date_created", "id"), name="user_date_created_idx"),
+            models.Index(SearchKey("username"), name="user_username_search_idx"),
+        ]
+
     def __str__(self):
         return self.username
+
+
+class RefreshTokenFamily(models.Model):
+    """
+    Цепочка refresh токенов, выданных при одном входе.
+    Хранится только номер последнего выданного токена: предъявление более старого
+    означает, что токен утёк, и цепочка отзывается целиком.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='refresh_token_families')
+    generation = models.PositiveIntegerField(default=0)
+    expires = models.DateTimeField()
+
+
+class IdempotencyKey(models.Model):
+    """
+    Сохранённый ответ на POST с заголовком Idempotency-Key, повтор запроса получает его без выполнения.
+    key - sha256 от пользователя, пути и ключа клиента, fingerprint - sha256 тела запроса.
+    status 0 - первый запрос ещё выполняется.
+    """
+
+    key = models.CharField(primary_key=True, max_length=64)
+    fingerprint = models.CharField(max_length=64)
+    status = models.PositiveSmallIntegerField(default=0)
+    content_type = models.CharField(max_length=100, blank=True)
+    body = models.BinaryField(blank=True)
+    expires = models.DateTimeField(db_index=True)
+
+
+class ReplicaPin(models.Model):
+    """
+    До expires чтения пользователя идут в основную бд, см. friends/db_router.py.
+    Строка на пользователя перезаписывается при каждом изменении, так что таблица не больше числа пользователей.
+    """
+
+    user = models.OneToOneField(User, primary_key=True, on_delete=models.CASCADE, related_name='+')
+    expires = models.DateTimeField()
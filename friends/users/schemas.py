@@ -1,4 +1,5 @@
 from uuid import UUID
+from typing import List, Optional
 
 from ninja import Schema
 from pydantic import validator
@@ -9,6 +10,18 @@ class UserSchema(Schema):
     id: UUID
 
 
+# колонки потоковой выгрузки пользователей (friends/export.py), те же, что в UserSchema
+USER_EXPORT_FIELDS = {'id': 'id', 'username': 'username'}
+
+
+class UserPageSchema(Schema):
+    """
+    Страница пользователей. next_cursor передаётся в cursor для следующей страницы.
+    """
+    items: List[UserSchema]
+    next_cursor: Optional[str] = None
+
+
 class UserRegistrationSchema(Schema):
     username: str
     password: str
@@ -17,4 +30,6 @@ class UserRegistrationSchema(Schema):
     def name_length_and_length(cls, v):
         assert v.isalnum(), 'username must be alphanumeric'
         assert len(v) <= 24, 'username must be shorter than 24 symbols'
+        # /users/search занят поиском
+        assert v != 'search', 'username is reserved'
         return v
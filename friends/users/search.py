@@ -0,0 +1,129 @@
+"""
+Поиск пользователей по началу username без учёта регистра.
+В бд это диапазон [префикс, следующий префикс) по индексу на SearchKey(username) с LIMIT:
+запрос читает из индекса только выдаваемые строки, сколько бы пользователей ни было.
+Результаты упорядочены по username в нижнем регистре, так что точное совпадение идёт первым,
+за ним самые близкие к запросу имена.
+
+Для SQLite и разработки есть индекс в памяти процесса (USER_SEARCH_MEMORY_INDEX): отсортированный
+список имён, поиск в нём - бинарный. SQLite приводит к нижнему регистру только латиницу, индекс
+в памяти ищет без учёта регистра в любом алфавите. Новые пользователи этого процесса попадают
+в индекс сразу, остальные - после пересборки раз в USER_SEARCH_INDEX_TTL_SECONDS.
+"""
+import time
+import bisect
+import threading
+from uuid import UUID
+from typing import List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import QuerySet
+
+from .models import SearchKey, User
+
+
+def clamp_search_limit(limit: Optional[int]) -> int:
+    if not limit:
+        return settings.USER_SEARCH_DEFAULT_LIMIT
+    return max(1, min(limit, settings.USER_SEARCH_MAX_LIMIT))
+
+
+def _next_prefix(prefix: str) -> Optional[str]:
+    """
+    Наименьшая строка больше всех строк, начинающихся с prefix.
+    """
+    last = ord(prefix[-1])
+    if last >= 0x10FFFF:
+        return None
+    return prefix[:-1] + chr(last + 1)
+
+
+def search_queryset(prefix: str, limit: int) -> QuerySet:
+    key = prefix.lower()
+    queryset = User.objects.alias(search_key=SearchKey('username')).filter(search_key__gte=key)
+    upper = _next_prefix(key)
+    if upper is not None:
+        queryset = queryset.filter(search_key__lt=upper)
+    return queryset.order_by('search_key', 'username').values('id', 'username')[:limit]
+
+
+class PrefixIndex:
+    """
+    Отсортированный список (username в нижнем регистре, username, id).
+    """
+
+    def __init__(self, entries: List[Tuple[str, str, UUID]]):
+        self._entries = sorted(entries)
+        self._lock = threading.Lock()
+        self.built = time.monotonic()
+
+    @classmethod
+    def build(cls) -> 'PrefixIndex':
+        rows = User.objects.values_list('id', 'username').iterator(chunk_size=10000)
+        return cls([(username.lower(), username, user_id) for user_id, username in rows])
+
+    def add(self, user_id: UUID, username: str) -> None:
+        with self._lock:
+            bisect.insort(self._entries, (username.lower(), username, user_id))
+
+    def search(self, prefix: str, limit: int) -> List[dict]:
+        key = prefix.lower()
+        with self._lock:
+            start = bisect.bisect_left(self._entries, (key,))
+            candidates = self._entries[start:start + limit]
+        return [
+            {'id': user_id, 'username': username}
+            for lowered, username, user_id in candidates if lowered.startswith(key)
+        ]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_index: Optional[PrefixIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> PrefixIndex:
+    """
+    Индекс процесса, пересобирается, когда старше USER_SEARCH_INDEX_TTL_SECONDS.
+    """
+    global _index
+    with _index_lock:
+        if _index is None or time.monotonic() - _index.built > settings.USER_SEARCH_INDEX_TTL_SECONDS:
+            _index = PrefixIndex.build()
+        return _index
+
+
+def reset_index() -> None:
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def add_to_index(user: User) -> None:
+    """
+    Добавить нового пользователя в уже загруженный индекс процесса.
+    """
+    index = _index
+    if index is not None:
+        index.add(user.id, user.username)
+
+
+def search_users(prefix: str, limit: Optional[int] = None) -> List[dict]:
+    """
+    До limit пользователей, чей username начинается с prefix без учёта регистра.
+    """
+    limit = clamp_search_limit(limit)
+    if settings.USER_SEARCH_MEMORY_INDEX:
+        return get_index().search(prefix, limit)
+    return list(search_queryset(prefix, limit))
+
+
+async def asearch_users(prefix: str, limit: Optional[int] = None) -> List[dict]:
+    limit = clamp_search_limit(limit)
+    if settings.USER_SEARCH_MEMORY_INDEX:
+        # индекс может собираться из бд
+        return await sync_to_async(search_users)(prefix, limit)
+    return [row async for row in search_queryset(prefix, limit)]
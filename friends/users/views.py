@@ -1,36 +1,62 @@
 from typing import List, Optional
 from uuid import UUID
 
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
-from ninja import Router
+from ninja import Query, Router
 
 from .models import User
-from .schemas import UserSchema
+from .schemas import UserSchema, UserPageSchema, USER_EXPORT_FIELDS
+from .search import search_users
 from auth.schemas import Message
+from friends.conditional import check_etag
+from friends.rendering import trusted_response
+from friends.export import export_format, stream_export
+from friends.pagination import paginate
 
 
 user = Router(tags=["user"])
 
 
-@user.get('', response=List[UserSchema])
-def get_all_users(request):
+@user.get('', response={200: UserPageSchema, 400: Message})
+def get_all_users(request, response: HttpResponse, cursor: str = None, limit: int = None):
     """
-    Получить всех зарегистрированных пользователей
+    Получить зарегистрированных пользователей постранично.
+    С Accept: application/x-ndjson или text/csv отдаёт всех пользователей потоком, без страниц.
     """
-    return User.objects.all()
+    media_type = export_format(request)
+    if media_type is not None:
+        return stream_export(User.objects.order_by('date_created', 'id'), USER_EXPORT_FIELDS, media_type)
+    rows, next_cursor = paginate(
+        User.objects.values('id', 'username', 'date_created'), ('date_created', 'id'), cursor, limit
+    )
+    users = [{'id': row['id'], 'username': row['username']} for row in rows]
+    return trusted_response(request, response, {"items": users, "next_cursor": next_cursor})
+
+
+@user.get('/search', response={200: List[UserSchema], 422: Message})
+def search_users_by_prefix(request, response: HttpResponse, q: str = Query(..., min_length=1, max_length=24),
+                           limit: int = None):
+    """
+    Найти пользователей, чей username начинается с q, без учёта регистра.
+    Точное совпадение идёт первым, дальше по алфавиту.
+    """
+    return trusted_response(request, response, search_users(q, limit))
 
 
 @user.get('/{username}', response={200: Optional[UserSchema], 404: Message})
-def get_specific_user_by_nickname(request, username: str):
+def get_specific_user_by_nickname(request, response: HttpResponse, username: str):
     """
     Получить конкретного пользователя по username
     """
-    return get_object_or_404(User, username=username)
+    found = get_object_or_404(User, username=username)
+    return check_etag(request, response, found.id, found.username) or found
 
 
 @user.get('/id/{user_id}', response={200: Optional[UserSchema], 404: Message})
-def get_specific_user_by_id(request, user_id: UUID):
+def get_specific_user_by_id(request, response: HttpResponse, user_id: UUID):
     """
     Получить конкретного пользователя по uuid
     """
-    return get_object_or_404(User, id=user_id)
+    found = get_object_or_404(User, id=user_id)
+    return check_etag(request, response, found.id, found.username) or found